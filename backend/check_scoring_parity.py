@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Parity check between the compatibility scorers.
+Scores sampled users against every stored feature row with the SQL
+expression, the vectorized Python scorer and compute_compatibility_score,
+and reports any pair where they disagree. Run after changing a scorer.
+"""
+
+import sys
+import random
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db import DATABASE_URL
+from models import User, UserFeatures
+from utils.batch_scoring import batch_compatibility_scores
+from utils.feature_store import FEATURE_COLUMNS, feature_batch_from_rows, load_user_features
+from utils.match_utils import compute_compatibility_score
+from utils.sql_scoring import sql_compatibility_score
+
+SAMPLE_USERS = 20
+# Pairs per sampled user also checked against the scalar reference scorer
+SCALAR_PAIRS = 50
+
+def check_parity(db, sample_users=SAMPLE_USERS, seed=0):
+    """Compare the scorers for sampled users. Returns the number of mismatching pairs."""
+    rng = random.Random(seed)
+    user_ids = [row.user_id for row in db.query(UserFeatures.user_id).all()]
+    candidates = feature_batch_from_rows(db.query(*FEATURE_COLUMNS).order_by(UserFeatures.user_id).all())
+
+    mismatches = 0
+    checked = 0
+    for user_id in rng.sample(user_ids, min(sample_users, len(user_ids))):
+        user = db.query(User).filter(User.id == user_id).first()
+        features = load_user_features(db, user)
+
+        python_scores = dict(zip(
+            candidates.ids.tolist(),
+            batch_compatibility_scores(features, candidates).tolist()
+        ))
+        sql_scores = dict(db.query(
+            UserFeatures.user_id, sql_compatibility_score(features)
+        ).all())
+
+        for other_id, score in python_scores.items():
+            checked += 1
+            if sql_scores.get(other_id) != score:
+                mismatches += 1
+                print(f"✗ {user_id} <-> {other_id}: python={score} sql={sql_scores.get(other_id)}")
+
+        for other_id in rng.sample(list(python_scores), min(SCALAR_PAIRS, len(python_scores))):
+            other = db.query(User).filter(User.id == other_id).first()
+            reference = compute_compatibility_score.__wrapped__(user, other)
+            if reference != python_scores[other_id]:
+                mismatches += 1
+                print(f"✗ {user_id} <-> {other_id}: reference={reference} python={python_scores[other_id]}")
+
+    print(f"Checked {checked} pairs, {mismatches} mismatches")
+    return mismatches
+
+if __name__ == "__main__":
+    engine = create_engine(DATABASE_URL)
+    db = sessionmaker(bind=engine)()
+    try:
+        mismatches = check_parity(db)
+    finally:
+        db.close()
+    sys.exit(0 if mismatches == 0 else 1)
@@ -1,15 +1,36 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
-from db import get_db, engine
+from sqlalchemy import func
+from db import get_db, engine, SessionLocal, ASYNC_DB, AsyncSessionLocal, async_engine
 from models import User, RoommateMatch, MatchStatus, Base, UserPreferences
-from schemas import UserCreate, UserLogin, UserResponse, Token, UserOnboarding, UserProfileUpdate, PreferencesUpdate
-from utils.auth_utils import hash_password, verify_password, create_access_token, decode_access_token
-from utils.match_utils import compute_compatibility_score, update_matches, update_user_preferences
-from utils.optimized_queries import get_potential_roommates_optimized, get_matches_optimized, get_user_profile_optimized
-import jwt
+from schemas import UserCreate, UserLogin, UserResponse, Token, UserOnboarding, UserProfileUpdate, PreferencesUpdate, SwipeBatch, RoommateCard, RoommateFeedPage, MatchCard, MatchChanges, UserProfile, OwnProfile
+from utils.auth_utils import create_access_token
+from utils.password_hasher import PasswordHashingUnavailable, hash_password_offloaded, hash_password_offloaded_async, verify_password_offloaded, verify_and_update_password_offloaded_async, start_password_hasher, stop_password_hasher
+from utils.current_user import get_current_user, get_current_user_id, get_current_user_record, install_current_user_invalidation
+from utils.match_utils import compute_compatibility_score, update_matches, get_match, match_side, upsert_like, upsert_likes, upsert_rejection, upsert_rejections
+from utils.batch_scoring import batch_compatibility_scores
+from utils.cache_utils import cache_compatibility_scores, get_cached_compatibility_scores
+from utils.optimized_queries import get_potential_roommates_optimized, get_potential_roommates_page, get_matches_optimized, get_match_changes, get_user_profile_optimized, rebuild_user_feed, refresh_candidate_in_feeds
+from utils.feed_store import remove_feed_entries
+from utils.serializers import json_response, own_profile
+from utils.etags import etag_matches, get_user_versions, make_etag, matches_etag, not_modified, profile_etag, with_etag
+from utils.exclusion_cache import record_swipes
+from utils.feature_store import encode_users_with_codes, sync_user_features
+from utils.cache_invalidation import install_cache_invalidation
+from utils.personalization import install_preference_invalidation
+from utils.job_queue import MatchRefreshQueue, claim_pending_refreshes, save_pending_refreshes
+from utils.candidate_pool import start_candidate_pools, stop_candidate_pools
+from utils.preference_aggregator import record_swipe_events, start_preference_aggregator, stop_preference_aggregator, swipes_recorded
+from routes.async_reads import router as async_reads_router
+import os
+import logging
 from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -32,152 +53,240 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses above GZIP_MINIMUM_SIZE bytes for clients that accept it
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MINIMUM_SIZE", "1000")))
+
 # Create the tables if they don't exist
 Base.metadata.create_all(bind=engine)
 
+# Drop cached compatibility scores whenever a user's scoring columns change
+install_cache_invalidation(SessionLocal)
+if AsyncSessionLocal is not None:
+    install_cache_invalidation(AsyncSessionLocal)
+# Drop cached preference weights whenever a user's preferences change
+install_preference_invalidation(SessionLocal)
+# Drop cached current-user records whenever a user row changes
+install_current_user_invalidation(SessionLocal)
+
+# With ASYNC_DB=1 the read endpoints run on the event loop over asyncpg.
+# Included before the handlers below so it takes precedence over the sync
+# versions of the same paths, which serve them with ASYNC_DB=0.
+if ASYNC_DB:
+    app.include_router(async_reads_router)
+
+@app.on_event("shutdown")
+async def shutdown_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+
+def refresh_matches(user_id: int) -> None:
+    """
+    Background job: recompute a user's stored match scores, rebuild their
+    feed and re-place them in everyone else's feed, in its own session.
+    """
+    db = SessionLocal()
+    try:
+        update_matches(user_id, db, limit=0)
+        rebuild_user_feed(user_id, db)
+        refresh_candidate_in_feeds(user_id, db)
+    finally:
+        db.close()
+
+# Match score recomputation runs off the request path
+match_refresh_queue = MatchRefreshQueue(refresh_matches, max_workers=2)
+# Seconds a shutting-down worker waits for queued refreshes; the rest are
+# saved and picked up by the next worker to start
+MATCH_REFRESH_DRAIN_TIMEOUT = float(os.getenv("MATCH_REFRESH_DRAIN_TIMEOUT", "10"))
+
+@app.on_event("startup")
+def resume_match_refreshes():
+    db = SessionLocal()
+    try:
+        for user_id in claim_pending_refreshes(db):
+            match_refresh_queue.enqueue(user_id)
+    except Exception:
+        logger.exception("Could not resume saved match refreshes")
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+def shutdown_match_refresh_queue():
+    pending = match_refresh_queue.shutdown(timeout=MATCH_REFRESH_DRAIN_TIMEOUT)
+    if not pending:
+        return
+    db = SessionLocal()
+    try:
+        save_pending_refreshes(db, pending)
+        logger.info(f"Saved {len(pending)} unfinished match refreshes")
+    except Exception:
+        logger.exception(f"Could not save {len(pending)} unfinished match refreshes")
+    finally:
+        db.close()
+
+# Per-worker in-memory candidate pools for feed and match scoring
+CANDIDATE_POOLS_ENABLED = os.getenv("CANDIDATE_POOLS", "1") == "1"
+
+@app.on_event("startup")
+def startup_candidate_pools():
+    if CANDIDATE_POOLS_ENABLED:
+        try:
+            start_candidate_pools(SessionLocal)
+        except Exception:
+            # Scoring falls back to reading candidates from the database
+            logger.exception("Candidate pools unavailable, scoring from the database")
+
+@app.on_event("shutdown")
+def shutdown_candidate_pools():
+    stop_candidate_pools()
+
+# Swipes are logged per request and folded into user_preferences in bulk
+@app.on_event("startup")
+def startup_preference_aggregator():
+    start_preference_aggregator(SessionLocal)
+
+@app.on_event("shutdown")
+def shutdown_preference_aggregator():
+    stop_preference_aggregator()
+
+# Password hashing runs in a bounded process pool, off the request threads
+@app.on_event("startup")
+def startup_password_hasher():
+    start_password_hasher()
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    stop_password_hasher()
+
 @app.get("/")
 def home():
     return {"message": "Welcome to Roommate Finder!"}
 
-@app.get("/potential_roommates")
+@app.get("/potential_roommates", response_model=List[RoommateCard])
 def get_potential_roommates(
     offset: int = 0,
     limit: int = 10,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
-    Authorization: str = Header(None)
+    current_user_id: int = Depends(get_current_user_id)
 ):
-    # Validate the token and get the current user's ID
-    if not Authorization or not Authorization.startswith("Bearer "):
+    if offset < 0:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="offset must not be negative"
         )
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-        current_user_id = payload.get("user_id")
-    except Exception:
+    if limit < 1 or limit > 100:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit must be between 1 and 100"
         )
 
-    # Use optimized query function
-    return get_potential_roommates_optimized(
-        current_user_id=current_user_id,
-        offset=offset,
-        limit=limit,
-        db=db
-    )
-
+    # Use optimized query function; engine picks the "python" or "sql" scorer
+    try:
+        return json_response(get_potential_roommates_optimized(
+            current_user_id=current_user_id,
+            offset=offset,
+            limit=limit,
+            db=db,
+            engine=engine,
+            fields=fields
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
 
-@app.post("/like/{roommate_id}")
-def like_roommate(
-    roommate_id: int,
-    Authorization: str = Header(None),
-    db: Session = Depends(get_db)
+@app.get("/potential_roommates/feed", response_model=RoommateFeedPage)
+def get_potential_roommates_feed(
+    cursor: Optional[str] = None,
+    limit: int = 10,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
-    if not Authorization or not Authorization.startswith("Bearer "):
+    """
+    Cursor-paginated feed. Pass the returned next_cursor to get the
+    following page; next_cursor is null on the last page. engine
+    ("python" or "sql") picks the scorer for any live ranking. fields
+    is a comma-separated list of the card fields to return.
+    """
+    if limit < 1 or limit > 100:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit must be between 1 and 100"
         )
 
-    token = Authorization.split("Bearer ")[1]
     try:
-        payload = decode_access_token(token)
-        user_id = payload.get("user_id")
-    except Exception:
+        return json_response(get_potential_roommates_page(
+            current_user_id=current_user_id,
+            cursor=cursor,
+            limit=limit,
+            db=db,
+            engine=engine,
+            fields=fields
+        ))
+    except ValueError as e:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
 
+
+@app.post("/like/{roommate_id}")
+def like_roommate(
+    roommate_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
     # Debug log the like action
     print(f"User {user_id} is liking roommate {roommate_id}")
 
-    # Check if roommate exists
-    roommate = db.query(User).filter(User.id == roommate_id).first()
+    # Load the liker and the roommate in one query
+    users_by_id = {
+        user.id: user
+        for user in db.query(User).filter(User.id.in_([user_id, roommate_id])).all()
+    }
+    roommate = users_by_id.get(roommate_id)
     if not roommate:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Roommate not found"
         )
-
-    # Check if match already exists
-    existing_match = db.query(RoommateMatch).filter(
-        or_(
-            and_(RoommateMatch.user1_id == user_id, RoommateMatch.user2_id == roommate_id),
-            and_(RoommateMatch.user1_id == roommate_id, RoommateMatch.user2_id == user_id)
+    current_user = users_by_id.get(user_id)
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
         )
-    ).first()
 
-    is_match = False
-    if existing_match:
-        # Debug log the existing match
-        print(f"Found existing match record: user1={existing_match.user1_id}, user2={existing_match.user2_id}, status={existing_match.match_status.value}")
-        print(f"Current likes status: user1_liked={existing_match.user1_liked}, user2_liked={existing_match.user2_liked}")
-        
-        # Update existing match
-        if existing_match.user1_id == user_id:
-            existing_match.user1_liked = True
-            if existing_match.user2_liked:
-                existing_match.match_status = MatchStatus.matched
-                is_match = True
-                print(f"It's a match! Both users liked each other.")
-            else:
-                print(f"User {user_id} liked user {roommate_id}, waiting for them to like back")
-        else:
-            existing_match.user2_liked = True
-            if existing_match.user1_liked:
-                existing_match.match_status = MatchStatus.matched
-                is_match = True
-                print(f"It's a match! Both users liked each other.")
-            else:
-                print(f"User {user_id} liked user {roommate_id}, waiting for them to like back")
+    # Create or update the pair's match row in one statement; user1_id is
+    # always the lower ID, so the row is found through the unique pair index
+    compatibility_score = compute_compatibility_score(current_user, roommate)
+    is_match = upsert_like(db, user_id, roommate_id, compatibility_score)
+    if is_match:
+        print(f"It's a match! Both users liked each other.")
     else:
-        # Create new match
-        new_match = RoommateMatch(
-            user1_id=user_id,
-            user2_id=roommate_id,
-            compatibility_score=compute_compatibility_score(
-                db.query(User).filter(User.id == user_id).first(),
-                roommate
-            ),
-            match_status=MatchStatus.pending,
-            user1_liked=True
-        )
-        db.add(new_match)
-        print(f"Created new match record: user1={user_id}, user2={roommate_id}, status=pending")
+        print(f"User {user_id} liked user {roommate_id}, waiting for them to like back")
+
+    # A liked user leaves the liker's feed; a mutual match leaves both feeds
+    remove_feed_entries(db, [(user_id, roommate_id), (roommate_id, user_id)] if is_match else [(user_id, roommate_id)])
 
-    # Update the user preferences based on this like
-    update_user_preferences(user_id, roommate_id, liked=True, db=db)
+    # Log the swipe; preference learning is applied in bulk by the aggregator
+    record_swipe_events(db, user_id, [(roommate_id, True)])
 
     db.commit()
+    record_swipes(db, [(user_id, roommate_id)])
+    swipes_recorded(1)
     return {"message": "Roommate liked successfully", "is_match": is_match}
 
 @app.post("/reject/{roommate_id}")
 def reject_roommate(
     roommate_id: int,
-    Authorization: str = Header(None),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-        user_id = payload.get("user_id")
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
     # Check if roommate exists
     roommate = db.query(User).filter(User.id == roommate_id).first()
     if not roommate:
@@ -186,68 +295,29 @@ def reject_roommate(
             detail="Roommate not found"
         )
 
-    # Check if match already exists
-    existing_match = db.query(RoommateMatch).filter(
-        or_(
-            and_(RoommateMatch.user1_id == user_id, RoommateMatch.user2_id == roommate_id),
-            and_(RoommateMatch.user1_id == roommate_id, RoommateMatch.user2_id == user_id)
-        )
-    ).first()
+    # Create or update the pair's match row as rejected in one statement
+    upsert_rejection(db, user_id, roommate_id)
+    remove_feed_entries(db, [(user_id, roommate_id), (roommate_id, user_id)])
 
-    if existing_match:
-        # Update existing match status to rejected
-        existing_match.match_status = MatchStatus.rejected
-        # Set the rejection timestamp for cooldown period
-        existing_match.rejected_at = func.now()
-    else:
-        # Create new rejected match
-        new_match = RoommateMatch(
-            user1_id=user_id,
-            user2_id=roommate_id,
-            compatibility_score=0,
-            match_status=MatchStatus.rejected,
-            rejected_at=func.now()  # Set the rejection timestamp
-        )
-        db.add(new_match)
-
-    # Update the user preferences based on this rejection
-    update_user_preferences(user_id, roommate_id, liked=False, db=db)
+    # Log the swipe; preference learning is applied in bulk by the aggregator
+    record_swipe_events(db, user_id, [(roommate_id, False)])
 
     db.commit()
+    record_swipes(db, [(user_id, roommate_id)])
+    swipes_recorded(1)
     return {"message": "Roommate rejected successfully"}
 
 @app.post("/unmatch/{roommate_id}")
 def unmatch_roommate(
     roommate_id: int,
-    Authorization: str = Header(None),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-        user_id = payload.get("user_id")
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
     # Debug log the unmatch action
     print(f"User {user_id} is unmatching from roommate {roommate_id}")
 
     # Check if match exists
-    existing_match = db.query(RoommateMatch).filter(
-        or_(
-            and_(RoommateMatch.user1_id == user_id, RoommateMatch.user2_id == roommate_id),
-            and_(RoommateMatch.user1_id == roommate_id, RoommateMatch.user2_id == user_id)
-        )
-    ).first()
+    existing_match = get_match(db, user_id, roommate_id, for_update=True)
 
     if not existing_match:
         print(f"No match record found between users {user_id} and {roommate_id}")
@@ -273,180 +343,307 @@ def unmatch_roommate(
     existing_match.rejected_at = func.now()  # Set rejection timestamp for cooldown
 
     # Reset the likes to allow potential future matching after cooldown
-    if existing_match.user1_id == user_id:
-        existing_match.user1_liked = False
-        print(f"User {user_id} (user1) is unmatching from user {roommate_id} (user2)")
-    else:
-        existing_match.user2_liked = False
-        print(f"User {user_id} (user2) is unmatching from user {roommate_id} (user1)")
+    side, other_side = match_side(user_id, roommate_id)
+    setattr(existing_match, f"{side}_liked", False)
+    setattr(existing_match, f"{side}_rejected", True)
+    print(f"User {user_id} ({side}) is unmatching from user {roommate_id} ({other_side})")
 
     print(f"Updated match status to rejected, it will re-appear after the cooldown period")
+    remove_feed_entries(db, [(user_id, roommate_id), (roommate_id, user_id)])
 
     db.commit()
+    record_swipes(db, [(user_id, roommate_id)])
     return {"message": "Successfully unmatched"}
 
-@app.get("/matches")
+# Largest number of decisions accepted by one /swipes request
+MAX_SWIPES_PER_BATCH = 100
+
+@app.post("/swipes")
+def batch_swipes(
+    batch: SwipeBatch,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Apply an ordered list of like/reject decisions in one transaction.
+    Each decision has the same effect as the matching /like or /reject
+    call made in order. Returns the mutual matches the batch created.
+    """
+    if len(batch.swipes) > MAX_SWIPES_PER_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_SWIPES_PER_BATCH} swipes per request"
+        )
+    if any(swipe.roommate_id == user_id for swipe in batch.swipes):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot swipe on yourself"
+        )
+    if not batch.swipes:
+        return {"message": "No swipes to process", "processed": 0, "matches": []}
+
+    # Load the swiper and every swiped user in one query
+    roommate_ids = {swipe.roommate_id for swipe in batch.swipes}
+    users_by_id = {
+        user.id: user
+        for user in db.query(User).filter(User.id.in_(roommate_ids | {user_id})).all()
+    }
+    missing = sorted(roommate_ids - set(users_by_id))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Roommates not found: {missing}"
+        )
+    current_user = users_by_id.get(user_id)
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    # Like scores for every liked user: cached ones in one batch read, the
+    # rest in one vectorized pass, cached in one batch write
+    liked_users = [users_by_id[roommate_id] for roommate_id in
+                   {swipe.roommate_id for swipe in batch.swipes if swipe.action == "like"}]
+    scores = {}
+    if liked_users:
+        cached = get_cached_compatibility_scores(user_id, [user.id for user in liked_users])
+        scores = {user.id: score for user, score in zip(liked_users, cached) if score is not None}
+        uncached = [user for user in liked_users if user.id not in scores]
+        if uncached:
+            computed = dict(zip(
+                [user.id for user in uncached],
+                batch_compatibility_scores(
+                    encode_users_with_codes(db, [current_user]).row(0), encode_users_with_codes(db, uncached)
+                ).tolist()
+            ))
+            cache_compatibility_scores(user_id, computed)
+            scores.update(computed)
+
+    # A pair's row can only be written once per statement, so decisions go
+    # out in rounds: round n holds each roommate's n-th decision
+    rounds = []
+    seen = {}
+    for swipe in batch.swipes:
+        round_index = seen.get(swipe.roommate_id, 0)
+        seen[swipe.roommate_id] = round_index + 1
+        if round_index == len(rounds):
+            rounds.append([])
+        rounds[round_index].append(swipe)
+
+    matches = set()
+    for decisions in rounds:
+        rejected = [swipe.roommate_id for swipe in decisions if swipe.action == "reject"]
+        upsert_rejections(db, user_id, rejected)
+        matches -= set(rejected)
+        matches |= upsert_likes(db, user_id, {
+            swipe.roommate_id: scores[swipe.roommate_id]
+            for swipe in decisions if swipe.action == "like"
+        })
+
+    # Liked users leave the swiper's feed; rejections and mutual matches
+    # leave both feeds
+    last_action = {swipe.roommate_id: swipe.action for swipe in batch.swipes}
+    feed_pairs = [(user_id, roommate_id) for roommate_id in roommate_ids]
+    feed_pairs += [(roommate_id, user_id) for roommate_id, action in last_action.items()
+                   if action == "reject" or roommate_id in matches]
+    remove_feed_entries(db, feed_pairs)
+
+    # Log every decision, in order, for the preference aggregator
+    record_swipe_events(db, user_id, [
+        (swipe.roommate_id, swipe.action == "like") for swipe in batch.swipes
+    ])
+
+    db.commit()
+    record_swipes(db, [(user_id, roommate_id) for roommate_id in roommate_ids])
+    swipes_recorded(len(batch.swipes))
+    logger.info(f"User {user_id} swiped on {len(batch.swipes)} roommates, {len(matches)} new matches")
+    return {"message": "Swipes processed successfully", "processed": len(batch.swipes), "matches": sorted(matches)}
+
+@app.get("/matches", response_model=List[MatchCard])
 def get_matches(
+    request: Request,
     include_preferences: bool = False,
-    Authorization: str = Header(None),
+    fields: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    if not Authorization or not Authorization.startswith("Bearer "):
+    # An unchanged match list costs one primary-key read
+    etag = matches_etag(get_user_versions(db, [user_id]), user_id, include_preferences, fields)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    # Use optimized query function
+    try:
+        return with_etag(json_response(get_matches_optimized(
+            current_user_id=user_id,
+            include_preferences=include_preferences,
+            db=db,
+            fields=fields
+        )), etag)
+    except ValueError as e:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
 
-    token = Authorization.split("Bearer ")[1]
+@app.get("/matches/sync", response_model=MatchChanges)
+def sync_matches(
+    since: Optional[str] = None,
+    include_preferences: bool = False,
+    fields: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Delta sync of the match list. Without since, returns every match; pass
+    the returned watermark as since to get only the matches made or changed
+    after it, plus the IDs of users unmatched since then in removed.
+    """
     try:
-        payload = decode_access_token(token)
-        user_id = payload.get("user_id")
-    except Exception:
+        return json_response(get_match_changes(
+            current_user_id=user_id,
+            since=since,
+            include_preferences=include_preferences,
+            db=db,
+            fields=fields
+        ))
+    except ValueError as e:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
 
-    # Use optimized query function
-    return get_matches_optimized(
-        current_user_id=user_id,
-        include_preferences=include_preferences,
-        db=db
+# /register and /login are async so that waiting for the hashing pool
+# holds no threadpool thread; their short database steps below run on
+# the threadpool
+
+def _email_registered(db: Session, email: str) -> bool:
+    registered = db.query(User.id).filter(User.email == email).first() is not None
+    # End the read transaction so its connection goes back to the pool
+    # while the password is hashed
+    db.rollback()
+    return registered
+
+def _create_user(db: Session, user_data: UserCreate, hashed_password: str) -> int:
+    new_user = User(
+        email=user_data.email,
+        hashed_password=hashed_password,
+        fullname = user_data.fullname
     )
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+
+    # Create the (empty) precomputed feature row so the user can be matched
+    sync_user_features(db, new_user)
+    db.commit()
+    return new_user.id
 
 @app.post("/register", response_model=Token)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
+    if await run_in_threadpool(_email_registered, db, user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this email already exists"
         )
     
+    try:
+        hashed_password = await hash_password_offloaded_async(user_data.password)
+    except PasswordHashingUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"}
+        )
+    
     # Create new user
-    new_user = User(
-        email=user_data.email,
-        hashed_password=hash_password(user_data.password),
-        fullname = user_data.fullname
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    user_id = await run_in_threadpool(_create_user, db, user_data, hashed_password)
 
-    user = db.query(User).filter(User.email == user_data.email).first()
+    # Score the new user and add them to other users' feeds in the background
+    match_refresh_queue.enqueue(user_id)
 
-    access_token = create_access_token(data={"user_id": user.id})
+    access_token = create_access_token(data={"user_id": user_id})
     print(f"Access Token stored: {access_token}")
     return {
         "access_token": access_token, 
         "token_type": "bearer"
     }
 
+def _login_credentials(db: Session, email: str) -> Optional[Tuple[int, str]]:
+    row = db.query(User.id, User.hashed_password).filter(User.email == email).first()
+    # End the read transaction so its connection goes back to the pool
+    # while the password is checked
+    db.rollback()
+    return tuple(row) if row else None
+
+def _upgrade_password_hash(db: Session, user_id: int, hashed_password: str, new_hash: str) -> None:
+    # Unless the password changed meanwhile
+    db.query(User).filter(
+        User.id == user_id, User.hashed_password == hashed_password
+    ).update({User.hashed_password: new_hash}, synchronize_session=False)
+    db.commit()
+
 @app.post("/login", response_model=Token)
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     # Check if user exists
-    user = db.query(User).filter(User.email == user_data.email).first()
-    if not user:
+    credentials = await run_in_threadpool(_login_credentials, db, user_data.email)
+    if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
+    user_id, hashed_password = credentials
+
     # Verify password
-    if not verify_password(user_data.password, user.hashed_password):
+    try:
+        valid, new_hash = await verify_and_update_password_offloaded_async(user_data.password, hashed_password)
+    except PasswordHashingUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"}
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
+    if new_hash:
+        # The stored hash uses outdated cost parameters; upgrade it while
+        # the plain password is at hand
+        await run_in_threadpool(_upgrade_password_hash, db, user_id, hashed_password, new_hash)
+
     # Create a single access_token
-    access_token = create_access_token(data={"user_id": user.id})
+    access_token = create_access_token(data={"user_id": user_id})
     print(f"Access Token stored: {access_token}")
     return {
         "access_token": access_token, 
         "token_type": "bearer"
     }
 
-@app.get("/profile")
-def get_profile(Authorization: str = Header(None), db: Session = Depends(get_db)):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-
-    token = Authorization.split("Bearer ")[1]
-    print(f"Access Token stored: {token}")
-
-    try:
-        payload = decode_access_token(token)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        )
-    except jwt.InvalidTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
-
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
-    # Return user information
-    return user
+@app.get("/profile", response_model=OwnProfile)
+def get_profile(
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    versions = get_user_versions(db, [user_id])
+    etag = make_etag("own", user_id, versions[user_id][0]) if user_id in versions else None
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    user = get_current_user(user_id, db)
+    # Return user information, never the password hash
+    return with_etag(json_response(own_profile(user)), etag)
 
 @app.post("/update_profile")
 def update_profile(
     update_data: UserProfileUpdate,
-    Authorization: str = Header(None),
+    user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Validate the token
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        )
-    except jwt.InvalidTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-    
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     # Update profile fields if provided.
     if update_data.fullname is not None:
         user.fullname = update_data.fullname
@@ -473,17 +670,31 @@ def update_profile(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Old password is required to update password"
             )
-        if not verify_password(update_data.old_password, user.hashed_password):
+        try:
+            old_password_valid = verify_password_offloaded(update_data.old_password, user.hashed_password)
+            new_hashed_password = hash_password_offloaded(update_data.new_password) if old_password_valid else None
+        except PasswordHashingUnavailable:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"}
+            )
+        if not old_password_valid:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Old password is incorrect"
             )
-        user.hashed_password = hash_password(update_data.new_password)
+        user.hashed_password = new_hashed_password
     
     db.commit()
     db.refresh(user)
 
-    update_matches(user_id, db)
+    # Keep the precomputed matching features in sync
+    sync_user_features(db, user)
+    db.commit()
+
+    # Recompute match scores in the background
+    match_refresh_queue.enqueue(user.id)
     
     return {"message": "Profile updated successfully"}
 
@@ -491,28 +702,9 @@ def update_profile(
 @app.post("/update_preferences")
 def update_preferences(
     pref_update: PreferencesUpdate,
-    Authorization: str = Header(None),
+    user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Validate token
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing or invalid token")
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    
     # Update preferences if provided
     if pref_update.budget_range is not None:
         user.budget_range = pref_update.budget_range
@@ -552,158 +744,47 @@ def update_preferences(
     db.commit()
     db.refresh(user)
 
-    update_matches(user_id, db)
+    # Keep the precomputed matching features in sync
+    sync_user_features(db, user)
+    db.commit()
+
+    # Recompute match scores in the background
+    match_refresh_queue.enqueue(user.id)
     
     return {"message": "Preferences updated successfully"}
 
 
 @app.get("/auth/profile")
-def get_auth_profile(Authorization: str = Header(None), db: Session = Depends(get_db)):
+def get_auth_profile(user: dict = Depends(get_current_user_record)):
     # This is a duplicate of the /profile endpoint, but with a different URL path
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-
-    token = Authorization.split("Bearer ")[1]
-
-    try:
-        payload = decode_access_token(token)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        )
-    except jwt.InvalidTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
-
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
-    # Return expanded user information including profile picture
-    return {
-        "id": user.id,
-        "email": user.email,
-        "fullname": user.fullname,
-        "profile_picture": user.profile_picture,
-        "instagram": user.instagram,
-        "university": user.university,
-        "age": user.age,
-        "gender": user.gender.value if user.gender else None,
-        "major": user.major,
-        "year_of_study": user.year_of_study,
-        "bio": user.bio
-    }
+    # Return expanded user information including profile picture; the
+    # cached current-user record holds exactly these fields
+    return dict(user)
+
+@app.get("/match_refresh/status")
+def get_match_refresh_status(user_id: int = Depends(get_current_user_id)):
+    # Report the state of this user's most recent match refresh job
+    job_status = match_refresh_queue.status(user_id)
+    if not job_status:
+        return {"user_id": user_id, "state": "idle"}
+    return job_status
 
 @app.get("/verify_token")
-def verify_token(Authorization: str = Header(None)):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-        return {"valid": True, "user_id": payload.get("user_id")}
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
+def verify_token(user_id: int = Depends(get_current_user_id)):
+    return {"valid": True, "user_id": user_id}
 
 @app.get("/get_user_name")
-def get_user_name(Authorization: str = Header(None), db: Session = Depends(get_db)):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-        user_id = payload.get("user_id")
-        if not user_id:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
+def get_user_name(user: dict = Depends(get_current_user_record)):
+    # Split the fullname and get the first name
+    first_name = user["fullname"].split()[0]
+    return {"first_name": first_name}
 
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
-
-        # Split the fullname and get the first name
-        first_name = user.fullname.split()[0]
-        return {"first_name": first_name}
-
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-    
 @app.post("/onboarding")
 def update_onboarding(
     onboarding_data: UserOnboarding,
-    Authorization: str = Header(None),
+    user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Validate and decode the access token
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        )
-    except jwt.InvalidTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-    
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
-
-    # Retrieve the current user
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
     # Update user with provided onboarding data
     update_data = onboarding_data.dict(exclude_unset=True)
     
@@ -722,55 +803,25 @@ def update_onboarding(
     # Commit changes and refresh the user from the database
     db.commit()
     db.refresh(user)
+
+    # Keep the precomputed matching features in sync
+    sync_user_features(db, user)
+    db.commit()
     
     # Debug print the updated user data
     print(f"Updated user: profile_picture={user.profile_picture}, instagram={user.instagram}")
 
-    update_matches(user_id, db)
+    # Recompute match scores in the background
+    match_refresh_queue.enqueue(user.id)
 
     return {"message": "Onboarding data updated successfully"}
 
 @app.post("/auth/update-onboarding")
 def update_onboarding_auth(
     onboarding_data: UserOnboarding,
-    Authorization: str = Header(None),
+    user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Validate and decode the access token
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-    token = Authorization.split("Bearer ")[1]
-    try:
-        payload = decode_access_token(token)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        )
-    except jwt.InvalidTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-    
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
-
-    # Retrieve the current user
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
     # Update user with provided onboarding data
     update_data = onboarding_data.dict(exclude_unset=True)
     
@@ -804,50 +855,46 @@ def update_onboarding_auth(
     db.commit()
     db.refresh(user)
 
+    # Keep the precomputed matching features in sync
+    sync_user_features(db, user)
+    db.commit()
+
     # Debug print the updated user data
     print(f"Updated user: profile_picture={user.profile_picture}, instagram={user.instagram}")
 
-    # Update matches for this user
-    update_matches(user_id, db)
+    # Update matches for this user in the background
+    match_refresh_queue.enqueue(user.id)
 
     return {"message": "Onboarding data updated successfully"}
 
-@app.get("/profile/{user_id}")
+@app.get("/profile/{user_id}", response_model=UserProfile)
 def get_user_profile(
+    request: Request,
     user_id: int,
     include_preferences: bool = False,
-    Authorization: str = Header(None), 
+    fields: Optional[str] = None,
+    current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid token"
-        )
-
-    token = Authorization.split("Bearer ")[1]
-
+    versions = get_user_versions(db, {user_id, current_user_id})
+    etag = profile_etag(versions, user_id, current_user_id, include_preferences, fields)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    # Use optimized query function
     try:
-        payload = decode_access_token(token)
-        current_user_id = payload.get("user_id")
-        if not current_user_id:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
-    except Exception:
+        user_data = get_user_profile_optimized(
+            user_id=user_id,
+            current_user_id=current_user_id,
+            include_preferences=include_preferences,
+            db=db,
+            fields=fields
+        )
+    except ValueError as e:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-
-    # Use optimized query function
-    user_data = get_user_profile_optimized(
-        user_id=user_id,
-        current_user_id=current_user_id,
-        include_preferences=include_preferences,
-        db=db
-    )
     
     if not user_data:
         raise HTTPException(
@@ -855,17 +902,19 @@ def get_user_profile(
             detail="User not found"
         )
     
-    return user_data
+    return with_etag(json_response(user_data), etag)
 
-@app.get("/user/{user_id}")
+@app.get("/user/{user_id}", response_model=UserProfile)
 def get_user_by_id(
+    request: Request,
     user_id: int,
     include_preferences: bool = True,  # Default to true for this endpoint
-    Authorization: str = Header(None), 
+    fields: Optional[str] = None,
+    current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """
     Alias for profile/{user_id} with preferences included by default.
     This endpoint is used by the mobile app for detailed user views.
     """
-    return get_user_profile(user_id, include_preferences, Authorization, db)
\ No newline at end of file
+    return get_user_profile(request, user_id, include_preferences, fields, current_user_id, db)
\ No newline at end of file
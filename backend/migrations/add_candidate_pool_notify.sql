@@ -0,0 +1,29 @@
+-- Change notifications for the in-memory candidate pools
+-- Every committed change to a user's feature row, university or gender
+-- sends the user ID on the candidate_pool channel (see utils/candidate_pool.py).
+
+CREATE OR REPLACE FUNCTION notify_candidate_pool() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'users' THEN
+        PERFORM pg_notify('candidate_pool', NEW.id::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('candidate_pool', OLD.user_id::text);
+    ELSE
+        PERFORM pg_notify('candidate_pool', NEW.user_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_features_candidate_pool_notify ON user_features;
+CREATE TRIGGER user_features_candidate_pool_notify
+    AFTER INSERT OR UPDATE OR DELETE ON user_features
+    FOR EACH ROW EXECUTE FUNCTION notify_candidate_pool();
+
+DROP TRIGGER IF EXISTS users_candidate_pool_notify ON users;
+CREATE TRIGGER users_candidate_pool_notify
+    AFTER UPDATE OF university, gender ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_candidate_pool();
+
+-- Watermark for the polling fallback
+CREATE INDEX IF NOT EXISTS idx_user_features_updated_at ON user_features(updated_at);
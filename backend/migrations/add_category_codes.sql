@@ -0,0 +1,12 @@
+-- Integer codes of the free-form category strings stored in user_features
+-- utils/feature_store.py assigns each new value its CRC32, or the next free
+-- code when another value already holds that one, so codes never collide
+
+CREATE TABLE IF NOT EXISTS category_codes (
+    value VARCHAR PRIMARY KEY,
+    code INTEGER NOT NULL UNIQUE
+);
+
+-- The wildcards utils/batch_scoring.py tests for keep their CRC32 codes
+INSERT INTO category_codes (value, code) VALUES ('any', 1693710260), ('none', 2140143823)
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,9 @@
+-- Partial covering index for the feed's exclusion anti-join
+-- Only pairs with an interaction (a like, a rejection or a match) are
+-- indexed; the score-only pending rows written by update_matches are skipped.
+
+CREATE INDEX IF NOT EXISTS idx_match_exclusion ON roommate_matches(user1_id, user2_id)
+    INCLUDE (match_status, rejected_at, user1_liked, user2_liked)
+    WHERE match_status <> 'pending' OR user1_liked OR user2_liked;
+
+ANALYZE roommate_matches;
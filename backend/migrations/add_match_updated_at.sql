@@ -0,0 +1,64 @@
+-- Change watermark for delta sync of match lists (see get_match_changes in
+-- utils/optimized_queries.py)
+-- updated_at is set whenever a row enters, changes as, or leaves a mutual
+-- match, and when the matched user's displayed profile changes. Pairs that
+-- never matched keep NULL and never show up in a delta.
+
+ALTER TABLE roommate_matches ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION touch_match_updated_at() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NEW;
+    END IF;
+    IF NEW.match_status = 'matched' OR (TG_OP = 'UPDATE' AND OLD.match_status = 'matched') THEN
+        -- clock_timestamp, not now(): as close to the commit as possible
+        NEW.updated_at := clock_timestamp();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION touch_user_matches_updated_at() RETURNS trigger AS $$
+BEGIN
+    UPDATE roommate_matches SET updated_at = clock_timestamp()
+    WHERE (user1_id = NEW.id OR user2_id = NEW.id) AND match_status = 'matched';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS roommate_matches_touch_updated_at ON roommate_matches;
+CREATE TRIGGER roommate_matches_touch_updated_at
+    BEFORE INSERT OR UPDATE ON roommate_matches
+    FOR EACH ROW EXECUTE FUNCTION touch_match_updated_at();
+
+-- Only the columns a matches entry shows
+DROP TRIGGER IF EXISTS users_touch_matches_updated_at ON users;
+CREATE TRIGGER users_touch_matches_updated_at
+    AFTER UPDATE ON users
+    FOR EACH ROW WHEN ((
+        OLD.fullname, OLD.age, OLD.gender, OLD.major, OLD.year_of_study, OLD.bio,
+        OLD.profile_picture, OLD.university, OLD.instagram, OLD.budget_range,
+        OLD.cleanliness_level, OLD.social_preference, OLD.smoking_preference,
+        OLD.drinking_preference, OLD.pet_preference, OLD.music_preference,
+        OLD.guest_policy, OLD.room_type_preference, OLD.religious_preference,
+        OLD.dietary_restrictions, OLD.sleep_time, OLD.wake_time
+    ) IS DISTINCT FROM (
+        NEW.fullname, NEW.age, NEW.gender, NEW.major, NEW.year_of_study, NEW.bio,
+        NEW.profile_picture, NEW.university, NEW.instagram, NEW.budget_range,
+        NEW.cleanliness_level, NEW.social_preference, NEW.smoking_preference,
+        NEW.drinking_preference, NEW.pet_preference, NEW.music_preference,
+        NEW.guest_policy, NEW.room_type_preference, NEW.religious_preference,
+        NEW.dietary_restrictions, NEW.sleep_time, NEW.wake_time
+    ))
+    EXECUTE FUNCTION touch_user_matches_updated_at();
+
+-- Existing matches changed when they were made
+UPDATE roommate_matches SET updated_at = created_at
+WHERE match_status = 'matched' AND updated_at IS NULL;
+
+-- Delta reads: one user's side of the pair, past the watermark
+CREATE INDEX IF NOT EXISTS idx_match_user1_updated ON roommate_matches(user1_id, updated_at) WHERE updated_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_match_user2_updated ON roommate_matches(user2_id, updated_at) WHERE updated_at IS NOT NULL;
+
+ANALYZE roommate_matches;
@@ -0,0 +1,8 @@
+-- Match refreshes left unfinished when a worker shut down
+-- utils/job_queue.py saves them on shutdown and the next worker to start
+-- claims and re-enqueues them
+
+CREATE TABLE IF NOT EXISTS pending_match_refreshes (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
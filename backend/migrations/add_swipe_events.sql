@@ -0,0 +1,14 @@
+-- Swipe event log for write-behind preference learning
+-- Each swipe appends one row; utils/preference_aggregator.py folds the
+-- rows into user_preferences in bulk and deletes them
+
+CREATE TABLE IF NOT EXISTS swipe_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    swiped_user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    liked BOOLEAN NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_swipe_events_user_id ON swipe_events(user_id);
+CREATE INDEX IF NOT EXISTS ix_swipe_events_swiped_user_id ON swipe_events(swiped_user_id);
@@ -0,0 +1,22 @@
+-- Precomputed per-user matching features
+-- One compact row per user, kept in sync by utils/feature_store.py
+
+CREATE TABLE IF NOT EXISTS user_features (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    cleanliness_level INTEGER NOT NULL DEFAULT 0,
+    sleep_minutes SMALLINT NOT NULL DEFAULT 0,
+    wake_minutes SMALLINT NOT NULL DEFAULT 0,
+    age INTEGER NOT NULL DEFAULT 0,
+    budget_range INTEGER NOT NULL DEFAULT 0,
+    gender_code SMALLINT NOT NULL DEFAULT 0,
+    social_code SMALLINT NOT NULL DEFAULT 0,
+    guest_policy_code INTEGER NOT NULL DEFAULT 0,
+    room_type_code INTEGER NOT NULL DEFAULT 0,
+    religious_code INTEGER NOT NULL DEFAULT 0,
+    dietary_code INTEGER NOT NULL DEFAULT 0,
+    lifestyle_flags SMALLINT NOT NULL DEFAULT 0,
+    null_mask INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+ANALYZE user_features;
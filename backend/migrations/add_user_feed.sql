@@ -0,0 +1,21 @@
+-- Materialized per-user ranked feed
+-- Holds each user's top-N candidates, kept up to date by utils/feed_store.py
+
+CREATE TABLE IF NOT EXISTS user_feed (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    candidate_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    compatibility_score DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (user_id, candidate_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_feed_rank ON user_feed(user_id, compatibility_score DESC, candidate_id);
+CREATE INDEX IF NOT EXISTS idx_user_feed_candidate ON user_feed(candidate_id);
+
+CREATE TABLE IF NOT EXISTS user_feed_state (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    built_at TIMESTAMP NOT NULL DEFAULT now(),
+    cutoff_score DOUBLE PRECISION
+);
+
+ANALYZE user_feed;
+ANALYZE user_feed_state;
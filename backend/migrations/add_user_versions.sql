@@ -0,0 +1,95 @@
+-- Per-user version counters for conditional GETs (see utils/etags.py)
+-- Triggers bump them in the writing transaction, including the Core upserts
+-- of utils/match_utils.py that bypass ORM session events.
+
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    profile_version BIGINT NOT NULL DEFAULT 0,
+    matches_version BIGINT NOT NULL DEFAULT 0
+);
+
+-- A user without a row does not exist; utils/etags.py never answers 304 for them
+INSERT INTO user_versions (user_id) SELECT id FROM users ON CONFLICT (user_id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION create_user_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO user_versions (user_id) VALUES (NEW.id) ON CONFLICT (user_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Both triggers lock every row they bump in user_id order first, so two
+-- transactions bumping overlapping rows (partners editing their profiles
+-- at once, a like racing a partner's edit) cannot deadlock
+
+-- A changed user row changes their profile and the match lists showing them
+CREATE OR REPLACE FUNCTION bump_profile_version() RETURNS trigger AS $$
+DECLARE
+    partner_ids INTEGER[];
+BEGIN
+    SELECT array_agg(CASE WHEN m.user1_id = NEW.id THEN m.user2_id ELSE m.user1_id END)
+    INTO partner_ids
+    FROM roommate_matches m
+    WHERE (m.user1_id = NEW.id OR m.user2_id = NEW.id) AND m.match_status = 'matched';
+
+    PERFORM 1 FROM user_versions
+    WHERE user_id = NEW.id OR user_id = ANY(partner_ids)
+    ORDER BY user_id
+    FOR UPDATE;
+
+    UPDATE user_versions SET profile_version = profile_version + 1 WHERE user_id = NEW.id;
+    UPDATE user_versions SET matches_version = matches_version + 1 WHERE user_id = ANY(partner_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A matched pair appearing, changing or disappearing changes both match lists.
+-- Rows of users being deleted are already gone, so they are simply skipped.
+CREATE OR REPLACE FUNCTION bump_matches_version() RETURNS trigger AS $$
+DECLARE
+    pair roommate_matches%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        pair := OLD;
+    ELSE
+        pair := NEW;
+    END IF;
+    PERFORM 1 FROM user_versions
+    WHERE user_id IN (pair.user1_id, pair.user2_id)
+    ORDER BY user_id
+    FOR UPDATE;
+    UPDATE user_versions SET matches_version = matches_version + 1
+    WHERE user_id IN (pair.user1_id, pair.user2_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_create_version ON users;
+CREATE TRIGGER users_create_version
+    AFTER INSERT ON users
+    FOR EACH ROW EXECUTE FUNCTION create_user_version();
+
+DROP TRIGGER IF EXISTS users_bump_version ON users;
+CREATE TRIGGER users_bump_version
+    AFTER UPDATE ON users
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION bump_profile_version();
+
+-- Only matched rows are listed, so score-only pending rows never bump
+DROP TRIGGER IF EXISTS roommate_matches_insert_version ON roommate_matches;
+CREATE TRIGGER roommate_matches_insert_version
+    AFTER INSERT ON roommate_matches
+    FOR EACH ROW WHEN (NEW.match_status = 'matched')
+    EXECUTE FUNCTION bump_matches_version();
+
+DROP TRIGGER IF EXISTS roommate_matches_update_version ON roommate_matches;
+CREATE TRIGGER roommate_matches_update_version
+    AFTER UPDATE ON roommate_matches
+    FOR EACH ROW WHEN ((OLD.match_status = 'matched' OR NEW.match_status = 'matched') AND OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION bump_matches_version();
+
+DROP TRIGGER IF EXISTS roommate_matches_delete_version ON roommate_matches;
+CREATE TRIGGER roommate_matches_delete_version
+    AFTER DELETE ON roommate_matches
+    FOR EACH ROW WHEN (OLD.match_status = 'matched')
+    EXECUTE FUNCTION bump_matches_version();
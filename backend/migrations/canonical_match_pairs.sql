@@ -0,0 +1,72 @@
+-- Canonical ordered user pairs for roommate_matches
+-- Every pair of users gets exactly one row with user1_id < user2_id,
+-- so each match lookup is a single probe of a unique index.
+
+-- Per-side rejection flags
+ALTER TABLE roommate_matches ADD COLUMN IF NOT EXISTS user1_rejected BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE roommate_matches ADD COLUMN IF NOT EXISTS user2_rejected BOOLEAN NOT NULL DEFAULT false;
+
+-- Self-matches are never valid
+DELETE FROM roommate_matches WHERE user1_id = user2_id;
+
+-- Swap rows stored in the wrong order, together with their per-side columns
+UPDATE roommate_matches
+SET user1_id = user2_id,
+    user2_id = user1_id,
+    user1_liked = user2_liked,
+    user2_liked = user1_liked,
+    user1_rejected = user2_rejected,
+    user2_rejected = user1_rejected
+WHERE user1_id > user2_id;
+
+-- Merge duplicate rows for the same pair into the oldest one.
+-- Likes and rejections from either row are kept, and two one-sided likes that
+-- raced into separate rows become a mutual match.
+WITH merged AS (
+    SELECT
+        user1_id,
+        user2_id,
+        MIN(id) AS keep_id,
+        COALESCE(bool_or(user1_liked), false) AS user1_liked,
+        COALESCE(bool_or(user2_liked), false) AS user2_liked,
+        bool_or(user1_rejected) AS user1_rejected,
+        bool_or(user2_rejected) AS user2_rejected,
+        MAX(compatibility_score) AS compatibility_score,
+        MIN(created_at) AS created_at,
+        MAX(rejected_at) AS rejected_at,
+        CASE
+            WHEN bool_or(match_status = 'blocked') THEN 'blocked'
+            WHEN bool_or(match_status = 'rejected') THEN 'rejected'
+            WHEN bool_or(match_status = 'matched')
+                OR (bool_or(user1_liked) AND bool_or(user2_liked)) THEN 'matched'
+            ELSE 'pending'
+        END AS match_status
+    FROM roommate_matches
+    GROUP BY user1_id, user2_id
+    HAVING COUNT(*) > 1
+)
+UPDATE roommate_matches m
+SET user1_liked = merged.user1_liked,
+    user2_liked = merged.user2_liked,
+    user1_rejected = merged.user1_rejected,
+    user2_rejected = merged.user2_rejected,
+    compatibility_score = merged.compatibility_score,
+    created_at = merged.created_at,
+    rejected_at = merged.rejected_at,
+    match_status = merged.match_status::matchstatus
+FROM merged
+WHERE m.id = merged.keep_id;
+
+DELETE FROM roommate_matches m
+USING roommate_matches keep
+WHERE m.user1_id = keep.user1_id
+  AND m.user2_id = keep.user2_id
+  AND m.id > keep.id;
+
+-- One row per pair, enforced by the database
+CREATE UNIQUE INDEX IF NOT EXISTS uq_roommate_matches_pair ON roommate_matches(user1_id, user2_id);
+DROP INDEX IF EXISTS idx_match_users;
+ALTER TABLE roommate_matches DROP CONSTRAINT IF EXISTS ck_roommate_matches_canonical_pair;
+ALTER TABLE roommate_matches ADD CONSTRAINT ck_roommate_matches_canonical_pair CHECK (user1_id < user2_id);
+
+ANALYZE roommate_matches;
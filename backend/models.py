@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Time, func, Index, Enum, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Float, Boolean, DateTime, Time, func, Index, Enum, JSON, CheckConstraint, text
+from sqlalchemy.orm import relationship, backref
 from sqlalchemy.schema import ForeignKey
 from sqlalchemy.orm import declarative_base
 import enum
@@ -110,9 +110,52 @@ class User(Base):
     sent_matches = relationship("RoommateMatch", foreign_keys="RoommateMatch.user1_id", back_populates="user1")
     received_matches = relationship("RoommateMatch", foreign_keys="RoommateMatch.user2_id", back_populates="user2")
 
+class UserFeatures(Base):
+    """
+    Precomputed, compact encoding of the matching-relevant User columns.
+    Kept in sync by utils/feature_store.py whenever a user's profile or
+    preferences are written, and read in bulk by the scoring code.
+    """
+    __tablename__ = "user_features"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    # Numeric encodings (0 when missing, see null_mask)
+    cleanliness_level = Column(Integer, nullable=False, default=0)
+    sleep_minutes = Column(SmallInteger, nullable=False, default=0)  # Minutes after midnight
+    wake_minutes = Column(SmallInteger, nullable=False, default=0)
+    age = Column(Integer, nullable=False, default=0)
+    budget_range = Column(Integer, nullable=False, default=0)
+
+    # Category IDs (enum ordinals, or category_codes codes for free-form strings)
+    gender_code = Column(SmallInteger, nullable=False, default=0)
+    social_code = Column(SmallInteger, nullable=False, default=0)
+    guest_policy_code = Column(Integer, nullable=False, default=0)
+    room_type_code = Column(Integer, nullable=False, default=0)
+    religious_code = Column(Integer, nullable=False, default=0)
+    dietary_code = Column(Integer, nullable=False, default=0)
+
+    # Boolean preferences packed as bits (smoking, drinking, pet, music)
+    lifestyle_flags = Column(SmallInteger, nullable=False, default=0)
+
+    # One bit per feature, set when the underlying User column is missing
+    null_mask = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    # Relationship
+    user = relationship("User", backref=backref("features", uselist=False, passive_deletes=True))
+
+    __table_args__ = (
+        # Watermark for the candidate pools' polling refresh
+        Index('idx_user_features_updated_at', 'updated_at'),
+    )
+
 class RoommateMatch(Base):
     __tablename__ = "roommate_matches"
     
+    # Each pair of users has exactly one row, stored in canonical order:
+    # user1_id is always the lower ID (see utils.match_utils.canonical_pair)
     id = Column(Integer, primary_key=True, index=True)
     user1_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     user2_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -122,10 +165,16 @@ class RoommateMatch(Base):
     # Track only essential user interactions
     user1_liked = Column(Boolean, default=False)
     user2_liked = Column(Boolean, default=False)
+    user1_rejected = Column(Boolean, nullable=False, default=False, server_default="false")
+    user2_rejected = Column(Boolean, nullable=False, default=False, server_default="false")
     
     # Track timestamps for match lifecycle
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     rejected_at = Column(DateTime, nullable=True)  # When the match was rejected, for cooldown implementation
+    # Last time the row entered, changed as, or left a mutual match (or the
+    # matched user's displayed profile changed); NULL for pairs that never
+    # matched. Set by triggers, see migrations/add_match_updated_at.sql
+    updated_at = Column(DateTime, nullable=True)
     
     # Relationships
     user1 = relationship("User", foreign_keys=[user1_id], back_populates="sent_matches")
@@ -134,10 +183,83 @@ class RoommateMatch(Base):
     # Add composite indexes for common query patterns
     __table_args__ = (
         Index('idx_match_status_score', 'match_status', 'compatibility_score'),
-        Index('idx_match_users', 'user1_id', 'user2_id'),
+        Index('uq_roommate_matches_pair', 'user1_id', 'user2_id', unique=True),
+        CheckConstraint('user1_id < user2_id', name='ck_roommate_matches_canonical_pair'),
         Index('idx_match_cooldown', 'rejected_at'),
+        # Pairs with any interaction, for the feed's exclusion anti-join; leaves
+        # out the score-only pending rows, which are the bulk of the table
+        Index(
+            'idx_match_exclusion', 'user1_id', 'user2_id',
+            postgresql_include=['match_status', 'rejected_at', 'user1_liked', 'user2_liked'],
+            postgresql_where=text("match_status <> 'pending' OR user1_liked OR user2_liked"),
+        ),
+        # Delta sync of one user's match list past a watermark
+        Index('idx_match_user1_updated', 'user1_id', 'updated_at', postgresql_where=text("updated_at IS NOT NULL")),
+        Index('idx_match_user2_updated', 'user2_id', 'updated_at', postgresql_where=text("updated_at IS NOT NULL")),
+    )
+
+class UserFeed(Base):
+    __tablename__ = "user_feed"
+
+    # Materialized top-N of a user's feed, maintained by utils/feed_store.py
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    compatibility_score = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # Feed order: score descending, then candidate ID ascending
+        Index('idx_user_feed_rank', 'user_id', compatibility_score.desc(), 'candidate_id'),
+        Index('idx_user_feed_candidate', 'candidate_id'),
     )
 
+class UserFeedState(Base):
+    __tablename__ = "user_feed_state"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    built_at = Column(DateTime, server_default=func.now(), nullable=False)
+    # Set when more candidates were eligible than the feed holds: the feed
+    # then contains exactly the eligible candidates scoring above it
+    cutoff_score = Column(Float, nullable=True)
+
+class UserVersion(Base):
+    __tablename__ = "user_versions"
+
+    # Per-user change counters behind the ETags of utils/etags.py, bumped
+    # by triggers (migrations/add_user_versions.sql) in the writing
+    # transaction, so every write path and every worker sees them
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Any change to the user's row
+    profile_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # Any change to the user's matches or to a matched user's row
+    matches_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+class SwipeEvent(Base):
+    __tablename__ = "swipe_events"
+
+    # Append-only log of swipes, folded into user_preferences in bulk by
+    # utils/preference_aggregator.py and deleted once applied
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    swiped_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    liked = Column(Boolean, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class CategoryCode(Base):
+    __tablename__ = "category_codes"
+
+    # Integer codes of the free-form category strings stored in
+    # user_features; see feature_store.ensure_category_codes
+    value = Column(String, primary_key=True)
+    code = Column(Integer, nullable=False, unique=True)
+
+class PendingMatchRefresh(Base):
+    __tablename__ = "pending_match_refreshes"
+
+    # Match refreshes a worker shut down before finishing; the next worker
+    # to start re-enqueues them (utils/job_queue.py)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
 """
 class Favorite(Base):
     __tablename__ = "favorites"
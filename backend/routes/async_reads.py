@@ -0,0 +1,137 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
+from schemas import RoommateCard, RoommateFeedPage, MatchCard, MatchChanges
+from utils.current_user import get_current_user_id
+from utils.serializers import json_response
+from utils.etags import etag_matches, get_user_versions_async, matches_etag, not_modified, with_etag
+from utils.optimized_queries import get_potential_roommates_optimized_async, get_potential_roommates_page_async, get_matches_optimized_async, get_match_changes_async
+from typing import List, Optional
+
+# Async versions of the read endpoints, served on the event loop over
+# asyncpg. main.py includes this router when ASYNC_DB=1, ahead of its own
+# sync handlers for the same paths.
+router = APIRouter()
+
+@router.get("/potential_roommates", response_model=List[RoommateCard])
+async def get_potential_roommates(
+    offset: int = 0,
+    limit: int = 10,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    if offset < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="offset must not be negative"
+        )
+    if limit < 1 or limit > 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit must be between 1 and 100"
+        )
+
+    try:
+        return json_response(await get_potential_roommates_optimized_async(
+            current_user_id=current_user_id,
+            offset=offset,
+            limit=limit,
+            db=db,
+            engine=engine,
+            fields=fields
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/potential_roommates/feed", response_model=RoommateFeedPage)
+async def get_potential_roommates_feed(
+    cursor: Optional[str] = None,
+    limit: int = 10,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Cursor-paginated feed. Pass the returned next_cursor to get the
+    following page; next_cursor is null on the last page. engine
+    ("python" or "sql") picks the scorer for any live ranking. fields
+    is a comma-separated list of the card fields to return.
+    """
+    if limit < 1 or limit > 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="limit must be between 1 and 100"
+        )
+
+    try:
+        return json_response(await get_potential_roommates_page_async(
+            current_user_id=current_user_id,
+            cursor=cursor,
+            limit=limit,
+            db=db,
+            engine=engine,
+            fields=fields
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/matches", response_model=List[MatchCard])
+async def get_matches(
+    request: Request,
+    include_preferences: bool = False,
+    fields: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    etag = matches_etag(await get_user_versions_async(db, [user_id]), user_id, include_preferences, fields)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    try:
+        return with_etag(json_response(await get_matches_optimized_async(
+            current_user_id=user_id,
+            include_preferences=include_preferences,
+            db=db,
+            fields=fields
+        )), etag)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/matches/sync", response_model=MatchChanges)
+async def sync_matches(
+    since: Optional[str] = None,
+    include_preferences: bool = False,
+    fields: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Delta sync of the match list. Without since, returns every match; pass
+    the returned watermark as since to get only the matches made or changed
+    after it, plus the IDs of users unmatched since then in removed.
+    """
+    try:
+        return json_response(await get_match_changes_async(
+            current_user_id=user_id,
+            since=since,
+            include_preferences=include_preferences,
+            db=db,
+            fields=fields
+        ))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
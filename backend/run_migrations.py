@@ -1,17 +1,102 @@
 #!/usr/bin/env python3
 """
-Database migration script to add performance indexes.
+Database migration script to add performance indexes and supporting tables.
 Run this script to optimize database performance.
 """
 
 import os
+import re
 import sys
 import psycopg2
 from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
 from db import DATABASE_URL
 
+# Migration files, applied in order. Every statement must be idempotent.
+MIGRATIONS = [
+    'add_performance_indexes.sql',
+    'add_user_features.sql',
+    'canonical_match_pairs.sql',
+    'add_user_feed.sql',
+    'add_match_exclusion_index.sql',
+    'add_candidate_pool_notify.sql',
+    'add_swipe_events.sql',
+    'add_user_versions.sql',
+    'add_match_updated_at.sql',
+    'add_pending_match_refreshes.sql',
+    'add_category_codes.sql',
+]
+
+def split_sql_statements(sql):
+    """
+    Split a SQL script on semicolons, keeping dollar-quoted bodies
+    (e.g. $$ ... $$ in CREATE FUNCTION) and -- comments intact.
+    """
+    statements = []
+    current = []
+    i = 0
+    while i < len(sql):
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            end = len(sql) if end == -1 else end
+            current.append(sql[i:end])
+            i = end
+            continue
+        match = re.match(r'\$[A-Za-z_]*\$', sql[i:])
+        if match:
+            tag = match.group(0)
+            end = sql.find(tag, i + len(tag))
+            end = len(sql) if end == -1 else end + len(tag)
+            current.append(sql[i:end])
+            i = end
+            continue
+        if sql[i] == ';':
+            statements.append(''.join(current))
+            current = []
+        else:
+            current.append(sql[i])
+        i += 1
+    statements.append(''.join(current))
+    
+    # Drop fragments that hold only comments or whitespace
+    return [
+        stmt.strip() for stmt in statements
+        if any(line.strip() and not line.strip().startswith('--') for line in stmt.splitlines())
+    ]
+
+def run_sql_file(engine, migration_file):
+    """Execute every statement in a migration SQL file."""
+    
+    if not os.path.exists(migration_file):
+        print(f"Error: Migration file not found at {migration_file}")
+        return False
+    
+    with open(migration_file, 'r') as f:
+        migration_sql = f.read()
+    
+    # Execute the migration
+    with engine.connect() as connection:
+        # Split the SQL into individual statements
+        statements = split_sql_statements(migration_sql)
+        
+        for i, statement in enumerate(statements, 1):
+            if statement:
+                try:
+                    print(f"Executing statement {i}/{len(statements)}...")
+                    connection.execute(text(statement))
+                    connection.commit()
+                    print(f"✓ Statement {i} executed successfully")
+                except Exception as e:
+                    print(f"⚠ Statement {i} failed (this might be expected if index already exists): {e}")
+                    # Clear the aborted transaction so the next statement can run
+                    connection.rollback()
+                    # Continue with other statements even if one fails
+                    continue
+    
+    return True
+
 def run_migration():
-    """Run the database migration to add performance indexes."""
+    """Run the database migrations and backfill derived tables."""
     
     print("Starting database migration for performance optimization...")
     
@@ -19,32 +104,22 @@ def run_migration():
         # Create engine
         engine = create_engine(DATABASE_URL)
         
-        # Read the migration SQL file
-        migration_file = os.path.join(os.path.dirname(__file__), 'migrations', 'add_performance_indexes.sql')
-        
-        if not os.path.exists(migration_file):
-            print(f"Error: Migration file not found at {migration_file}")
-            return False
-        
-        with open(migration_file, 'r') as f:
-            migration_sql = f.read()
+        for name in MIGRATIONS:
+            print(f"\nApplying {name}...")
+            migration_file = os.path.join(os.path.dirname(__file__), 'migrations', name)
+            if not run_sql_file(engine, migration_file):
+                return False
         
-        # Execute the migration
-        with engine.connect() as connection:
-            # Split the SQL into individual statements
-            statements = [stmt.strip() for stmt in migration_sql.split(';') if stmt.strip()]
-            
-            for i, statement in enumerate(statements, 1):
-                if statement:
-                    try:
-                        print(f"Executing statement {i}/{len(statements)}...")
-                        connection.execute(text(statement))
-                        connection.commit()
-                        print(f"✓ Statement {i} executed successfully")
-                    except Exception as e:
-                        print(f"⚠ Statement {i} failed (this might be expected if index already exists): {e}")
-                        # Continue with other statements even if one fails
-                        continue
+        # Populate precomputed feature rows for existing users
+        from utils.feature_store import backfill_user_features, reencode_colliding_categories
+        db = sessionmaker(bind=engine)()
+        try:
+            created = backfill_user_features(db)
+            print(f"✓ Backfilled {created} user feature rows")
+            reencoded = reencode_colliding_categories(db)
+            print(f"✓ Re-encoded {reencoded} user feature rows with colliding category codes")
+        finally:
+            db.close()
         
         print("\n✅ Database migration completed successfully!")
         print("Performance indexes have been added to optimize query performance.")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Literal, Optional
 from datetime import datetime, time
 
 class UserCreate(BaseModel):
@@ -86,4 +86,110 @@ class PreferencesUpdate(BaseModel):
     guest_policy: Optional[str] = None
     room_type_preference: Optional[str] = None
     religious_preference: Optional[str] = None
-    dietary_restrictions: Optional[str] = None
\ No newline at end of file
+    dietary_restrictions: Optional[str] = None
+
+class SwipeDecision(BaseModel):
+    roommate_id: int
+    action: Literal["like", "reject"]
+
+class SwipeBatch(BaseModel):
+    swipes: List[SwipeDecision]
+
+# With fields=, the read endpoints return only the requested fields plus id
+# (and a feed card's compatibility_score), so the rest are optional
+class RoommateCard(BaseModel):
+    id: int
+    fullname: Optional[str] = None
+    age: Optional[int] = None
+    gender: Optional[str] = None
+    university: Optional[str] = None
+    major: Optional[str] = None
+    year_of_study: Optional[int] = None
+    bio: Optional[str] = None
+    profile_picture: Optional[str] = None
+    compatibility_score: float
+    budget_range: Optional[int] = None
+    cleanliness_level: Optional[int] = None
+    social_preference: Optional[str] = None
+    smoking_preference: Optional[bool] = None
+    drinking_preference: Optional[bool] = None
+    pet_preference: Optional[bool] = None
+    music_preference: Optional[bool] = None
+    guest_policy: Optional[str] = None
+    room_type_preference: Optional[str] = None
+    religious_preference: Optional[str] = None
+    dietary_restrictions: Optional[str] = None
+    sleep_time: Optional[str] = None  # HH:MM
+    wake_time: Optional[str] = None  # HH:MM
+
+class RoommateFeedPage(BaseModel):
+    results: List[RoommateCard]
+    next_cursor: Optional[str] = None
+
+class MatchCard(BaseModel):
+    id: int
+    fullname: Optional[str] = None
+    age: Optional[int] = None
+    gender: Optional[str] = None
+    major: Optional[str] = None
+    year_of_study: Optional[int] = None
+    bio: Optional[str] = None
+    profile_picture: Optional[str] = None
+    university: Optional[str] = None
+    instagram: Optional[str] = None
+    compatibility_score: Optional[float] = None
+    created_at: Optional[str] = None  # ISO 8601
+    match_status: Optional[str] = None
+    # Present only with include_preferences, or when requested in fields
+    budget_range: Optional[int] = None
+    cleanliness_level: Optional[int] = None
+    social_preference: Optional[str] = None
+    smoking_preference: Optional[bool] = None
+    drinking_preference: Optional[bool] = None
+    pet_preference: Optional[bool] = None
+    music_preference: Optional[bool] = None
+    guest_policy: Optional[str] = None
+    room_type_preference: Optional[str] = None
+    religious_preference: Optional[str] = None
+    dietary_restrictions: Optional[str] = None
+    sleep_time: Optional[str] = None
+    wake_time: Optional[str] = None
+
+class MatchChanges(BaseModel):
+    matches: List[MatchCard]
+    # IDs of users unmatched since the watermark
+    removed: List[int]
+    watermark: str
+
+class UserProfile(BaseModel):
+    id: int
+    fullname: Optional[str] = None
+    profile_picture: Optional[str] = None
+    instagram: Optional[str] = None
+    university: Optional[str] = None
+    age: Optional[int] = None
+    gender: Optional[str] = None
+    major: Optional[str] = None
+    year_of_study: Optional[int] = None
+    bio: Optional[str] = None
+    # Present only with include_preferences, or when requested in fields
+    budget_range: Optional[int] = None
+    cleanliness_level: Optional[int] = None
+    social_preference: Optional[str] = None
+    smoking_preference: Optional[bool] = None
+    drinking_preference: Optional[bool] = None
+    pet_preference: Optional[bool] = None
+    music_preference: Optional[bool] = None
+    guest_policy: Optional[str] = None
+    room_type_preference: Optional[str] = None
+    religious_preference: Optional[str] = None
+    dietary_restrictions: Optional[str] = None
+    sleep_time: Optional[str] = None
+    wake_time: Optional[str] = None
+    compatibility_score: Optional[float] = None
+
+class OwnProfile(UserProfile):
+    email: EmailStr
+    snapchat: Optional[str] = None
+    phone_number: Optional[str] = None
+    onboarding_complete: bool
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Modules import each other as top-level packages (from models import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, CategoryCode, User, UserFeatures, UserFeed, UserFeedState
+
+# A scratch Postgres database; its tables are created and dropped by the tests
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def pg_sessions():
+    """Session factory on TEST_DATABASE_URL with the feed and feature tables created."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_engine(TEST_DATABASE_URL)
+    tables = [
+        User.__table__, UserFeed.__table__, UserFeedState.__table__,
+        UserFeatures.__table__, CategoryCode.__table__,
+    ]
+    Base.metadata.drop_all(engine, tables=tables)
+    Base.metadata.create_all(engine, tables=tables)
+    try:
+        yield sessionmaker(bind=engine, autoflush=False)
+    finally:
+        Base.metadata.drop_all(engine, tables=tables)
+        engine.dispose()
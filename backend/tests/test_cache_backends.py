@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from utils.cache_backends import RedisCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+
+def test_get_many_and_set_many(client):
+    cache = RedisCache(ttl=60, client=client)
+    assert cache.get_many([]) == []
+    cache.set_many({(1, 2): 0.5, (1, 3): 0.25})
+    assert cache.get_many([(1, 2), (2, 3), (1, 3)]) == [0.5, None, 0.25]
+    assert cache.get((1, 2)) == 0.5
+
+
+def test_invalidate_user_drops_every_key_of_the_user(client):
+    cache = RedisCache(ttl=60, client=client)
+    cache.set_many({(1, 2): 0.5, (1, 3): 0.25, (2, 3): 0.75})
+    assert cache.invalidate_user(1) == 2
+    assert cache.get_many([(1, 2), (1, 3), (2, 3)]) == [None, None, 0.75]
+    assert not client.exists(cache._user_index(1))
+    # The other users' indexes may still name the dropped keys; invalidating
+    # them is harmless
+    assert cache.invalidate_user(2) == 2
+    assert cache.get((2, 3)) is None
+
+
+def test_user_index_only_holds_live_keys(client):
+    cache = RedisCache(ttl=1, client=client)
+    cache.set_many({(1, other_id): 0.5 for other_id in range(2, 12)})
+    time.sleep(1.1)
+    cache.set_many({(1, 20): 0.5})
+    assert client.zrange(cache._user_index(1), 0, -1) == [b"compat:1:20"]
+    assert cache.invalidate_user(1) == 1
+
+
+def test_clear(client):
+    cache = RedisCache(ttl=60, client=client)
+    cache.set_many({(1, 2): 0.5})
+    client.set("other", "kept")
+    cache.clear()
+    assert cache.get((1, 2)) is None
+    assert client.get("other") == b"kept"
@@ -0,0 +1,40 @@
+import zlib
+
+from models import CategoryCode, User, UserFeatures
+from utils.batch_scoring import batch_compatibility_scores, category_code, crc_category_code
+from utils.feature_store import FEATURE_COLUMNS, ensure_category_codes, feature_batch_from_rows, sync_user_features
+from utils.match_utils import compute_compatibility_score
+
+# Distinct strings with the same CRC32
+COLLIDING = ("plumless", "buckeroo")
+
+
+def test_colliding_values_get_distinct_codes(pg_sessions):
+    assert zlib.crc32(COLLIDING[0].encode()) == zlib.crc32(COLLIDING[1].encode())
+
+    with pg_sessions() as db:
+        ensure_category_codes(db, COLLIDING)
+        stored = dict(db.query(CategoryCode.value, CategoryCode.code).all())
+
+    crc = crc_category_code(COLLIDING[0])
+    assert sorted(stored[value] for value in COLLIDING) == [crc, crc + 1]
+    assert [category_code(value) for value in COLLIDING] == [stored[value] for value in COLLIDING]
+
+
+def test_stored_features_score_colliding_values_like_the_scalar_scorer(pg_sessions):
+    with pg_sessions() as db:
+        viewer = User(id=1, email="a@example.com", hashed_password="x", guest_policy=COLLIDING[0])
+        candidate = User(id=2, email="b@example.com", hashed_password="x", guest_policy=COLLIDING[1])
+        db.add_all([viewer, candidate])
+        db.commit()
+        for user in (viewer, candidate):
+            sync_user_features(db, user)
+        db.commit()
+
+        rows = db.query(*FEATURE_COLUMNS).order_by(UserFeatures.user_id).all()
+        features = feature_batch_from_rows(rows)
+        expected = compute_compatibility_score.__wrapped__(viewer, candidate)
+        scores = batch_compatibility_scores(features.row(0), features)
+
+    assert scores[1] == expected
+    assert scores[0] != scores[1]
@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+from models import User, UserFeed, UserFeedState
+from utils.feed_store import replace_candidate_entries, replace_user_feed
+
+
+def _add_users(Session, count):
+    with Session() as db:
+        db.add_all([User(id=i, email=f"user{i}@example.com", hashed_password="x") for i in range(1, count + 1)])
+        db.commit()
+
+
+def _run_concurrently(*jobs):
+    """Run each job in its own thread, all released at once; re-raise any error."""
+    barrier = threading.Barrier(len(jobs))
+    errors = []
+
+    def run(job):
+        barrier.wait()
+        try:
+            job()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def _feed(Session, user_id):
+    with Session() as db:
+        return dict(db.query(UserFeed.candidate_id, UserFeed.compatibility_score).filter(UserFeed.user_id == user_id).all())
+
+
+def test_concurrent_rebuilds_of_one_feed(pg_sessions):
+    _add_users(pg_sessions, 50)
+    ids = np.arange(2, 51, dtype=np.int64)
+
+    def rebuild(seed):
+        scores = np.random.default_rng(seed).random(len(ids))
+        with pg_sessions() as db:
+            replace_user_feed(db, 1, ids, scores)
+            db.commit()
+        return scores
+
+    for _ in range(5):
+        _run_concurrently(*(lambda seed=seed: rebuild(seed) for seed in range(4)))
+
+        feed = _feed(pg_sessions, 1)
+        # One rebuild wins whole; rows are never mixed from several
+        winners = [
+            seed for seed in range(4)
+            if feed == dict(zip(ids.tolist(), np.random.default_rng(seed).random(len(ids)).tolist()))
+        ]
+        assert winners
+        with pg_sessions() as db:
+            assert db.query(UserFeedState).filter(UserFeedState.user_id == 1).count() == 1
+
+
+def test_rebuild_concurrent_with_candidate_refresh(pg_sessions):
+    _add_users(pg_sessions, 20)
+    ids = np.arange(2, 21, dtype=np.int64)
+    scores = np.linspace(0.1, 0.9, len(ids))
+
+    def rebuild():
+        with pg_sessions() as db:
+            replace_user_feed(db, 1, ids, scores)
+            db.commit()
+
+    def refresh():
+        with pg_sessions() as db:
+            replace_candidate_entries(db, 5, {1: 0.95, 2: 0.5})
+            db.commit()
+
+    for _ in range(5):
+        _run_concurrently(rebuild, refresh, rebuild, refresh)
+
+    feed = _feed(pg_sessions, 1)
+    assert set(feed) == set(ids.tolist())
+    assert feed[5] in (0.95, scores[ids.tolist().index(5)])
@@ -1,16 +1,40 @@
+from passlib.context import CryptContext
 from passlib.hash import pbkdf2_sha256
+from typing import Optional, Tuple
 import jwt
+import os
 from datetime import datetime, timedelta
 
 SECRET_KEY = "secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 7 * 24 * 60  # 7 days
 
+# PBKDF2 cost for new hashes. Stored hashes with any other round count
+# are rehashed at this cost on the user's next successful login.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", str(pbkdf2_sha256.default_rounds)))
+
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__max_rounds=PASSWORD_HASH_ROUNDS,
+)
+
 def hash_password(password: str) -> str:
-    return pbkdf2_sha256.hash(password)
+    return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pbkdf2_sha256.verify(plain_password, hashed_password)
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and, if its stored hash uses outdated parameters,
+    hash it again with the current ones.
+
+    Returns:
+        (valid, new hash to store or None)
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: int = None):
     to_encode = data.copy()
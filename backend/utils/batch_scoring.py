@@ -0,0 +1,347 @@
+from typing import Dict, Iterable, Optional, Sequence, Set, Union
+import logging
+import zlib
+
+import numpy as np
+
+from models import User, Gender, SocialPreference
+
+logger = logging.getLogger(__name__)
+
+# Sentinel used for missing categorical values (None or empty string)
+NULL_CODE = -1
+
+# Factor weights, kept in the same order as compute_compatibility_score adds them.
+# The accumulation order matters: it keeps the vectorized result bit-for-bit
+# identical to the scalar function.
+GENDER_WEIGHT = 0.3
+CLEANLINESS_WEIGHT = 0.2
+SLEEP_WEIGHT = 0.15
+WAKE_WEIGHT = 0.1
+GUEST_POLICY_WEIGHT = 0.15
+ROOM_TYPE_WEIGHT = 0.1
+ROOM_TYPE_ANY_WEIGHT = 0.1 * 0.7
+RELIGIOUS_WEIGHT = 0.1
+RELIGIOUS_NONE_WEIGHT = 0.1 * 0.8
+DIETARY_WEIGHT = 0.05
+DIETARY_NONE_WEIGHT = 0.05 * 0.8
+AGE_WEIGHT = 0.05
+LIFESTYLE_WEIGHT = 0.05  # smoking, drinking, pets, music, social
+BUDGET_WEIGHT = 0.05
+
+CLEANLINESS_MAX_DIFF = 5
+TIME_MAX_DIFF_MINUTES = 90
+AGE_MAX_DIFF = 10
+BUDGET_MAX_DIFF = 1000
+
+# Personalized scoring: the user_preferences importance setting
+# (<name>_importance) that scales each factor's weight. Sleep and wake
+# share sleep_schedule_importance.
+IMPORTANCE_FACTORS = {
+    "cleanliness": "cleanliness",
+    "sleep_minutes": "sleep_schedule",
+    "wake_minutes": "sleep_schedule",
+    "guest_policy": "guest_policy",
+    "room_type": "room_type",
+    "religious": "religious",
+    "dietary": "dietary",
+}
+# Categories whose learned weights (user_preferences.<name>_weights) are
+# scored as one extra factor each, at the category's base weight, after
+# all the compatibility factors
+AFFINITY_FACTORS = (
+    ("guest_policy", GUEST_POLICY_WEIGHT),
+    ("room_type", ROOM_TYPE_WEIGHT),
+    ("religious", RELIGIOUS_WEIGHT),
+    ("dietary", DIETARY_WEIGHT),
+)
+
+# Enum ordinals, keyed by value so that raw strings assigned before a commit
+# (e.g. user.gender = "male") encode the same as loaded enum members
+_GENDER_CODES = {gender.value: code for code, gender in enumerate(Gender)}
+_SOCIAL_CODES = {social.value: code for code, social in enumerate(SocialPreference)}
+
+
+def crc_category_code(value: str) -> int:
+    """The code a category value is first offered: its CRC32, as a non-negative int32."""
+    return zlib.crc32(value.encode("utf-8")) & 0x7FFFFFFF
+
+
+# Codes of the free-form category strings this process has seen, mirrored
+# from the category_codes table by feature_store.ensure_category_codes.
+# The table gives every value a distinct code (its CRC32 unless another
+# value holds that already), so equal codes always mean equal strings.
+# The wildcards the scorer tests for are registered first and keep theirs.
+ANY_CODE = crc_category_code("any")
+NONE_CODE = crc_category_code("none")
+WILDCARD_CATEGORY_CODES = {"any": ANY_CODE, "none": NONE_CODE}
+_category_codes: Dict[str, int] = dict(WILDCARD_CATEGORY_CODES)
+
+
+def category_code(value: Optional[str]) -> int:
+    """
+    Integer ID of a free-form categorical string. Falsy values map to
+    NULL_CODE, mirroring the truthiness checks in
+    compute_compatibility_score.
+
+    Raises:
+        KeyError: If the value has no code in this process yet; load or
+            assign it with feature_store.ensure_category_codes first
+    """
+    if not value:
+        return NULL_CODE
+    return _category_codes[value]
+
+
+def register_category_codes(codes: Dict[str, int]) -> None:
+    """Record {value: code} assignments read from the category_codes table."""
+    _category_codes.update(codes)
+
+
+def unregistered_categories(values: Iterable[Optional[str]]) -> Set[str]:
+    """The non-empty values among values that have no code in this process."""
+    return {value for value in values if value and value not in _category_codes}
+
+
+def category_values(users: Sequence[User]) -> Set[str]:
+    """Every free-form category value encode_users reads from users."""
+    return {
+        value
+        for user in users
+        for value in (user.guest_policy, user.room_type_preference, user.religious_preference, user.dietary_restrictions)
+        if value
+    }
+
+
+def time_to_minutes(value) -> Optional[int]:
+    """Convert a datetime.time to minutes after midnight."""
+    if value is None:
+        return None
+    return value.hour * 60 + value.minute
+
+
+def _bool_code(value: Optional[bool]) -> int:
+    if value is None:
+        return NULL_CODE
+    return 1 if value else 0
+
+
+def _enum_code(value, codes: dict) -> int:
+    if not value:
+        return NULL_CODE
+    return codes.get(getattr(value, "value", value), NULL_CODE)
+
+
+def _float_or_nan(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+class FeatureBatch:
+    """
+    Column-oriented encoding of a set of users for vectorized scoring.
+
+    Numeric columns are float64 with NaN for missing values. Boolean
+    preferences, enums and categorical strings are int64 codes with NULL_CODE
+    for missing values.
+    """
+
+    COLUMNS = (
+        "ids", "gender", "cleanliness", "sleep_minutes", "wake_minutes",
+        "guest_policy", "room_type", "religious", "dietary", "age",
+        "smoking", "drinking", "pet", "music", "social", "budget",
+    )
+    NUMERIC_COLUMNS = ("cleanliness", "sleep_minutes", "wake_minutes", "age", "budget")
+
+    __slots__ = COLUMNS
+
+    def __init__(self, **columns):
+        for name in self.COLUMNS:
+            dtype = np.float64 if name in self.NUMERIC_COLUMNS else np.int64
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, index: int) -> dict:
+        """Return a single user's features as plain Python scalars."""
+        return {name: getattr(self, name)[index].item() for name in self.COLUMNS}
+
+    def take(self, index) -> "FeatureBatch":
+        """Return the users selected by an index array or boolean mask."""
+        return FeatureBatch(**{name: getattr(self, name)[index] for name in self.COLUMNS})
+
+    @classmethod
+    def concat(cls, batches: Sequence["FeatureBatch"]) -> "FeatureBatch":
+        """Join several batches into one, in order."""
+        if not batches:
+            return cls(**{name: [] for name in cls.COLUMNS})
+        return cls(**{name: np.concatenate([getattr(batch, name) for batch in batches]) for name in cls.COLUMNS})
+
+
+class Personalization:
+    """
+    A viewer's preference weights lined up with a FeatureBatch.
+
+    multipliers maps importance names to a factor weight multiplier: a
+    float for one viewer, or an array aligned with the batch when each row
+    is scored for a different viewer. affinities maps AFFINITY_FACTORS
+    categories to the learned weight of each row's value (NaN if none).
+    """
+
+    __slots__ = ("multipliers", "affinities")
+
+    def __init__(self, multipliers: Dict[str, Union[float, np.ndarray]], affinities: Dict[str, np.ndarray]):
+        self.multipliers = multipliers
+        self.affinities = affinities
+
+    def scale(self, factor: str, weight: float):
+        """Weight of a factor after applying its importance multiplier."""
+        importance = IMPORTANCE_FACTORS.get(factor)
+        if importance is None or importance not in self.multipliers:
+            return weight
+        return weight * self.multipliers[importance]
+
+
+def encode_users(users: Sequence[User]) -> FeatureBatch:
+    """Encode ORM users into a FeatureBatch."""
+    columns = {name: [] for name in FeatureBatch.COLUMNS}
+    for user in users:
+        columns["ids"].append(user.id)
+        columns["gender"].append(_enum_code(user.gender, _GENDER_CODES))
+        columns["cleanliness"].append(_float_or_nan(user.cleanliness_level))
+        columns["sleep_minutes"].append(_float_or_nan(time_to_minutes(user.sleep_time)))
+        columns["wake_minutes"].append(_float_or_nan(time_to_minutes(user.wake_time)))
+        columns["guest_policy"].append(category_code(user.guest_policy))
+        columns["room_type"].append(category_code(user.room_type_preference))
+        columns["religious"].append(category_code(user.religious_preference))
+        columns["dietary"].append(category_code(user.dietary_restrictions))
+        columns["age"].append(_float_or_nan(user.age))
+        columns["smoking"].append(_bool_code(user.smoking_preference))
+        columns["drinking"].append(_bool_code(user.drinking_preference))
+        columns["pet"].append(_bool_code(user.pet_preference))
+        columns["music"].append(_bool_code(user.music_preference))
+        columns["social"].append(_enum_code(user.social_preference, _SOCIAL_CODES))
+        columns["budget"].append(_float_or_nan(user.budget_range))
+    return FeatureBatch(**columns)
+
+
+def top_k_order(ids: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the top k candidates in feed order: score descending, then
+    user ID ascending.
+
+    Selects with np.partition (linear time) and only sorts the selection,
+    so the cost is O(n + k log k) instead of a full O(n log n) sort.
+    Candidates tied with the k-th score are all sorted before cutting, so
+    the result always equals the first k of the full order.
+    """
+    n = len(scores)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        kth_score = -np.partition(-scores, k - 1)[k - 1]
+        selected = np.flatnonzero(scores >= kth_score)
+    else:
+        selected = np.arange(n)
+    order = np.lexsort((ids[selected], -scores[selected]))
+    return selected[order[:k]]
+
+
+def batch_compatibility_scores(
+    current: dict,
+    candidates: FeatureBatch,
+    personalization: Optional[Personalization] = None
+) -> np.ndarray:
+    """
+    Score one user against a whole batch of candidates in a single vectorized pass.
+
+    Produces exactly the same values as compute_compatibility_score for every
+    (current, candidate) pair. With personalization, factor weights are
+    scaled by the viewer's importance settings and the learned category
+    weights are added as extra factors.
+
+    Args:
+        current: The viewer's features, as returned by FeatureBatch.row()
+        candidates: Encoded candidates to score
+        personalization: Preference weights aligned with candidates, if any
+
+    Returns:
+        float64 array of scores (0-100), aligned with candidates.ids
+    """
+    n = len(candidates)
+    score_sum = np.zeros(n)
+    total_weight = np.zeros(n)
+
+    def scale(factor: str, weight: float):
+        return weight if personalization is None else personalization.scale(factor, weight)
+
+    def add_factor(present: np.ndarray, matched: np.ndarray, weight: float):
+        score_sum[:] += np.where(present & matched, weight, 0.0)
+        total_weight[:] += np.where(present, weight, 0.0)
+
+    def add_code_factor(name: str, weight: float):
+        mine = current[name]
+        if mine == NULL_CODE:
+            return
+        theirs = getattr(candidates, name)
+        add_factor(theirs != NULL_CODE, theirs == mine, scale(name, weight))
+
+    def add_numeric_factor(name: str, max_diff: float, weight: float):
+        mine = current[name]
+        if np.isnan(mine):
+            return
+        theirs = getattr(candidates, name)
+        present = ~np.isnan(theirs)
+        weight = scale(name, weight)
+        factor_score = np.maximum(0, 1 - np.abs(mine - theirs) / max_diff)
+        score_sum[:] += np.where(present, factor_score * weight, 0.0)
+        total_weight[:] += np.where(present, weight, 0.0)
+
+    def add_wildcard_factor(name: str, wildcard: int, weight: float, wildcard_weight: float):
+        # "any"/"none" on either side earns full credit at a reduced weight,
+        # otherwise only an exact match scores.
+        mine = current[name]
+        if mine == NULL_CODE:
+            return
+        theirs = getattr(candidates, name)
+        present = theirs != NULL_CODE
+        weight = scale(name, weight)
+        wildcard_weight = scale(name, wildcard_weight)
+        if mine == wildcard:
+            wild = present
+        else:
+            wild = present & (theirs == wildcard)
+        exact = present & ~wild
+        score_sum[:] += np.where(wild, wildcard_weight, np.where(exact & (theirs == mine), weight, 0.0))
+        total_weight[:] += np.where(wild, wildcard_weight, np.where(exact, weight, 0.0))
+
+    add_code_factor("gender", GENDER_WEIGHT)
+    add_numeric_factor("cleanliness", CLEANLINESS_MAX_DIFF, CLEANLINESS_WEIGHT)
+    add_numeric_factor("sleep_minutes", TIME_MAX_DIFF_MINUTES, SLEEP_WEIGHT)
+    add_numeric_factor("wake_minutes", TIME_MAX_DIFF_MINUTES, WAKE_WEIGHT)
+    add_code_factor("guest_policy", GUEST_POLICY_WEIGHT)
+    add_wildcard_factor("room_type", ANY_CODE, ROOM_TYPE_WEIGHT, ROOM_TYPE_ANY_WEIGHT)
+    add_wildcard_factor("religious", NONE_CODE, RELIGIOUS_WEIGHT, RELIGIOUS_NONE_WEIGHT)
+    add_wildcard_factor("dietary", NONE_CODE, DIETARY_WEIGHT, DIETARY_NONE_WEIGHT)
+    add_numeric_factor("age", AGE_MAX_DIFF, AGE_WEIGHT)
+    add_code_factor("smoking", LIFESTYLE_WEIGHT)
+    add_code_factor("drinking", LIFESTYLE_WEIGHT)
+    add_code_factor("pet", LIFESTYLE_WEIGHT)
+    add_code_factor("music", LIFESTYLE_WEIGHT)
+    add_code_factor("social", LIFESTYLE_WEIGHT)
+    add_numeric_factor("budget", BUDGET_MAX_DIFF, BUDGET_WEIGHT)
+
+    if personalization is not None:
+        for name, base_weight in AFFINITY_FACTORS:
+            affinity = personalization.affinities.get(name)
+            if affinity is None:
+                continue
+            weight = scale(name, base_weight)
+            has_affinity = ~np.isnan(affinity)
+            score_sum[:] += np.where(has_affinity, affinity * weight, 0.0)
+            total_weight[:] += np.where(has_affinity, weight, 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.minimum(1.0, score_sum / total_weight) * 100
+    return np.where(total_weight > 0, scores, 50.0)
+
@@ -0,0 +1,378 @@
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+import fcntl
+import mmap
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[int, int]
+
+
+class CacheBackend(ABC):
+    """
+    Interface for compatibility score storage.
+
+    Keys are canonical (low_id, high_id) tuples. get_many/set_many must cost
+    a single round trip so a whole batch of scores can be read or written
+    at once.
+    """
+
+    def get(self, key: CacheKey) -> Optional[float]:
+        return self.get_many([key])[0]
+
+    def set(self, key: CacheKey, score: float) -> None:
+        self.set_many({key: score})
+
+    @abstractmethod
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[float]]:
+        """Scores for keys, in order, None where missing or expired."""
+
+    @abstractmethod
+    def set_many(self, items: Dict[CacheKey, float]) -> None:
+        """Store every score in items."""
+
+    @abstractmethod
+    def invalidate_user(self, user_id: int) -> int:
+        """Remove every entry involving user_id. Returns the number removed, if known."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every entry."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Backend statistics for get_cache_stats."""
+
+
+class CompatibilityCache(CacheBackend):
+    """
+    Bounded in-process cache for compatibility scores.
+
+    Entries are kept in LRU order and evicted once max_entries is reached or
+    when they are older than ttl seconds. A reverse index from user ID to
+    that user's keys makes invalidating one user proportional to the number
+    of entries that user has, instead of a scan over the whole cache.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[float, float]]" = OrderedDict()  # key -> (score, timestamp)
+        self._by_user: Dict[int, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _unindex(self, key: CacheKey) -> None:
+        for user_id in key:
+            keys = self._by_user.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[user_id]
+
+    def _get(self, key: CacheKey, now: float) -> Optional[float]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        score, timestamp = entry
+        if now - timestamp >= self.ttl:
+            del self._entries[key]
+            self._unindex(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return score
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[float]]:
+        with self._lock:
+            now = time.time()
+            return [self._get(key, now) for key in keys]
+
+    def set_many(self, items: Dict[CacheKey, float]) -> None:
+        with self._lock:
+            now = time.time()
+            for key, score in items.items():
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                else:
+                    for user_id in key:
+                        self._by_user.setdefault(user_id, set()).add(key)
+                self._entries[key] = (score, now)
+
+            while len(self._entries) > self.max_entries:
+                oldest_key, _ = self._entries.popitem(last=False)
+                self._unindex(oldest_key)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int) -> int:
+        with self._lock:
+            keys = self._by_user.pop(user_id, set())
+            for key in keys:
+                del self._entries[key]
+                other_id = key[1] if key[0] == user_id else key[0]
+                other_keys = self._by_user.get(other_id)
+                if other_keys is not None:
+                    other_keys.discard(key)
+                    if not other_keys:
+                        del self._by_user[other_id]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            current_time = time.time()
+            expired_entries = sum(
+                1 for _, timestamp in self._entries.values()
+                if current_time - timestamp >= self.ttl
+            )
+            return {
+                'backend': 'memory',
+                'total_entries': len(self._entries),
+                'active_entries': len(self._entries) - expired_entries,
+                'expired_entries': expired_entries,
+                'indexed_users': len(self._by_user),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'cache_ttl': self.ttl
+            }
+
+
+class SharedMemoryCache(CacheBackend):
+    """
+    Compatibility cache in a memory-mapped file shared by every worker on the host.
+
+    The file holds a direct-mapped table of fixed-size slots plus a table of
+    per-user generation counters. Each slot records the generations of both
+    users at write time; invalidating a user just bumps its counter, so stale
+    slots stop matching without being touched. Colliding keys overwrite each
+    other, which only costs a cache miss. Reads and writes are vectorized with
+    NumPy and serialized between processes with flock.
+    """
+
+    MAGIC = b"RMCACHE1"
+    HEADER_SIZE = 4096
+    SLOT_DTYPE = np.dtype([
+        ("low", "<i4"), ("high", "<i4"),
+        ("gen_low", "<u4"), ("gen_high", "<u4"),
+        ("timestamp", "<f8"), ("score", "<f8"),
+    ])
+
+    def __init__(self, path: str, slots: int, ttl: float, generation_slots: int = 1 << 16):
+        self.path = path
+        self.slots = slots
+        self.generation_slots = generation_slots
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        generations_size = generation_slots * 4
+        self._size = self.HEADER_SIZE + generations_size + slots * self.SLOT_DTYPE.itemsize
+        self._pid = None
+        self._open()
+
+    def _open(self) -> None:
+        # flock locks belong to the open file description, which a forked
+        # worker would share with its parent, so every process maps its own.
+        self._pid = os.getpid()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, len(self.MAGIC) + 16, 0)
+            expected = self.MAGIC + np.array([self.slots, self.generation_slots], dtype="<u8").tobytes()
+            if os.fstat(self._fd).st_size != self._size or header != expected:
+                # New file or a different layout: (re)initialize to all zeros
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, expected, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        generations_size = self.generation_slots * 4
+        self._mmap = mmap.mmap(self._fd, self._size)
+        self._generations = np.frombuffer(
+            self._mmap, dtype="<u4", count=self.generation_slots, offset=self.HEADER_SIZE
+        )
+        self._table = np.frombuffer(
+            self._mmap, dtype=self.SLOT_DTYPE, count=self.slots, offset=self.HEADER_SIZE + generations_size
+        )
+
+    @contextmanager
+    def _locked(self, operation: int):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._fd, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slot_indexes(self, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+        mixed = (low.astype(np.uint64) * np.uint64(0x9E3779B1)) ^ (high.astype(np.uint64) * np.uint64(0x85EBCA6B))
+        return (mixed % np.uint64(self.slots)).astype(np.int64)
+
+    def _generation_indexes(self, user_ids: np.ndarray) -> np.ndarray:
+        return user_ids % self.generation_slots
+
+    @staticmethod
+    def _split(keys: Iterable[CacheKey]) -> Tuple[np.ndarray, np.ndarray]:
+        pairs = np.array(list(keys), dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[float]]:
+        if not keys:
+            return []
+        low, high = self._split(keys)
+        indexes = self._slot_indexes(low, high)
+
+        with self._locked(fcntl.LOCK_SH):
+            slots = self._table[indexes]
+            gen_low = self._generations[self._generation_indexes(low)]
+            gen_high = self._generations[self._generation_indexes(high)]
+
+        valid = (
+            (slots["low"] == low) & (slots["high"] == high)
+            & (slots["gen_low"] == gen_low) & (slots["gen_high"] == gen_high)
+            & (time.time() - slots["timestamp"] < self.ttl)
+        )
+        return [score if ok else None for score, ok in zip(slots["score"].tolist(), valid.tolist())]
+
+    def set_many(self, items: Dict[CacheKey, float]) -> None:
+        if not items:
+            return
+        low, high = self._split(items.keys())
+        scores = np.fromiter(items.values(), dtype=np.float64, count=len(items))
+        indexes = self._slot_indexes(low, high)
+
+        with self._locked(fcntl.LOCK_EX):
+            self._table["low"][indexes] = low
+            self._table["high"][indexes] = high
+            self._table["gen_low"][indexes] = self._generations[self._generation_indexes(low)]
+            self._table["gen_high"][indexes] = self._generations[self._generation_indexes(high)]
+            self._table["timestamp"][indexes] = time.time()
+            self._table["score"][indexes] = scores
+
+    def invalidate_user(self, user_id: int) -> int:
+        with self._locked(fcntl.LOCK_EX):
+            self._generations[user_id % self.generation_slots] += np.uint32(1)
+        return 0  # Stale slots are not counted, they simply stop matching
+
+    def clear(self) -> None:
+        with self._locked(fcntl.LOCK_EX):
+            self._table["timestamp"][:] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._locked(fcntl.LOCK_SH):
+            timestamps = self._table["timestamp"].copy()
+        used = timestamps > 0
+        active = used & (time.time() - timestamps < self.ttl)
+        return {
+            'backend': 'shm',
+            'path': self.path,
+            'slots': self.slots,
+            'total_entries': int(used.sum()),
+            'active_entries': int(active.sum()),
+            'expired_entries': int((used & ~active).sum()),
+            'cache_ttl': self.ttl
+        }
+
+
+class RedisCache(CacheBackend):
+    """
+    Compatibility cache on any Redis-protocol server (Redis, KeyDB, Dragonfly, ...).
+
+    Scores live under "compat:<low>:<high>" with a TTL. Each user also has a
+    sorted set of their keys scored by expiry time ("compat:index:<id>"),
+    used for invalidation; every write prunes the expired members, so an
+    active user's index only holds their live keys. get_many is a single
+    MGET and set_many a single pipelined round trip.
+
+    Pass an existing client (for example a local stand-in for tests) or a URL;
+    the redis package is only imported when a URL is given.
+    """
+
+    KEY_PREFIX = "compat"
+
+    def __init__(self, ttl: float, url: Optional[str] = None, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("The redis package is required for the redis cache backend")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.ttl = int(ttl)
+
+    def _key(self, key: CacheKey) -> str:
+        return f"{self.KEY_PREFIX}:{key[0]}:{key[1]}"
+
+    def _user_index(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:index:{user_id}"
+
+    def get_many(self, keys: List[CacheKey]) -> List[Optional[float]]:
+        if not keys:
+            return []
+        values = self._client.mget([self._key(key) for key in keys])
+        return [float(value) if value is not None else None for value in values]
+
+    def set_many(self, items: Dict[CacheKey, float]) -> None:
+        if not items:
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        pipe = self._client.pipeline(transaction=False)
+        by_user: Dict[int, List[str]] = {}
+        for key, score in items.items():
+            redis_key = self._key(key)
+            pipe.set(redis_key, repr(float(score)), ex=self.ttl)
+            for user_id in set(key):
+                by_user.setdefault(user_id, []).append(redis_key)
+        for user_id, redis_keys in by_user.items():
+            index = self._user_index(user_id)
+            pipe.zremrangebyscore(index, "-inf", now)
+            pipe.zadd(index, dict.fromkeys(redis_keys, expires_at))
+            pipe.expire(index, self.ttl)
+        pipe.execute()
+
+    def invalidate_user(self, user_id: int) -> int:
+        index = self._user_index(user_id)
+        keys = self._client.zrange(index, 0, -1)
+        pipe = self._client.pipeline(transaction=False)
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(index)
+        pipe.execute()
+        return len(keys)
+
+    def clear(self) -> None:
+        keys = list(self._client.scan_iter(match=f"{self.KEY_PREFIX}:*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self._client.delete(*keys[start:start + 1000])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': 'redis',
+            'cache_ttl': self.ttl
+        }
@@ -0,0 +1,109 @@
+from typing import Callable, List, Set
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from models import User
+from .cache_utils import invalidate_user_cache
+
+logger = logging.getLogger(__name__)
+
+# User columns read by compute_compatibility_score / the batch scorer.
+# A change to any of these makes previously cached scores stale.
+SCORING_COLUMNS = frozenset({
+    "gender",
+    "cleanliness_level",
+    "sleep_time",
+    "wake_time",
+    "guest_policy",
+    "room_type_preference",
+    "religious_preference",
+    "dietary_restrictions",
+    "age",
+    "smoking_preference",
+    "drinking_preference",
+    "pet_preference",
+    "music_preference",
+    "social_preference",
+    "budget_range",
+})
+
+_SESSION_INFO_KEY = "scoring_changed_user_ids"
+
+UserChangeListener = Callable[[Set[int]], None]
+_listeners: List[UserChangeListener] = []
+
+
+def register_user_change_listener(listener: UserChangeListener) -> None:
+    """
+    Register a callback for derived caches that depend on user scoring columns.
+    It receives the set of changed user IDs once the transaction has committed.
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _invalidate_compatibility_scores(user_ids: Set[int]) -> None:
+    for user_id in user_ids:
+        invalidate_user_cache(user_id)
+
+
+def _scoring_columns_changed(user: User) -> bool:
+    state = inspect(user)
+    return any(state.attrs[column].history.has_changes() for column in SCORING_COLUMNS)
+
+
+def _collect_changed_users(session, flush_context) -> None:
+    # Attribute history still reflects the pre-flush state in after_flush
+    changed = {
+        obj.id for obj in session.dirty
+        if isinstance(obj, User) and _scoring_columns_changed(obj)
+    }
+    changed.update(obj.id for obj in session.deleted if isinstance(obj, User))
+    if changed:
+        session.info.setdefault(_SESSION_INFO_KEY, set()).update(changed)
+
+
+def mark_user_changed(session, user_id: int) -> None:
+    """
+    Invalidate user_id's cached scores after the session's next commit.
+    For scoring writes the flush hook cannot see, such as Core upserts.
+    """
+    session.info.setdefault(_SESSION_INFO_KEY, set()).add(user_id)
+
+
+def _notify_after_commit(session) -> None:
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if not user_ids:
+        return
+
+    logger.debug(f"Scoring columns changed for users {sorted(user_ids)}, invalidating caches")
+    for listener in _listeners:
+        try:
+            listener(user_ids)
+        except Exception as e:
+            logger.error(f"User change listener {listener!r} failed: {e}")
+
+
+def _discard_after_rollback(session) -> None:
+    session.info.pop(_SESSION_INFO_KEY, None)
+
+
+def install_cache_invalidation(session_factory) -> None:
+    """
+    Hook cache invalidation into every session created by session_factory.
+
+    Changed users are collected at flush time and invalidated after commit,
+    so a rolled-back edit never evicts anything and readers that recompute a
+    score after the invalidation see the committed row. For an
+    async_sessionmaker the hooks go on its sync_session_class, whose
+    sessions back each AsyncSession.
+    """
+    register_user_change_listener(_invalidate_compatibility_scores)
+    if isinstance(session_factory, async_sessionmaker):
+        session_factory = session_factory.kw["sync_session_class"]
+    if not event.contains(session_factory, "after_flush", _collect_changed_users):
+        event.listen(session_factory, "after_flush", _collect_changed_users)
+        event.listen(session_factory, "after_commit", _notify_after_commit)
+        event.listen(session_factory, "after_rollback", _discard_after_rollback)
@@ -1,56 +1,73 @@
-from typing import Dict, Any, Optional
-import time
+from typing import Dict, Any, List, Optional
+import os
 import logging
 from functools import wraps
 
+from .cache_backends import CacheBackend, CacheKey, CompatibilityCache, SharedMemoryCache, RedisCache
+
 logger = logging.getLogger(__name__)
 
-# Simple in-memory cache for compatibility scores
-# In production, consider using Redis or Memcached
-_compatibility_cache: Dict[str, Dict[str, Any]] = {}
-_cache_ttl = 3600  # 1 hour TTL
+_cache_ttl = 24 * 3600  # 24 hour TTL; edits invalidate entries immediately
+_cache_max_entries = 100_000  # Roughly 30-40 MB including the reverse index
+
+# Backend selection: "memory" (per process), "shm" (shared by the workers on
+# one machine) or "redis" (shared by every machine)
+_cache_backend_name = os.getenv("COMPAT_CACHE_BACKEND", "memory")
+_cache_shm_path = os.getenv("COMPAT_CACHE_SHM_PATH", "/dev/shm/roomio_compat_cache")
+_cache_shm_slots = 1 << 20  # 32 MB of 32-byte slots
+_cache_redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def create_cache_backend(name: str) -> CacheBackend:
+    """Build the compatibility cache backend with the given name."""
+    if name == "memory":
+        return CompatibilityCache(max_entries=_cache_max_entries, ttl=_cache_ttl)
+    if name == "shm":
+        return SharedMemoryCache(_cache_shm_path, slots=_cache_shm_slots, ttl=_cache_ttl)
+    if name == "redis":
+        return RedisCache(ttl=_cache_ttl, url=_cache_redis_url)
+    raise ValueError(f"Unknown compatibility cache backend: {name}")
+
+
+_compatibility_cache: CacheBackend = create_cache_backend(_cache_backend_name)
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    """Replace the active cache backend (e.g. with a local stand-in)."""
+    global _compatibility_cache
+    _compatibility_cache = backend
 
-def get_cache_key(user1_id: int, user2_id: int) -> str:
+def get_cache_key(user1_id: int, user2_id: int) -> CacheKey:
     """Generate a cache key for compatibility score between two users."""
     # Always use the smaller ID first for consistent caching
-    return f"compat_{min(user1_id, user2_id)}_{max(user1_id, user2_id)}"
+    return (min(user1_id, user2_id), max(user1_id, user2_id))
 
 def get_cached_compatibility_score(user1_id: int, user2_id: int) -> Optional[float]:
     """Get cached compatibility score if it exists and is not expired."""
-    cache_key = get_cache_key(user1_id, user2_id)
-    
-    if cache_key in _compatibility_cache:
-        cached_data = _compatibility_cache[cache_key]
-        if time.time() - cached_data['timestamp'] < _cache_ttl:
-            logger.debug(f"Cache hit for compatibility score: {user1_id} <-> {user2_id}")
-            return cached_data['score']
-        else:
-            # Remove expired entry
-            del _compatibility_cache[cache_key]
-            logger.debug(f"Cache expired for compatibility score: {user1_id} <-> {user2_id}")
-    
-    return None
+    score = _compatibility_cache.get(get_cache_key(user1_id, user2_id))
+    if score is not None:
+        logger.debug(f"Cache hit for compatibility score: {user1_id} <-> {user2_id}")
+    return score
 
 def cache_compatibility_score(user1_id: int, user2_id: int, score: float) -> None:
     """Cache compatibility score with timestamp."""
-    cache_key = get_cache_key(user1_id, user2_id)
-    _compatibility_cache[cache_key] = {
-        'score': score,
-        'timestamp': time.time()
-    }
+    _compatibility_cache.set(get_cache_key(user1_id, user2_id), score)
     logger.debug(f"Cached compatibility score: {user1_id} <-> {user2_id} = {score}")
 
+def get_cached_compatibility_scores(user_id: int, other_ids: List[int]) -> List[Optional[float]]:
+    """Get cached scores between one user and many others in a single round trip."""
+    return _compatibility_cache.get_many([get_cache_key(user_id, other_id) for other_id in other_ids])
+
+def cache_compatibility_scores(user_id: int, scores: Dict[int, float]) -> None:
+    """Cache scores between one user and many others in a single round trip."""
+    _compatibility_cache.set_many({
+        get_cache_key(user_id, other_id): score for other_id, score in scores.items()
+    })
+    logger.debug(f"Cached {len(scores)} compatibility scores for user {user_id}")
+
 def invalidate_user_cache(user_id: int) -> None:
     """Invalidate all cache entries for a specific user."""
-    keys_to_remove = []
-    for cache_key in _compatibility_cache.keys():
-        if str(user_id) in cache_key:
-            keys_to_remove.append(cache_key)
-    
-    for key in keys_to_remove:
-        del _compatibility_cache[key]
-    
-    logger.debug(f"Invalidated {len(keys_to_remove)} cache entries for user {user_id}")
+    removed = _compatibility_cache.invalidate_user(user_id)
+    logger.debug(f"Invalidated {removed} cache entries for user {user_id}")
 
 def clear_cache() -> None:
     """Clear all cached data."""
@@ -59,22 +76,7 @@ def clear_cache() -> None:
 
 def get_cache_stats() -> Dict[str, Any]:
     """Get cache statistics."""
-    current_time = time.time()
-    active_entries = 0
-    expired_entries = 0
-    
-    for cached_data in _compatibility_cache.values():
-        if current_time - cached_data['timestamp'] < _cache_ttl:
-            active_entries += 1
-        else:
-            expired_entries += 1
-    
-    return {
-        'total_entries': len(_compatibility_cache),
-        'active_entries': active_entries,
-        'expired_entries': expired_entries,
-        'cache_ttl': _cache_ttl
-    }
+    return _compatibility_cache.stats()
 
 def cached_compatibility_score(func):
     """
@@ -85,13 +87,13 @@ def cached_compatibility_score(func):
     def wrapper(user1, user2):
         user1_id = getattr(user1, 'id', None)
         user2_id = getattr(user2, 'id', None)
-        
+
         if user1_id and user2_id:
             # Try to get from cache first
             cached_score = get_cached_compatibility_score(user1_id, user2_id)
             if cached_score is not None:
                 return cached_score
-            
+
             # Calculate and cache the result
             score = func(user1, user2)
             cache_compatibility_score(user1_id, user2_id, score)
@@ -99,5 +101,5 @@ def cached_compatibility_score(func):
         else:
             # Fallback to direct calculation if no IDs available
             return func(user1, user2)
-    
+
     return wrapper
@@ -0,0 +1,275 @@
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+from datetime import timedelta
+import os
+import select
+import threading
+import time
+import logging
+
+from sqlalchemy import select as sql_select
+
+from models import User, UserFeatures
+from .batch_scoring import FeatureBatch
+from .feature_store import FEATURE_COLUMNS, feature_batch_from_rows
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "candidate_pool"
+
+# Polling interval while LISTEN works (a safety net for missed
+# notifications) and when it does not (e.g. behind a transaction pooler)
+_poll_interval = float(os.getenv("CANDIDATE_POOL_POLL_INTERVAL", "30"))
+_fallback_poll_interval = float(os.getenv("CANDIDATE_POOL_FALLBACK_POLL_INTERVAL", "2"))
+# Full reload, which also picks up deletions the watermark poll cannot see
+_full_reload_interval = float(os.getenv("CANDIDATE_POOL_FULL_RELOAD_INTERVAL", "600"))
+# Rows committed by long transactions can carry an updated_at older than
+# the watermark; re-reading a short overlap catches them
+_watermark_overlap = timedelta(seconds=5)
+
+PoolKey = Tuple[Optional[str], int]  # (university, gender code)
+
+
+class CandidatePools:
+    """
+    Per-worker in-memory candidate pools, one per (university, gender).
+
+    Each pool holds the feature rows of its users, decoded into a
+    FeatureBatch on first read after a change, so feed and match
+    generation can score candidates without reading user rows from the
+    database.
+
+    The pools are kept current by a background thread that LISTENs on the
+    candidate_pool channel (fed by triggers on users and user_features)
+    and polls user_features.updated_at as a fallback.
+    """
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._rows: Dict[PoolKey, Dict[int, tuple]] = {}
+        self._keys: Dict[int, PoolKey] = {}
+        self._batches: Dict[PoolKey, FeatureBatch] = {}
+        self._gender_batches: Dict[int, FeatureBatch] = {}
+        self._watermark = None
+        self._last_full_reload = 0.0
+        self._listening = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.ready = False
+
+    def _query(self, *conditions):
+        return sql_select(
+            *FEATURE_COLUMNS, User.university, UserFeatures.updated_at
+        ).join(User, User.id == UserFeatures.user_id).where(*conditions)
+
+    def _store(self, rows, user_ids: Iterable[int] = ()) -> None:
+        """Place rows in their pools and drop user_ids that have no row. Caller holds the lock."""
+        seen = set()
+        changed_keys = set()
+        width = len(FEATURE_COLUMNS)
+        # Decode genders in one pass so a missing gender gets NULL_CODE
+        genders = feature_batch_from_rows([row[:width] for row in rows]).gender.tolist()
+
+        for row, gender in zip(rows, genders):
+            user_id = row[0]
+            seen.add(user_id)
+            key = (row[width], gender)
+            old_key = self._keys.get(user_id)
+            if old_key is not None and old_key != key:
+                del self._rows[old_key][user_id]
+                changed_keys.add(old_key)
+            self._rows.setdefault(key, {})[user_id] = tuple(row[:width])
+            self._keys[user_id] = key
+            changed_keys.add(key)
+            if self._watermark is None or row[width + 1] > self._watermark:
+                self._watermark = row[width + 1]
+
+        for user_id in set(user_ids) - seen:
+            old_key = self._keys.pop(user_id, None)
+            if old_key is not None:
+                del self._rows[old_key][user_id]
+                changed_keys.add(old_key)
+
+        for key in changed_keys:
+            self._batches.pop(key, None)
+            self._gender_batches.pop(key[1], None)
+
+    def reload(self) -> None:
+        """Load every pool from scratch."""
+        db = self._session_factory()
+        try:
+            rows = db.execute(self._query()).all()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._rows = {}
+            self._keys = {}
+            self._batches = {}
+            self._gender_batches = {}
+            self._watermark = None
+            self._store(rows)
+            self._last_full_reload = time.monotonic()
+            self.ready = True
+        logger.info(f"Loaded {len(rows)} users into {len(self._rows)} candidate pools")
+
+    def refresh_users(self, user_ids: Set[int]) -> None:
+        """Re-read the given users and move, update or drop them in the pools."""
+        if not user_ids:
+            return
+        db = self._session_factory()
+        try:
+            rows = db.execute(self._query(UserFeatures.user_id.in_(user_ids))).all()
+        finally:
+            db.close()
+        with self._lock:
+            self._store(rows, user_ids)
+        logger.debug(f"Refreshed {len(user_ids)} users in the candidate pools")
+
+    def poll(self) -> None:
+        """Apply feature rows changed since the watermark; reload fully when due."""
+        if time.monotonic() - self._last_full_reload > _full_reload_interval:
+            self.reload()
+            return
+        if self._watermark is None:
+            self.reload()
+            return
+
+        db = self._session_factory()
+        try:
+            rows = db.execute(
+                self._query(UserFeatures.updated_at > self._watermark - _watermark_overlap)
+            ).all()
+        finally:
+            db.close()
+        if rows:
+            with self._lock:
+                self._store(rows)
+
+    def _batch(self, key: PoolKey) -> FeatureBatch:
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = feature_batch_from_rows(list(self._rows.get(key, {}).values()))
+            self._batches[key] = batch
+        return batch
+
+    def candidates(self, gender_code: int, university: Optional[str] = None, any_university: bool = False) -> FeatureBatch:
+        """
+        Feature rows of every user with the given gender, at the given
+        university or (with any_university) at any university.
+        Like the SQL filters they replace (which compare with IS NULL), a
+        missing gender or university selects the users missing it too.
+        """
+        with self._lock:
+            if not any_university:
+                return self._batch((university, gender_code))
+
+            batch = self._gender_batches.get(gender_code)
+            if batch is None:
+                batch = FeatureBatch.concat([
+                    self._batch(key) for key in self._rows if key[1] == gender_code
+                ])
+                self._gender_batches[gender_code] = batch
+            return batch
+
+    def lookup(self, user_id: int) -> Optional[Tuple[Optional[str], dict]]:
+        """Return (university, features row) for a pooled user, or None."""
+        with self._lock:
+            key = self._keys.get(user_id)
+            if key is None:
+                return None
+            row = self._rows[key][user_id]
+        return key[0], feature_batch_from_rows([row]).row(0)
+
+    def start(self) -> None:
+        """Load the pools and start the background refresh thread."""
+        self.reload()
+        self._thread = threading.Thread(target=self._run, name="candidate-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                logger.warning(f"Candidate pool LISTEN unavailable, polling instead: {e}")
+            self._listening = False
+
+            # Poll until it is time to try LISTEN again
+            retry_at = time.monotonic() + _full_reload_interval
+            while not self._stop.is_set() and time.monotonic() < retry_at:
+                self._safe_poll()
+                self._stop.wait(_fallback_poll_interval)
+
+    def _safe_poll(self) -> None:
+        try:
+            self.poll()
+        except Exception as e:
+            logger.error(f"Candidate pool refresh failed: {e}")
+
+    def _listen(self) -> None:
+        bind = self._session_factory.kw["bind"]
+        connection = bind.raw_connection()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            self._listening = True
+            # Changes committed before LISTEN took effect
+            self._safe_poll()
+            logger.info(f"Listening for candidate pool changes on {NOTIFY_CHANNEL}")
+
+            next_poll = time.monotonic() + _poll_interval
+            while not self._stop.is_set():
+                timeout = max(0.0, min(1.0, next_poll - time.monotonic()))
+                if select.select([dbapi_connection], [], [], timeout)[0]:
+                    dbapi_connection.poll()
+                    user_ids = {int(notify.payload) for notify in dbapi_connection.notifies}
+                    dbapi_connection.notifies.clear()
+                    self.refresh_users(user_ids)
+                if time.monotonic() >= next_poll:
+                    self._safe_poll()
+                    next_poll = time.monotonic() + _poll_interval
+        finally:
+            # The connection was switched to autocommit; never hand it back to the pool
+            connection.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pools": len(self._rows),
+                "users": len(self._keys),
+                "listening": self._listening,
+            }
+
+
+_candidate_pools: Optional[CandidatePools] = None
+
+
+def start_candidate_pools(session_factory) -> CandidatePools:
+    """Create and start this worker's candidate pools."""
+    global _candidate_pools
+    if _candidate_pools is None:
+        pools = CandidatePools(session_factory)
+        pools.start()
+        _candidate_pools = pools
+    return _candidate_pools
+
+
+def stop_candidate_pools() -> None:
+    global _candidate_pools
+    if _candidate_pools is not None:
+        _candidate_pools.stop()
+        _candidate_pools = None
+
+
+def get_candidate_pools() -> Optional[CandidatePools]:
+    """Return this worker's candidate pools, or None if they are not running."""
+    pools = _candidate_pools
+    return pools if pools is not None and pools.ready else None
@@ -0,0 +1,251 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+import hashlib
+import os
+import threading
+import time
+import logging
+
+import jwt
+from fastapi import Depends, Header, HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session, load_only
+
+from db import get_db
+from models import User
+from .auth_utils import decode_access_token
+from .serializers import serialize_fields
+
+logger = logging.getLogger(__name__)
+
+# Verified claims are reused for up to the TTL (never past the token's own
+# expiry), so repeat requests with the same token skip the HMAC check
+_claims_cache_ttl = float(os.getenv("AUTH_CLAIMS_CACHE_TTL", "300"))
+_claims_cache_max_entries = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "10000"))
+# Slim current-user records; commits in this worker invalidate immediately,
+# the TTL bounds staleness from other workers
+_current_user_cache_ttl = float(os.getenv("CURRENT_USER_CACHE_TTL", "60"))
+_current_user_cache_max_entries = int(os.getenv("CURRENT_USER_CACHE_SIZE", "10000"))
+
+# Columns of the slim current-user record (the /auth/profile fields)
+CURRENT_USER_COLUMNS = (
+    "id", "email", "fullname", "profile_picture", "instagram", "university",
+    "age", "gender", "major", "year_of_study", "bio",
+)
+
+_SESSION_INFO_KEY = "current_user_changed_ids"
+
+
+class ClaimsCache:
+    """LRU of verified token claims keyed by the token's SHA-256, with a TTL."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._claims: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """
+        Return the token's verified claims.
+
+        Raises:
+            jwt.ExpiredSignatureError: If the token has expired
+            jwt.InvalidTokenError: If the token does not verify
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            cached = self._claims.get(key)
+            if cached is not None and now < cached[1]:
+                self._claims.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        claims = decode_access_token(token)
+        valid_until = now + self.ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            valid_until = min(valid_until, claims["exp"])
+        with self._lock:
+            self._claims[key] = (claims, valid_until)
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.max_entries:
+                self._claims.popitem(last=False)
+        return claims
+
+    def clear(self) -> None:
+        with self._lock:
+            self._claims.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._claims), "hits": self.hits, "misses": self.misses}
+
+
+class CurrentUserCache:
+    """LRU of slim current-user records with a TTL, safe to share between threads."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[int, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, user_id: int) -> Optional[Dict[str, Any]]:
+        """Return the user's record, or None if the user does not exist."""
+        now = time.time()
+        with self._lock:
+            cached = self._records.get(user_id)
+            if cached is not None and now - cached[1] < self.ttl:
+                self._records.move_to_end(user_id)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        user = db.query(User).options(
+            load_only(*(getattr(User, column) for column in CURRENT_USER_COLUMNS))
+        ).filter(User.id == user_id).first()
+        if user is None:
+            return None
+        record = serialize_fields(user, CURRENT_USER_COLUMNS)
+        with self._lock:
+            self._records[user_id] = (record, now)
+            self._records.move_to_end(user_id)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+        return record
+
+    def invalidate(self, user_ids) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                self._records.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._records), "hits": self.hits, "misses": self.misses}
+
+
+claims_cache = ClaimsCache(max_entries=_claims_cache_max_entries, ttl=_claims_cache_ttl)
+current_user_cache = CurrentUserCache(max_entries=_current_user_cache_max_entries, ttl=_current_user_cache_ttl)
+
+
+async def get_token_claims(Authorization: str = Header(None)) -> Dict[str, Any]:
+    """
+    Dependency: the verified claims of the request's Bearer token.
+
+    Raises:
+        HTTPException: 401 if the header is missing, malformed, expired or invalid
+    """
+    if not Authorization or not Authorization.startswith("Bearer "):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing or invalid token"
+        )
+    token = Authorization.split("Bearer ")[1]
+    try:
+        return claims_cache.decode(token)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has expired"
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+
+
+async def get_current_user_id(claims: Dict[str, Any] = Depends(get_token_claims)) -> int:
+    """
+    Dependency: the authenticated user's ID.
+
+    Raises:
+        HTTPException: 401 if the token carries no user ID
+    """
+    user_id = claims.get("user_id")
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload"
+        )
+    return user_id
+
+
+def get_current_user(
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+) -> User:
+    """
+    Dependency: the authenticated user's row, loaded in the request's
+    session for endpoints that read every column or modify the user.
+
+    Raises:
+        HTTPException: 404 if the user no longer exists
+    """
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return user
+
+
+def get_current_user_record(
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+) -> Dict[str, Any]:
+    """
+    Dependency: the cached slim record (CURRENT_USER_COLUMNS) of the
+    authenticated user, for endpoints that only display it.
+
+    Raises:
+        HTTPException: 404 if the user no longer exists
+    """
+    record = current_user_cache.get(db, user_id)
+    if record is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return record
+
+
+def _collect_changed_users(session, flush_context) -> None:
+    changed: Set[int] = {
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, User)
+    }
+    if changed:
+        session.info.setdefault(_SESSION_INFO_KEY, set()).update(changed)
+
+
+def _invalidate_after_commit(session) -> None:
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if user_ids:
+        current_user_cache.invalidate(user_ids)
+
+
+def _discard_after_rollback(session) -> None:
+    session.info.pop(_SESSION_INFO_KEY, None)
+
+
+def install_current_user_invalidation(session_factory) -> None:
+    """
+    Drop cached current-user records when a session created by
+    session_factory commits a change to their user rows.
+    """
+    if not event.contains(session_factory, "after_flush", _collect_changed_users):
+        event.listen(session_factory, "after_flush", _collect_changed_users)
+        event.listen(session_factory, "after_commit", _invalidate_after_commit)
+        event.listen(session_factory, "after_rollback", _discard_after_rollback)
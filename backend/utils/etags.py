@@ -0,0 +1,83 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+import hashlib
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import UserVersion
+
+# Part of every ETag; bump it when a response shape changes, so clients
+# holding a tag from the old shape refetch
+ETAG_SCHEMA = 1
+
+# Per-user responses: revalidate on every use, never store in shared caches
+_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def _versions_query(user_ids: Iterable[int]):
+    return select(
+        UserVersion.user_id, UserVersion.profile_version, UserVersion.matches_version
+    ).where(UserVersion.user_id.in_(list(user_ids)))
+
+
+def get_user_versions(db: Session, user_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """
+    (profile_version, matches_version) of each user in one primary-key
+    read. Users that do not exist are missing from the result.
+    """
+    return {row.user_id: (row.profile_version, row.matches_version) for row in db.execute(_versions_query(user_ids))}
+
+
+async def get_user_versions_async(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """get_user_versions on an async session."""
+    result = await db.execute(_versions_query(user_ids))
+    return {row.user_id: (row.profile_version, row.matches_version) for row in result}
+
+
+def make_etag(*parts: Any) -> str:
+    """A strong ETag identifying a response by the versions and parameters it depends on."""
+    digest = hashlib.sha256("|".join(str(part) for part in (ETAG_SCHEMA,) + parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def matches_etag(versions: Dict[int, Tuple[int, int]], user_id: int, *params: Any) -> Optional[str]:
+    """ETag of a user's match list, or None if the user does not exist."""
+    if user_id not in versions:
+        return None
+    return make_etag("matches", user_id, versions[user_id][1], *params)
+
+
+def profile_etag(versions: Dict[int, Tuple[int, int]], user_id: int, viewer_id: int, *params: Any) -> Optional[str]:
+    """
+    ETag of user_id's profile as seen by viewer_id, or None if either
+    user does not exist. The viewer's own version is part of it because
+    the compatibility score depends on the viewer's row.
+    """
+    if user_id not in versions or viewer_id not in versions:
+        return None
+    return make_etag("profile", user_id, versions[user_id][0], viewer_id, versions[viewer_id][0], *params)
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """Whether the request's If-None-Match already names etag (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if etag is None or not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().replace("W/", "", 1) == etag for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    """An empty 304 response for a client that already holds etag."""
+    return Response(status_code=304, headers={"ETag": etag, **_CACHE_HEADERS})
+
+
+def with_etag(response: Response, etag: Optional[str]) -> Response:
+    """Attach etag and the revalidation headers to a full response."""
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers.update(_CACHE_HEADERS)
+    return response
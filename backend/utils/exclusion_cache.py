@@ -0,0 +1,285 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+from sqlalchemy import and_, case, func, or_, tuple_
+from sqlalchemy.orm import Session
+
+from models import RoommateMatch, MatchStatus, UserPreferences
+
+logger = logging.getLogger(__name__)
+
+# Entries are written through by this worker's swipes; the TTL bounds how
+# long swipes handled by other workers can go unseen
+_exclusion_cache_ttl = float(os.getenv("EXCLUSION_CACHE_TTL", "60"))
+_exclusion_cache_max_entries = int(os.getenv("EXCLUSION_CACHE_SIZE", "10000"))
+
+_EMPTY_IDS = np.empty(0, dtype=np.int64)
+_EMPTY_TIMES = np.empty(0, dtype=np.float64)
+
+
+def _sorted_lookup(sorted_ids: np.ndarray, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (found mask, positions) of ids in a sorted ID array."""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=bool), np.zeros(len(ids), dtype=np.intp)
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return sorted_ids[positions] == ids, positions
+
+
+class ExclusionSet:
+    """
+    The users left out of one user's feed, as sorted ID arrays.
+
+    Liked (pending) and matched users are always excluded. Rejected users
+    are kept with their rejection time and excluded only while the
+    viewer's rejection cooldown runs, so they come back without a reload.
+    Instances are immutable; updates return a new set.
+    """
+
+    __slots__ = ("excluded_ids", "rejected_ids", "rejected_at", "cooldown_seconds", "loaded_at")
+
+    def __init__(
+        self,
+        excluded_ids: np.ndarray,
+        rejected_ids: np.ndarray,
+        rejected_at: np.ndarray,
+        cooldown_seconds: float,
+        loaded_at: float
+    ):
+        self.excluded_ids = excluded_ids
+        self.rejected_ids = rejected_ids
+        self.rejected_at = rejected_at  # Epoch seconds, parallel to rejected_ids
+        self.cooldown_seconds = cooldown_seconds
+        self.loaded_at = loaded_at
+
+    @classmethod
+    def build(cls, entries: Dict[int, Optional[float]], cooldown_seconds: float, loaded_at: float) -> "ExclusionSet":
+        """Build a set from {other_id: rejected_at or None for always excluded}."""
+        excluded = sorted(other_id for other_id, rejected_at in entries.items() if rejected_at is None)
+        rejected = sorted((other_id, rejected_at) for other_id, rejected_at in entries.items() if rejected_at is not None)
+        return cls(
+            np.array(excluded, dtype=np.int64) if excluded else _EMPTY_IDS,
+            np.array([other_id for other_id, _ in rejected], dtype=np.int64) if rejected else _EMPTY_IDS,
+            np.array([rejected_at for _, rejected_at in rejected], dtype=np.float64) if rejected else _EMPTY_TIMES,
+            cooldown_seconds,
+            loaded_at
+        )
+
+    def entries(self) -> Dict[int, Optional[float]]:
+        entries: Dict[int, Optional[float]] = dict.fromkeys(self.excluded_ids.tolist())
+        entries.update(zip(self.rejected_ids.tolist(), self.rejected_at.tolist()))
+        return entries
+
+    def excludes(self, ids: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        """Boolean mask over ids of the users currently excluded."""
+        now = time.time() if now is None else now
+        excluded, _ = _sorted_lookup(self.excluded_ids, ids)
+        rejected, positions = _sorted_lookup(self.rejected_ids, ids)
+        if len(self.rejected_ids):
+            in_cooldown = self.rejected_at > now - self.cooldown_seconds
+            excluded |= rejected & in_cooldown[positions]
+        return excluded
+
+    def __len__(self) -> int:
+        return len(self.excluded_ids) + len(self.rejected_ids)
+
+
+def _always_excluded(viewer_id):
+    """
+    Whether a pair row always excludes the other user from viewer_id's
+    feed (viewer_id may be a column). Mirrors the feed's exclusion rules.
+    """
+    viewer_is_user1 = RoommateMatch.user1_id == viewer_id
+    viewer_liked = case((viewer_is_user1, RoommateMatch.user1_liked), else_=RoommateMatch.user2_liked)
+    other_liked = case((viewer_is_user1, RoommateMatch.user2_liked), else_=RoommateMatch.user1_liked)
+    return or_(
+        RoommateMatch.match_status == MatchStatus.matched,
+        and_(
+            RoommateMatch.match_status == MatchStatus.pending,
+            viewer_liked == True,
+            other_liked == False
+        )
+    )
+
+
+def _rejected_age():
+    """Seconds since a pair row was rejected, NULL unless it is a rejection."""
+    return case(
+        (
+            RoommateMatch.match_status == MatchStatus.rejected,
+            func.extract("epoch", func.localtimestamp() - RoommateMatch.rejected_at)
+        ),
+        else_=None
+    )
+
+
+def _entry(always_excluded: bool, rejected_age: Optional[float], now: float) -> Tuple[bool, Optional[float]]:
+    """(excluded at all, rejected_at) for one side of a pair row."""
+    if always_excluded:
+        return True, None
+    if rejected_age is not None:
+        return True, now - float(rejected_age)
+    return False, None
+
+
+class ExclusionCache:
+    """LRU of per-user ExclusionSets with a TTL, safe to share between threads."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sets: "OrderedDict[int, ExclusionSet]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, user_id: int) -> ExclusionSet:
+        """Return the user's exclusion set, loading it from roommate_matches if needed."""
+        now = time.time()
+        with self._lock:
+            exclusion_set = self._sets.get(user_id)
+            if exclusion_set is not None and now - exclusion_set.loaded_at < self.ttl:
+                self._sets.move_to_end(user_id)
+                self.hits += 1
+                return exclusion_set
+            self.misses += 1
+
+        return self.reload(db, user_id)
+
+    def reload(self, db: Session, user_id: int) -> ExclusionSet:
+        """Load the user's exclusion set from roommate_matches and cache it."""
+        exclusion_set = self._load(db, user_id)
+        with self._lock:
+            self._sets[user_id] = exclusion_set
+            self._sets.move_to_end(user_id)
+            while len(self._sets) > self.max_entries:
+                self._sets.popitem(last=False)
+        return exclusion_set
+
+    def _load(self, db: Session, user_id: int) -> ExclusionSet:
+        other_id = case(
+            (RoommateMatch.user1_id == user_id, RoommateMatch.user2_id),
+            else_=RoommateMatch.user1_id
+        )
+        cooldown_days = db.query(
+            func.coalesce(UserPreferences.rejection_cooldown, 30)
+        ).filter(UserPreferences.user_id == user_id).scalar()
+        now = time.time()
+        # Only pairs in idx_match_exclusion can exclude anyone
+        rows = db.query(
+            other_id, _always_excluded(user_id).label("always_excluded"), _rejected_age().label("rejected_age")
+        ).filter(
+            or_(RoommateMatch.user1_id == user_id, RoommateMatch.user2_id == user_id),
+            or_(
+                RoommateMatch.match_status != MatchStatus.pending,
+                RoommateMatch.user1_liked == True,
+                RoommateMatch.user2_liked == True
+            )
+        ).all()
+
+        entries = {}
+        for row in rows:
+            excluded, rejected_at = _entry(row.always_excluded, row.rejected_age, now)
+            if excluded:
+                entries[row[0]] = rejected_at
+        cooldown_days = 30 if cooldown_days is None else cooldown_days
+        logger.debug(f"Loaded {len(entries)} exclusions for user {user_id}")
+        return ExclusionSet.build(entries, cooldown_days * 86400.0, now)
+
+    def record_pairs(self, db: Session, pairs: Iterable[Tuple[int, int]]) -> None:
+        """
+        Write the current state of the given (user_id, other_id) pairs into
+        the cached sets of both users, after the swipe has been committed.
+        Users without a cached set are skipped; they load on next read.
+        Every pair is read in one query.
+        """
+        pairs = list(pairs)
+        with self._lock:
+            cached = {
+                viewer_id: self._sets[viewer_id]
+                for pair in pairs for viewer_id in pair
+                if viewer_id in self._sets
+            }
+        if not cached:
+            return
+
+        keys = {
+            (min(user_id, other_id), max(user_id, other_id))
+            for user_id, other_id in pairs
+            if user_id in cached or other_id in cached
+        }
+        rows = db.query(
+            RoommateMatch.user1_id,
+            RoommateMatch.user2_id,
+            _always_excluded(RoommateMatch.user1_id).label("user1_excluded"),
+            _always_excluded(RoommateMatch.user2_id).label("user2_excluded"),
+            _rejected_age().label("rejected_age")
+        ).filter(
+            tuple_(RoommateMatch.user1_id, RoommateMatch.user2_id).in_(keys)
+        ).all()
+        rows_by_pair = {(row.user1_id, row.user2_id): row for row in rows}
+
+        now = time.time()
+        entries_by_viewer = {viewer_id: exclusion_set.entries() for viewer_id, exclusion_set in cached.items()}
+        for user1_id, user2_id in keys:
+            row = rows_by_pair.get((user1_id, user2_id))
+            for viewer_id, viewed_id, side in ((user1_id, user2_id, "user1_excluded"), (user2_id, user1_id, "user2_excluded")):
+                entries = entries_by_viewer.get(viewer_id)
+                if entries is None:
+                    continue
+                entries.pop(viewed_id, None)
+                if row is not None:
+                    excluded, rejected_at = _entry(getattr(row, side), row.rejected_age, now)
+                    if excluded:
+                        entries[viewed_id] = rejected_at
+
+        with self._lock:
+            for viewer_id, exclusion_set in cached.items():
+                # Skip if the set was dropped or reloaded meanwhile
+                if self._sets.get(viewer_id) is exclusion_set:
+                    self._sets[viewer_id] = ExclusionSet.build(
+                        entries_by_viewer[viewer_id], exclusion_set.cooldown_seconds, exclusion_set.loaded_at
+                    )
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._sets.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._sets),
+                "exclusions": sum(len(exclusion_set) for exclusion_set in self._sets.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+exclusion_cache = ExclusionCache(max_entries=_exclusion_cache_max_entries, ttl=_exclusion_cache_ttl)
+
+
+def get_exclusion_set(db: Session, user_id: int) -> ExclusionSet:
+    """Return the set of users currently left out of the user's feed."""
+    return exclusion_cache.get(db, user_id)
+
+
+def load_exclusion_set(db: Session, user_id: int) -> ExclusionSet:
+    """
+    The user's exclusion set read from roommate_matches, bypassing the
+    cache. For results that outlive the cache TTL, like stored feeds: a
+    cached set misses swipes handled by other workers for up to the TTL.
+    """
+    return exclusion_cache.reload(db, user_id)
+
+
+def record_swipes(db: Session, pairs: Iterable[Tuple[int, int]]) -> None:
+    """Update cached exclusion sets after swipes on the given pairs were committed."""
+    exclusion_cache.record_pairs(db, pairs)
@@ -0,0 +1,271 @@
+from typing import Any, Dict, Iterable, Optional, Sequence
+import logging
+
+import numpy as np
+from sqlalchemy import func, select, union
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+
+from models import CategoryCode, User, UserFeatures
+from utils.batch_scoring import (
+    FeatureBatch, NULL_CODE, WILDCARD_CATEGORY_CODES,
+    category_values, crc_category_code, encode_users, register_category_codes, unregistered_categories,
+)
+from utils.cache_invalidation import mark_user_changed
+
+logger = logging.getLogger(__name__)
+
+# FeatureBatch column -> UserFeatures column for the value-carrying fields
+_VALUE_COLUMNS = {
+    "gender": "gender_code",
+    "cleanliness": "cleanliness_level",
+    "sleep_minutes": "sleep_minutes",
+    "wake_minutes": "wake_minutes",
+    "guest_policy": "guest_policy_code",
+    "room_type": "room_type_code",
+    "religious": "religious_code",
+    "dietary": "dietary_code",
+    "age": "age",
+    "social": "social_code",
+    "budget": "budget_range",
+}
+
+# Boolean preferences packed into UserFeatures.lifestyle_flags
+_FLAG_BITS = {"smoking": 1, "drinking": 2, "pet": 4, "music": 8}
+
+# One null_mask bit per feature (everything except the id column)
+_NULL_BITS = {name: 1 << bit for bit, name in enumerate(FeatureBatch.COLUMNS[1:])}
+
+# Column order used for bulk loads; feature_batch_from_rows depends on it
+FEATURE_COLUMNS = (
+    UserFeatures.user_id,
+    *(getattr(UserFeatures, column) for column in _VALUE_COLUMNS.values()),
+    UserFeatures.lifestyle_flags,
+    UserFeatures.null_mask,
+)
+
+
+def feature_present(name: str):
+    """SQL condition: the stored feature (a FeatureBatch column name) is not missing."""
+    return UserFeatures.null_mask.op("&")(_NULL_BITS[name]) == 0
+
+
+def feature_value(name: str):
+    """
+    SQL expression for a stored feature, encoded as in FeatureBatch.
+    Only meaningful where feature_present(name) holds.
+    """
+    if name in _FLAG_BITS:
+        return func.sign(UserFeatures.lifestyle_flags.op("&")(_FLAG_BITS[name]))
+    return getattr(UserFeatures, _VALUE_COLUMNS[name])
+
+
+def _is_missing(name: str, value) -> bool:
+    if name in FeatureBatch.NUMERIC_COLUMNS:
+        return bool(np.isnan(value))
+    return value == NULL_CODE
+
+
+def _assign_category_code(conn, value: str) -> int:
+    """
+    Register value at its CRC32 code, or the next free code after it when
+    another value holds that one. Commits each insert so other processes
+    see the assignment at once.
+    """
+    code = crc_category_code(value)
+    while True:
+        assigned = conn.execute(
+            insert(CategoryCode).values(value=value, code=code).on_conflict_do_nothing().returning(CategoryCode.code)
+        ).scalar()
+        conn.commit()
+        if assigned is None:
+            # Either value was registered concurrently or code is taken
+            assigned = conn.execute(select(CategoryCode.code).where(CategoryCode.value == value)).scalar()
+        if assigned is not None:
+            return assigned
+        code = (code + 1) & 0x7FFFFFFF
+
+
+def ensure_category_codes(db: Session, values: Iterable[Optional[str]]) -> None:
+    """
+    Load, or assign, the codes of the category values this process has not
+    seen yet, so category_code can encode them.
+
+    Runs on its own connection rather than in db's transaction: a code in
+    use by this process must be committed, or a rollback would let another
+    process give it to a different value.
+    """
+    missing = unregistered_categories(values)
+    if not missing:
+        return
+
+    with db.get_bind().connect() as conn:
+        conn.execute(
+            insert(CategoryCode).on_conflict_do_nothing(),
+            [{"value": value, "code": code} for value, code in WILDCARD_CATEGORY_CODES.items()],
+        )
+        conn.commit()
+        codes = dict(conn.execute(
+            select(CategoryCode.value, CategoryCode.code).where(
+                CategoryCode.value.in_(missing | set(WILDCARD_CATEGORY_CODES))
+            )
+        ).all())
+        for value, code in WILDCARD_CATEGORY_CODES.items():
+            if codes[value] != code:
+                raise RuntimeError(f"category_codes holds {codes[value]} for {value!r}, expected {code}")
+        for value in sorted(missing - codes.keys()):
+            codes[value] = _assign_category_code(conn, value)
+
+    register_category_codes(codes)
+
+
+def encode_users_with_codes(db: Session, users: Sequence[User]) -> FeatureBatch:
+    """encode_users, loading or assigning the users' category codes first."""
+    ensure_category_codes(db, category_values(users))
+    return encode_users(users)
+
+
+def encode_feature_row(user: User) -> Dict[str, Any]:
+    """Encode a user into the column values of its UserFeatures row."""
+    features = encode_users([user]).row(0)
+    row = {"user_id": user.id, "lifestyle_flags": 0, "null_mask": 0}
+
+    for name, column in _VALUE_COLUMNS.items():
+        value = features[name]
+        if _is_missing(name, value):
+            row["null_mask"] |= _NULL_BITS[name]
+            row[column] = 0
+        else:
+            row[column] = int(value)
+
+    for name, bit in _FLAG_BITS.items():
+        value = features[name]
+        if value == NULL_CODE:
+            row["null_mask"] |= _NULL_BITS[name]
+        elif value:
+            row["lifestyle_flags"] |= bit
+
+    return row
+
+
+def sync_user_features(db: Session, user: User) -> None:
+    """
+    Upsert the precomputed feature row for a user.
+
+    Call after the user's profile or preferences have been written and
+    refreshed; the caller is responsible for committing.
+    """
+    ensure_category_codes(db, category_values([user]))
+    row = encode_feature_row(user)
+    updates = {key: value for key, value in row.items() if key != "user_id"}
+    updates["updated_at"] = func.now()
+    db.execute(
+        insert(UserFeatures).values(**row).on_conflict_do_update(
+            index_elements=[UserFeatures.user_id],
+            set_=updates,
+        )
+    )
+    # Cached scores are dropped again once the new features are committed,
+    # not only when the users row is
+    mark_user_changed(db, user.id)
+
+
+def feature_batch_from_rows(rows) -> FeatureBatch:
+    """Decode rows selected with FEATURE_COLUMNS into a FeatureBatch."""
+    if rows:
+        data = np.array([tuple(row) for row in rows], dtype=np.int64)
+    else:
+        data = np.empty((0, len(FEATURE_COLUMNS)), dtype=np.int64)
+
+    null_mask = data[:, -1]
+    flags = data[:, -2]
+    columns = {"ids": data[:, 0]}
+
+    for index, name in enumerate(_VALUE_COLUMNS, start=1):
+        missing = (null_mask & _NULL_BITS[name]) != 0
+        values = data[:, index]
+        if name in FeatureBatch.NUMERIC_COLUMNS:
+            columns[name] = np.where(missing, np.nan, values.astype(np.float64))
+        else:
+            columns[name] = np.where(missing, NULL_CODE, values)
+
+    for name, bit in _FLAG_BITS.items():
+        missing = (null_mask & _NULL_BITS[name]) != 0
+        columns[name] = np.where(missing, NULL_CODE, (flags & bit) != 0)
+
+    return FeatureBatch(**columns)
+
+
+def load_user_features(db: Session, user: User) -> Dict[str, Any]:
+    """
+    Load a single user's features as a FeatureBatch row.
+    Falls back to encoding the ORM object (and storing the result) if the
+    row has not been created yet.
+    """
+    row = db.query(*FEATURE_COLUMNS).filter(UserFeatures.user_id == user.id).first()
+    if row is not None:
+        return feature_batch_from_rows([row]).row(0)
+
+    logger.info(f"No feature row for user {user.id}, creating it")
+    sync_user_features(db, user)
+    db.commit()
+    return encode_users_with_codes(db, [user]).row(0)
+
+
+def backfill_user_features(db: Session, batch_size: int = 1000) -> int:
+    """Create feature rows for users that do not have one yet. Returns the count."""
+    created = 0
+    while True:
+        users = db.query(User).outerjoin(
+            UserFeatures, UserFeatures.user_id == User.id
+        ).filter(
+            UserFeatures.user_id.is_(None)
+        ).order_by(User.id).limit(batch_size).all()
+
+        if not users:
+            break
+
+        ensure_category_codes(db, category_values(users))
+        db.execute(
+            insert(UserFeatures).on_conflict_do_nothing(),
+            [encode_feature_row(user) for user in users],
+        )
+        db.commit()
+        created += len(users)
+
+    logger.info(f"Backfilled {created} user feature rows")
+    return created
+
+
+def reencode_colliding_categories(db: Session) -> int:
+    """
+    Register every category value in use and rewrite the feature rows that
+    hold a value whose code is not its CRC32. Rows written before the
+    category_codes table existed stored plain CRC32 codes, which collide
+    for such values. Returns the number of rows rewritten.
+    """
+    in_use = union(*(
+        select(column).where(column.isnot(None))
+        for column in (User.guest_policy, User.room_type_preference, User.religious_preference, User.dietary_restrictions)
+    ))
+    ensure_category_codes(db, db.execute(in_use).scalars().all())
+
+    moved = [
+        value for value, code in db.query(CategoryCode.value, CategoryCode.code).all()
+        if code != crc_category_code(value)
+    ]
+    if not moved:
+        return 0
+
+    users = db.query(User).filter(
+        User.guest_policy.in_(moved)
+        | User.room_type_preference.in_(moved)
+        | User.religious_preference.in_(moved)
+        | User.dietary_restrictions.in_(moved)
+    ).all()
+    for user in users:
+        sync_user_features(db, user)
+    db.commit()
+
+    logger.info(f"Re-encoded {len(users)} user feature rows with colliding category codes")
+    return len(users)
@@ -0,0 +1,167 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import timedelta
+import os
+import logging
+
+import numpy as np
+from sqlalchemy import or_, delete, func, select, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+
+from models import UserFeed, UserFeedState
+from .batch_scoring import top_k_order
+
+logger = logging.getLogger(__name__)
+
+# Candidates stored per user; deeper pages fall back to live scoring
+FEED_SIZE = int(os.getenv("USER_FEED_SIZE", "500"))
+# Feeds older than this are rebuilt on read, so users whose rejection
+# cooldown has expired come back even if nothing else changed
+FEED_MAX_AGE = int(os.getenv("USER_FEED_MAX_AGE", str(24 * 3600)))
+
+# First key of the pg_advisory_xact_lock pairs serializing feed writes
+_USER_FEED_LOCK = 1
+_CANDIDATE_ENTRIES_LOCK = 2
+
+
+def _insert_feed_rows(db: Session, rows: List[Dict]) -> None:
+    # Upsert, so a row written by a concurrent rewrite of the other kind
+    # (user feed vs candidate entries) cannot fail the insert
+    if rows:
+        stmt = insert(UserFeed)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[UserFeed.user_id, UserFeed.candidate_id],
+                set_={"compatibility_score": stmt.excluded.compatibility_score},
+            ),
+            rows
+        )
+
+
+def replace_user_feed(db: Session, user_id: int, ids: np.ndarray, scores: np.ndarray) -> None:
+    """
+    Replace a user's stored feed with the top FEED_SIZE of their eligible
+    candidates. The caller is responsible for committing.
+
+    When the candidates do not all fit, the score of the first one left out
+    becomes the feed's cutoff and only candidates scoring strictly above it
+    are stored, so ties at the boundary are never split.
+
+    Concurrent rebuilds of the same feed are serialized by a transaction
+    level advisory lock; the later one wins.
+    """
+    order = top_k_order(ids, scores, FEED_SIZE + 1)
+    cutoff_score = None
+    if len(order) > FEED_SIZE:
+        cutoff_score = float(scores[order[FEED_SIZE]])
+        order = order[:FEED_SIZE]
+        order = order[scores[order] > cutoff_score]
+
+    db.execute(select(func.pg_advisory_xact_lock(_USER_FEED_LOCK, user_id)))
+    db.execute(delete(UserFeed).where(UserFeed.user_id == user_id))
+    rows = [
+        {"user_id": user_id, "candidate_id": candidate_id, "compatibility_score": score}
+        for candidate_id, score in zip(ids[order].tolist(), scores[order].tolist())
+    ]
+    _insert_feed_rows(db, rows)
+
+    db.execute(
+        insert(UserFeedState).values(user_id=user_id, cutoff_score=cutoff_score).on_conflict_do_update(
+            index_elements=[UserFeedState.user_id],
+            set_={"cutoff_score": cutoff_score, "built_at": func.now()},
+        )
+    )
+    logger.debug(f"Stored {len(rows)} feed entries for user {user_id} (cutoff {cutoff_score})")
+
+
+def replace_candidate_entries(db: Session, candidate_id: int, scores: Dict[int, float]) -> None:
+    """
+    Replace every stored feed entry for a candidate with the given
+    {viewer_id: score} entries. The caller is responsible for committing.
+    Concurrent rewrites for the same candidate are serialized like
+    replace_user_feed.
+    """
+    db.execute(select(func.pg_advisory_xact_lock(_CANDIDATE_ENTRIES_LOCK, candidate_id)))
+    db.execute(delete(UserFeed).where(UserFeed.candidate_id == candidate_id))
+    rows = [
+        {"user_id": viewer_id, "candidate_id": candidate_id, "compatibility_score": score}
+        for viewer_id, score in scores.items()
+    ]
+    _insert_feed_rows(db, rows)
+
+
+def remove_feed_entries(db: Session, pairs: Iterable[Tuple[int, int]]) -> None:
+    """
+    Drop (user_id, candidate_id) entries, e.g. after a swipe.
+    The caller is responsible for committing.
+    """
+    pairs = list(pairs)
+    if pairs:
+        db.execute(delete(UserFeed).where(tuple_(UserFeed.user_id, UserFeed.candidate_id).in_(pairs)))
+
+
+def _feed_state_query(user_id: int, max_age: Optional[int] = None):
+    query = select(UserFeedState).where(UserFeedState.user_id == user_id)
+    if max_age is not None:
+        query = query.where(UserFeedState.built_at > func.now() - timedelta(seconds=max_age))
+    return query.limit(1)
+
+
+def get_feed_state(db: Session, user_id: int, max_age: Optional[int] = None) -> Optional[UserFeedState]:
+    """
+    Return the user's feed state, or None if their feed has not been built
+    (or was built more than max_age seconds ago).
+    """
+    return db.execute(_feed_state_query(user_id, max_age)).scalar()
+
+
+async def get_feed_state_async(db: AsyncSession, user_id: int, max_age: Optional[int] = None) -> Optional[UserFeedState]:
+    """get_feed_state on an async session."""
+    return (await db.execute(_feed_state_query(user_id, max_age))).scalar()
+
+
+def _feed_page_query(user_id: int, limit: int, offset: int = 0, after: Optional[Tuple[float, int]] = None):
+    query = select(UserFeed.candidate_id, UserFeed.compatibility_score).where(
+        UserFeed.user_id == user_id
+    )
+    if after is not None:
+        after_score, after_id = after
+        query = query.where(
+            UserFeed.compatibility_score <= after_score,
+            or_(
+                UserFeed.compatibility_score < after_score,
+                UserFeed.candidate_id > after_id
+            )
+        )
+    return query.order_by(
+        UserFeed.compatibility_score.desc(), UserFeed.candidate_id
+    ).offset(offset).limit(limit)
+
+
+def read_feed(
+    db: Session,
+    user_id: int,
+    limit: int,
+    offset: int = 0,
+    after: Optional[Tuple[float, int]] = None
+) -> List[Tuple[int, float]]:
+    """
+    Read a page of (candidate_id, score) from a stored feed in feed order,
+    starting at offset or strictly after the (score, candidate_id) in after.
+    Served by a range scan of idx_user_feed_rank.
+    """
+    rows = db.execute(_feed_page_query(user_id, limit, offset, after)).all()
+    return [(row.candidate_id, row.compatibility_score) for row in rows]
+
+
+async def read_feed_async(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    offset: int = 0,
+    after: Optional[Tuple[float, int]] = None
+) -> List[Tuple[int, float]]:
+    """read_feed on an async session."""
+    rows = (await db.execute(_feed_page_query(user_id, limit, offset, after))).all()
+    return [(row.candidate_id, row.compatibility_score) for row in rows]
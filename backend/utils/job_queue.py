@@ -0,0 +1,175 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import logging
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import PendingMatchRefresh, User
+
+logger = logging.getLogger(__name__)
+
+
+class MatchRefreshQueue:
+    """
+    In-process background queue for per-user match score recomputation.
+
+    - Deduplication: at most one job per user is queued at a time. If the user
+      edits again while their job is running, exactly one follow-up run is
+      scheduled, so a burst of edits collapses into at most two runs.
+    - Bounded concurrency: jobs run on a fixed-size thread pool.
+    - Retries: failed jobs are retried with exponential backoff up to
+      max_attempts before being reported as failed.
+
+    Status for the most recent max_tracked_users users is kept for the
+    status endpoint. Deduplication does not depend on it: users with a
+    queued, retrying or running job are tracked separately until the job
+    finishes, so evicting their status never lets a second job start.
+
+    shutdown() drains for a bounded time and returns the users whose jobs
+    did not finish, for save_pending_refreshes.
+    """
+
+    def __init__(
+        self,
+        job: Callable[[int], Any],
+        max_workers: int = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+        max_tracked_users: int = 10_000
+    ):
+        self._job = job
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="match-refresh")
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._max_tracked_users = max_tracked_users
+        self._lock = threading.Lock()
+        self._statuses: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # State of every user whose job has not finished; never evicted
+        self._active: Dict[int, str] = {}
+        self._rerun_requested = set()
+        # Users turned away after shutdown began, e.g. a follow-up run
+        self._rejected: Set[int] = set()
+        self._idle = threading.Condition(self._lock)
+        self._shutdown = False
+
+    def _set_status(self, user_id: int, **fields) -> Dict[str, Any]:
+        status = self._statuses.pop(user_id, {"user_id": user_id})
+        status.update(fields)
+        status["updated_at"] = time.time()
+        self._statuses[user_id] = status
+        while len(self._statuses) > self._max_tracked_users:
+            self._statuses.popitem(last=False)
+        return dict(status)
+
+    def _set_active(self, user_id: int, state: str, **fields) -> Dict[str, Any]:
+        self._active[user_id] = state
+        return self._set_status(user_id, state=state, **fields)
+
+    def _finish(self, user_id: int, state: str, **fields) -> bool:
+        """Record a finished job; returns whether a rerun was requested."""
+        self._active.pop(user_id, None)
+        if not self._active:
+            self._idle.notify_all()
+        self._set_status(user_id, state=state, **fields)
+        rerun = user_id in self._rerun_requested
+        self._rerun_requested.discard(user_id)
+        return rerun
+
+    def _current_status(self, user_id: int) -> Dict[str, Any]:
+        status = self._statuses.get(user_id)
+        return dict(status) if status else {"user_id": user_id, "state": self._active[user_id]}
+
+    def enqueue(self, user_id: int) -> Dict[str, Any]:
+        """Schedule a refresh for user_id unless one is already pending."""
+        with self._lock:
+            state = self._active.get(user_id)
+
+            if state == "queued" or state == "retrying":
+                return self._current_status(user_id)
+            if state == "running":
+                self._rerun_requested.add(user_id)
+                return self._current_status(user_id)
+            if self._shutdown:
+                self._rejected.add(user_id)
+                return self._set_status(user_id, state="rejected", error="Queue is shut down")
+
+            status = self._set_active(user_id, "queued", attempts=0, error=None, enqueued_at=time.time())
+
+        self._executor.submit(self._run, user_id, 1)
+        return status
+
+    def _run(self, user_id: int, attempt: int) -> None:
+        with self._lock:
+            self._set_active(user_id, "running", attempts=attempt)
+
+        try:
+            self._job(user_id)
+        except Exception as e:
+            logger.error(f"Match refresh for user {user_id} failed (attempt {attempt}): {e}")
+            with self._lock:
+                if attempt < self._max_attempts and not self._shutdown:
+                    self._set_active(user_id, "retrying", error=str(e))
+                    delay = self._retry_delay * (2 ** (attempt - 1))
+                    timer = threading.Timer(delay, self._retry, args=(user_id, attempt + 1))
+                    timer.daemon = True
+                    timer.start()
+                    return
+                rerun = self._finish(user_id, "failed", error=str(e))
+        else:
+            with self._lock:
+                rerun = self._finish(user_id, "succeeded", error=None, completed_at=time.time())
+
+        if rerun:
+            self.enqueue(user_id)
+
+    def _retry(self, user_id: int, attempt: int) -> None:
+        try:
+            self._executor.submit(self._run, user_id, attempt)
+        except RuntimeError:
+            # Executor was shut down while waiting for the retry
+            with self._lock:
+                self._finish(user_id, "failed", error="Queue is shut down")
+
+    def status(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            status = self._statuses.get(user_id)
+            return dict(status) if status else None
+
+    def shutdown(self, timeout: float = 0) -> List[int]:
+        """
+        Stop accepting jobs and wait up to timeout seconds for the queued,
+        retrying and running ones to finish.
+
+        Returns:
+            Users whose job did not finish or was turned away meanwhile
+        """
+        with self._lock:
+            self._shutdown = True
+            self._idle.wait_for(lambda: not self._active, timeout)
+            unfinished = set(self._active) | self._rejected | self._rerun_requested
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return sorted(unfinished)
+
+
+def save_pending_refreshes(db: Session, user_ids: Iterable[int]) -> None:
+    """Persist match refreshes left unfinished at shutdown; users deleted meanwhile are skipped."""
+    user_ids = list(user_ids)
+    if user_ids:
+        db.execute(
+            insert(PendingMatchRefresh).from_select(
+                ["user_id"], select(User.id).where(User.id.in_(user_ids))
+            ).on_conflict_do_nothing()
+        )
+        db.commit()
+
+
+def claim_pending_refreshes(db: Session) -> List[int]:
+    """Remove and return every saved match refresh, for this worker to enqueue."""
+    user_ids = db.execute(delete(PendingMatchRefresh).returning(PendingMatchRefresh.user_id)).scalars().all()
+    db.commit()
+    return list(user_ids)
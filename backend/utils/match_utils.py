@@ -1,9 +1,126 @@
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from models import User, RoommateMatch, MatchStatus, UserPreferences
+from sqlalchemy import and_, or_, func, case, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import User, RoommateMatch, MatchStatus, UserPreferences, UserFeatures
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence, Set, Tuple
+import numpy as np
 from .cache_utils import cached_compatibility_score
+from .batch_scoring import batch_compatibility_scores, top_k_order
+from .feature_store import FEATURE_COLUMNS, feature_batch_from_rows, load_user_features
+from .candidate_pool import get_candidate_pools
+
+def canonical_pair(user_a: int, user_b: int) -> Tuple[int, int]:
+    """Return the (user1_id, user2_id) order under which a pair's match row is stored."""
+    return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+
+def match_side(user_id: int, other_id: int) -> Tuple[str, str]:
+    """Return the column prefixes ("user1"/"user2") for user_id and other_id in their match row."""
+    return ("user1", "user2") if user_id < other_id else ("user2", "user1")
+
+def get_match(db: Session, user_a: int, user_b: int, for_update: bool = False) -> Optional[RoommateMatch]:
+    """Fetch the match row for a pair of users with a single unique-index lookup."""
+    user1_id, user2_id = canonical_pair(user_a, user_b)
+    query = db.query(RoommateMatch).filter(
+        RoommateMatch.user1_id == user1_id,
+        RoommateMatch.user2_id == user2_id
+    )
+    if for_update:
+        query = query.with_for_update()
+    return query.first()
+
+def _split_by_side(user_id: int, other_ids):
+    """Group other_ids by which side of their match row user_id is on, as (side, other_side, ids)."""
+    lower = [other_id for other_id in other_ids if other_id > user_id]
+    higher = [other_id for other_id in other_ids if other_id < user_id]
+    return [
+        (side, other_side, ids)
+        for (side, other_side), ids in ((("user1", "user2"), lower), (("user2", "user1"), higher))
+        if ids
+    ]
+
+def upsert_like(db: Session, user_id: int, other_id: int, compatibility_score: float) -> bool:
+    """
+    Record that user_id liked other_id in a single race-safe statement.
+
+    Creates the pair's row if needed; otherwise sets this side's like and
+    promotes the row to matched when the other side has already liked.
+    Concurrent likes from both users serialize on the row lock, so the
+    second one always sees the first.
+
+    Returns:
+        True if the pair is now a mutual match
+    """
+    return other_id in upsert_likes(db, user_id, {other_id: compatibility_score})
+
+def upsert_likes(db: Session, user_id: int, scores: Dict[int, float]) -> Set[int]:
+    """
+    Record likes from user_id on every user in scores ({other_id: score})
+    with one statement per side of the match row. Same semantics as
+    upsert_like; each other_id may appear only once.
+
+    Returns:
+        The other IDs whose pair is now a mutual match
+    """
+    table = RoommateMatch.__table__
+    matched = set()
+
+    for side, other_side, other_ids in _split_by_side(user_id, scores):
+        stmt = pg_insert(RoommateMatch).values([
+            {
+                "user1_id": min(user_id, other_id),
+                "user2_id": max(user_id, other_id),
+                "compatibility_score": scores[other_id],
+                "match_status": MatchStatus.pending,
+                f"{side}_liked": True
+            }
+            for other_id in other_ids
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[RoommateMatch.user1_id, RoommateMatch.user2_id],
+            set_={
+                f"{side}_liked": True,
+                f"{side}_rejected": False,
+                "match_status": case(
+                    (table.c[f"{other_side}_liked"] == True, literal(MatchStatus.matched, table.c.match_status.type)),
+                    else_=table.c.match_status
+                )
+            }
+        ).returning(table.c[f"{other_side}_id"], RoommateMatch.match_status)
+
+        for other_id, match_status in db.execute(stmt):
+            if match_status == MatchStatus.matched:
+                matched.add(other_id)
+
+    return matched
+
+def upsert_rejection(db: Session, user_id: int, other_id: int) -> None:
+    """Record that user_id rejected other_id in a single race-safe statement."""
+    upsert_rejections(db, user_id, [other_id])
+
+def upsert_rejections(db: Session, user_id: int, other_ids: Sequence[int]) -> None:
+    """Record rejections from user_id of every user in other_ids, one statement per side."""
+    for side, _, ids in _split_by_side(user_id, other_ids):
+        stmt = pg_insert(RoommateMatch).values([
+            {
+                "user1_id": min(user_id, other_id),
+                "user2_id": max(user_id, other_id),
+                "compatibility_score": 0,
+                "match_status": MatchStatus.rejected,
+                "rejected_at": func.now(),  # Set the rejection timestamp for the cooldown period
+                f"{side}_rejected": True
+            }
+            for other_id in ids
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[RoommateMatch.user1_id, RoommateMatch.user2_id],
+            set_={
+                "match_status": MatchStatus.rejected,
+                "rejected_at": func.now(),
+                f"{side}_rejected": True
+            }
+        ))
 
 @cached_compatibility_score
 def compute_compatibility_score(user1: User, user2: User) -> float:
@@ -143,7 +260,27 @@ def compute_compatibility_score(user1: User, user2: User) -> float:
     else:
         return 50.0  # Default midpoint score if no factors could be compared
 
-def update_matches(current_user_id: int, db: Session) -> list:
+# Rows per bulk upsert statement in update_matches
+MATCH_WRITE_CHUNK_SIZE = 1000
+
+def update_matches(current_user_id: int, db: Session, limit: Optional[int] = None) -> list:
+    """
+    Recompute the stored compatibility scores between a user and every
+    same-gender candidate at their university.
+
+    Candidates are scored in one vectorized pass from their precomputed
+    feature rows, and all scores are written with chunked
+    INSERT ... ON CONFLICT DO UPDATE statements keyed on the canonical
+    user pair, so the number of queries does not grow with the number
+    of candidates.
+
+    Args:
+        limit: Return only the top limit candidates (all of them if None)
+
+    Returns:
+        List of {"id", "compatibility_score"} dicts, highest score first
+        (ties by user ID)
+    """
     current_user = db.query(User).filter(User.id == current_user_id).first()
     if not current_user:
         raise HTTPException(
@@ -151,90 +288,61 @@ def update_matches(current_user_id: int, db: Session) -> list:
             detail="Current user not found"
         )
     
-    # Get potential roommates, filtering for same gender as per user's requirement
-    potential_users = db.query(User).filter(
-        User.id != current_user_id,
-        User.university == current_user.university,
-        User.gender == current_user.gender  # Same gender filter
-    ).all()
-
-    results = []
-    for other in potential_users:
-        # Compute compatibility score between current user and candidate.
-        score = compute_compatibility_score(current_user, other)
-        
-        # Check if a match record already exists between the current user and this candidate.
-        existing_match = db.query(RoommateMatch).filter(
-            or_(
-                and_(RoommateMatch.user1_id == current_user_id, RoommateMatch.user2_id == other.id),
-                and_(RoommateMatch.user1_id == other.id, RoommateMatch.user2_id == current_user_id)
-            )
-        ).first()
-        
-        if existing_match:
-            # Update the score.
-            existing_match.compatibility_score = score
-        else:
-            # Create a new match record.
-            new_match = RoommateMatch(
-                user1_id=current_user_id,
-                user2_id=other.id,
-                compatibility_score=score,
-                match_status=MatchStatus.pending
-            )
-            db.add(new_match)
-        
-        # Build a dictionary of the candidate's data to return.
-        results.append({
-            "id": other.id,
-            "fullname": other.fullname,
-            "age": other.age,
-            "gender": other.gender.value if hasattr(other, "gender") and other.gender else None,
-            "university": other.university,
-            "major": other.major,
-            "year_of_study": other.year_of_study,
-            "bio": other.bio,
-            "profile_picture": other.profile_picture,
-            "compatibility_score": score,
-            "cleanliness_level": other.cleanliness_level,
-            "guest_policy": other.guest_policy,
-            "room_type_preference": other.room_type_preference,
-            "religious_preference": other.religious_preference,
-            "dietary_restrictions": other.dietary_restrictions,
-            "sleep_time": other.sleep_time.strftime("%H:%M") if other.sleep_time else None,
-            "wake_time": other.wake_time.strftime("%H:%M") if other.wake_time else None
-        })
+    current = load_user_features(db, current_user)
     
+    # Get potential roommates, filtering for same gender as per user's requirement.
+    # The in-memory candidate pools hold exactly these rows when running.
+    pools = get_candidate_pools()
+    if pools is not None:
+        candidates = pools.candidates(current["gender"], current_user.university)
+        candidates = candidates.take(candidates.ids != current_user_id)
+    else:
+        candidate_rows = db.query(*FEATURE_COLUMNS).join(
+            User, User.id == UserFeatures.user_id
+        ).filter(
+            User.id != current_user_id,
+            User.university == current_user.university,
+            User.gender == current_user.gender  # Same gender filter
+        ).all()
+        candidates = feature_batch_from_rows(candidate_rows)
+
+    scores = batch_compatibility_scores(current, candidates)
+
+    # Upsert every score keyed on the canonical pair; rows whose score did
+    # not change are left untouched by the WHERE clause. Row dicts are
+    # built one chunk at a time.
+    user1_ids = np.minimum(candidates.ids, current_user_id).tolist()
+    user2_ids = np.maximum(candidates.ids, current_user_id).tolist()
+    score_list = scores.tolist()
+    for start in range(0, len(score_list), MATCH_WRITE_CHUNK_SIZE):
+        end = start + MATCH_WRITE_CHUNK_SIZE
+        stmt = pg_insert(RoommateMatch).values([
+            {
+                "user1_id": user1_id,
+                "user2_id": user2_id,
+                "compatibility_score": score,
+                "match_status": MatchStatus.pending
+            }
+            for user1_id, user2_id, score in zip(user1_ids[start:end], user2_ids[start:end], score_list[start:end])
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[RoommateMatch.user1_id, RoommateMatch.user2_id],
+            set_={"compatibility_score": stmt.excluded.compatibility_score},
+            where=RoommateMatch.compatibility_score != stmt.excluded.compatibility_score
+        ))
+
     db.commit()
     
-    # Sort by compatibility score
-    results.sort(key=lambda x: x["compatibility_score"], reverse=True)
-    return results
+    # Select the top candidates without sorting the rest; result dicts are
+    # only built for those
+    order = top_k_order(candidates.ids, scores, len(scores) if limit is None else limit)
+    return [
+        {"id": candidate_id, "compatibility_score": score}
+        for candidate_id, score in zip(candidates.ids[order].tolist(), scores[order].tolist())
+    ]
 
-def update_user_preferences(user_id: int, swiped_user_id: int, liked: bool, db: Session):
-    """
-    Update a user's preferences based on swiping behavior.
-    
-    Args:
-        user_id: The ID of the user doing the swiping
-        swiped_user_id: The ID of the user being swiped on
-        liked: Whether the swipe was a like (True) or dislike (False)
-        db: Database session
-    """
-    # Get the users
-    user = db.query(User).filter(User.id == user_id).first()
-    swiped_user = db.query(User).filter(User.id == swiped_user_id).first()
-    
-    if not user or not swiped_user:
-        return
-    
-    # Get or create user preferences
-    user_prefs = db.query(UserPreferences).filter(UserPreferences.user_id == user_id).first()
-    if not user_prefs:
-        user_prefs = UserPreferences(user_id=user_id)
-        db.add(user_prefs)
-        db.commit()
-    
+def learn_from_swipe(user_prefs: UserPreferences, swiped_user: User, liked: bool) -> None:
+    """Apply the preference learning rule for one swipe to a loaded preferences row."""
     # Define weight change based on like/dislike
     # Likes influence preferences more than dislikes
     weight_change = 0.05 if liked else -0.03
@@ -244,57 +352,19 @@ def update_user_preferences(user_id: int, swiped_user_id: int, liked: bool, db:
         new_pref = user_prefs.preferred_cleanliness + (swiped_user.cleanliness_level - user_prefs.preferred_cleanliness) * weight_change
         user_prefs.preferred_cleanliness = max(1, min(10, new_pref))  # Keep within 1-10 range
     
-    # Update guest policy weights if available
-    if swiped_user.guest_policy:
-        # Initialize if not exists
-        if not user_prefs.guest_policy_weights:
-            user_prefs.guest_policy_weights = {}
+    # Categorical preference weights: likes increase, dislikes decrease.
+    # Each JSON dict is copied and reassigned so the change is flushed.
+    for value, attribute in (
+        (swiped_user.guest_policy, "guest_policy_weights"),
+        (swiped_user.room_type_preference, "room_type_weights"),
+        (swiped_user.religious_preference, "religious_weights"),
+        (swiped_user.dietary_restrictions, "dietary_weights"),
+    ):
+        if not value:
+            continue
+        weights = dict(getattr(user_prefs, attribute) or {})
         
         # Get current weight or default to 0.5
-        current_weight = user_prefs.guest_policy_weights.get(swiped_user.guest_policy, 0.5)
-        
-        # Update weight (likes increase, dislikes decrease)
-        new_weight = current_weight + weight_change
-        user_prefs.guest_policy_weights[swiped_user.guest_policy] = max(0.1, min(1.0, new_weight))
-    
-    # Update room type weights if available
-    if swiped_user.room_type_preference:
-        # Initialize if not exists
-        if not user_prefs.room_type_weights:
-            user_prefs.room_type_weights = {}
-        
-        # Get current weight or default to 0.5
-        current_weight = user_prefs.room_type_weights.get(swiped_user.room_type_preference, 0.5)
-        
-        # Update weight
-        new_weight = current_weight + weight_change
-        user_prefs.room_type_weights[swiped_user.room_type_preference] = max(0.1, min(1.0, new_weight))
-    
-    # Update religious preference weights if available
-    if swiped_user.religious_preference:
-        # Initialize if not exists
-        if not user_prefs.religious_weights:
-            user_prefs.religious_weights = {}
-        
-        # Get current weight or default to 0.5
-        current_weight = user_prefs.religious_weights.get(swiped_user.religious_preference, 0.5)
-        
-        # Update weight
-        new_weight = current_weight + weight_change
-        user_prefs.religious_weights[swiped_user.religious_preference] = max(0.1, min(1.0, new_weight))
-    
-    # Update dietary restriction weights if available
-    if swiped_user.dietary_restrictions:
-        # Initialize if not exists
-        if not user_prefs.dietary_weights:
-            user_prefs.dietary_weights = {}
-        
-        # Get current weight or default to 0.5
-        current_weight = user_prefs.dietary_weights.get(swiped_user.dietary_restrictions, 0.5)
-        
-        # Update weight
-        new_weight = current_weight + weight_change
-        user_prefs.dietary_weights[swiped_user.dietary_restrictions] = max(0.1, min(1.0, new_weight))
-    
-    # Commit the changes
-    db.commit()
+        current_weight = weights.get(value, 0.5)
+        weights[value] = max(0.1, min(1.0, current_weight + weight_change))
+        setattr(user_prefs, attribute, weights)
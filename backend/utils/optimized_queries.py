@@ -1,28 +1,120 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, text
-from models import User, RoommateMatch, MatchStatus, UserPreferences
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, func, text, case, desc, exists, select
+from starlette.concurrency import run_in_threadpool
+from db import SessionLocal
+from models import User, RoommateMatch, MatchStatus, UserPreferences, UserFeatures, UserFeedState
 from utils.match_utils import compute_compatibility_score
-from datetime import timedelta
-from typing import List, Dict, Any
+from utils.batch_scoring import batch_compatibility_scores, top_k_order
+from utils.feature_store import FEATURE_COLUMNS, feature_batch_from_rows, load_user_features
+from utils.cache_invalidation import SCORING_COLUMNS
+from utils.sql_scoring import sql_compatibility_score
+from utils.candidate_pool import get_candidate_pools
+from utils.exclusion_cache import get_exclusion_set, load_exclusion_set
+from utils.personalization import get_preference_weights, get_preference_weights_many, viewers_personalization
+from utils.serializers import CARD_FIELDS, FEED_FIELD_CHOICES, MATCH_FIELD_CHOICES, MATCH_FIELDS, PREFERENCE_FIELDS, PROFILE_FIELD_CHOICES, PROFILE_FIELDS, match_card, roommate_card, select_fields, user_profile
+from utils.feed_store import FEED_MAX_AGE, FEED_SIZE, get_feed_state, get_feed_state_async, read_feed, read_feed_async, replace_candidate_entries, replace_user_feed
+from datetime import datetime, timedelta
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
+import base64
 import logging
+import math
+import os
+import struct
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
-def get_potential_roommates_optimized(
+# Scorer used when a feed has to be ranked live: "python" (numpy over the
+# loaded feature rows) or "sql" (ranked and limited inside Postgres)
+SCORING_ENGINES = ("python", "sql")
+FEED_SCORING_ENGINE = os.getenv("FEED_SCORING_ENGINE", "python")
+# Rank feeds with each viewer's learned importance and category weights
+# (see utils/personalization.py) instead of the shared compatibility score
+FEED_PERSONALIZATION = os.getenv("FEED_PERSONALIZATION", "0") == "1"
+# Match changes are stamped before their transaction commits; a delta sync
+# re-reads this many seconds before the client's watermark so a change
+# committed after the previous sync's read is never missed
+MATCHES_SYNC_OVERLAP = timedelta(seconds=float(os.getenv("MATCHES_SYNC_OVERLAP", "60")))
+
+# Feed order: compatibility score descending, then user ID ascending.
+# The user ID tie-break makes the order total, so a (score, user_id)
+# cursor identifies exactly where the previous page stopped.
+_FEED_CURSOR_FORMAT = ">dq"
+
+def encode_feed_cursor(score: float, user_id: int) -> str:
+    """Encode the last (score, user_id) of a page as an opaque cursor string."""
+    packed = struct.pack(_FEED_CURSOR_FORMAT, score, user_id)
+    return base64.urlsafe_b64encode(packed).decode("ascii").rstrip("=")
+
+def decode_feed_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a cursor produced by encode_feed_cursor. Raises ValueError if malformed."""
+    try:
+        packed = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, user_id = struct.unpack(_FEED_CURSOR_FORMAT, packed)
+    except (ValueError, struct.error):
+        raise ValueError("Invalid cursor")
+    if not math.isfinite(score):
+        raise ValueError("Invalid cursor")
+    return score, user_id
+
+def _exclusion_rules(current_user_id: int, other_id, cooldown_date):
+    """
+    Condition on a RoommateMatch row between the current user and other_id
+    (a column or expression) under which other_id is left out of the feed.
+    """
+    return and_(
+        # Predicate of idx_match_exclusion, so lookups are index-only scans
+        # that skip the untouched pending rows written by update_matches
+        or_(
+            RoommateMatch.match_status != MatchStatus.pending,
+            RoommateMatch.user1_liked == True,
+            RoommateMatch.user2_liked == True
+        ),
+        or_(
+            # Rejected users in cooldown period
+            and_(
+                RoommateMatch.match_status == MatchStatus.rejected,
+                RoommateMatch.rejected_at > cooldown_date
+            ),
+            # Already matched users
+            RoommateMatch.match_status == MatchStatus.matched,
+            # Users already liked by current user (but not those who liked current user)
+            and_(
+                RoommateMatch.match_status == MatchStatus.pending,
+                or_(
+                    and_(
+                        other_id > current_user_id,  # Current user is user1
+                        RoommateMatch.user1_liked == True,
+                        RoommateMatch.user2_liked == False  # Exclude if they also liked you
+                    ),
+                    and_(
+                        other_id < current_user_id,  # Current user is user2
+                        RoommateMatch.user2_liked == True,
+                        RoommateMatch.user1_liked == False
+                    )
+                )
+            )
+        )
+    )
+
+def _feed_candidate_filter(
     current_user_id: int,
-    offset: int = 0,
-    limit: int = 10,
-    db: Session = None
-) -> List[Dict[str, Any]]:
+    db: Session,
+    exclude: bool = True
+) -> Optional[Tuple[User, list]]:
     """
-    Optimized version of get_potential_roommates that uses a single query
-    with proper joins to eliminate N+1 query problems.
+    Work out which users are eligible for the user's feed. With exclude
+    False, the swipe exclusions are left for the caller to apply.
+
+    Returns:
+        (current user, filter conditions on User), or None if the user does not exist
     """
     
     # Get current user with a single query
     current_user = db.query(User).filter(User.id == current_user_id).first()
     if not current_user:
-        return []
+        return None
     
     # Ensure user preferences exist
     user_prefs = db.query(UserPreferences).filter(UserPreferences.user_id == current_user_id).first()
@@ -35,245 +127,731 @@ def get_potential_roommates_optimized(
     cooldown_days = user_prefs.rejection_cooldown
     cooldown_date = func.now() - timedelta(days=cooldown_days)
     
-    # Single optimized query to get all excluded user IDs
-    excluded_users_query = db.query(
-        func.coalesce(
-            func.case(
-                (RoommateMatch.user1_id == current_user_id, RoommateMatch.user2_id),
-                else_=RoommateMatch.user1_id
-            ),
-            0
-        ).label('excluded_user_id')
-    ).filter(
-        or_(
-            # Rejected users in cooldown period
-            and_(
-                or_(
-                    RoommateMatch.user1_id == current_user_id,
-                    RoommateMatch.user2_id == current_user_id
-                ),
-                RoommateMatch.match_status == MatchStatus.rejected,
-                RoommateMatch.rejected_at > cooldown_date
-            ),
-            # Already matched users
-            and_(
-                or_(
-                    RoommateMatch.user1_id == current_user_id,
-                    RoommateMatch.user2_id == current_user_id
-                ),
-                RoommateMatch.match_status == MatchStatus.matched
-            ),
-            # Users already liked by current user (but not those who liked current user)
-            and_(
-                RoommateMatch.user1_id == current_user_id,
-                RoommateMatch.user1_liked == True,
-                RoommateMatch.match_status == MatchStatus.pending,
-                RoommateMatch.user2_liked == False  # Exclude if they also liked you
+    # Exclusion as a correlated anti-join against the candidate's canonical
+    # pair row, evaluated in the candidate query itself
+    excluded = exists().where(
+        RoommateMatch.user1_id == func.least(current_user_id, User.id),
+        RoommateMatch.user2_id == func.greatest(current_user_id, User.id),
+        _exclusion_rules(current_user_id, User.id, cooldown_date)
+    )
+    
+    conditions = [
+        User.id != current_user_id,
+        User.gender == current_user.gender
+    ]
+    if exclude:
+        conditions.append(~excluded)
+    return current_user, conditions
+
+def _score_feed_candidates(
+    current_user_id: int,
+    db: Session,
+    fresh_exclusions: bool = False
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Score every candidate that is eligible for the user's feed in Python.
+    With fresh_exclusions, swiped users are read from roommate_matches
+    rather than this worker's exclusion cache.
+
+    Returns:
+        (candidate IDs, compatibility scores) arrays, or None if the user does not exist
+    """
+    # Swiped users are filtered in memory against the cached exclusion set
+    # instead of an anti-join against roommate_matches
+    if fresh_exclusions:
+        exclusion_set = load_exclusion_set(db, current_user_id)
+    else:
+        exclusion_set = get_exclusion_set(db, current_user_id)
+    
+    # With this worker's candidate pools running, no user rows are read:
+    # only the viewer's own feature row
+    pools = get_candidate_pools()
+    if pools is not None:
+        current_row = db.query(*FEATURE_COLUMNS).filter(UserFeatures.user_id == current_user_id).first()
+        if current_row is not None:
+            current = feature_batch_from_rows([current_row]).row(0)
+            candidates = pools.candidates(current["gender"], any_university=True)
+            candidates = candidates.take(
+                (candidates.ids != current_user_id) & ~exclusion_set.excludes(candidates.ids)
+            )
+            logger.info(f"Found {len(candidates)} potential matches in the candidate pools")
+            return candidates.ids, batch_compatibility_scores(
+                current, candidates, _personalization(current_user_id, candidates, db)
             )
-        )
-    ).subquery()
     
-    # Get excluded user IDs
-    excluded_user_ids = [row.excluded_user_id for row in db.query(excluded_users_query).all()]
+    eligible = _feed_candidate_filter(current_user_id, db, exclude=False)
+    if eligible is None:
+        return None
+    current_user, conditions = eligible
     
-    # Main query to get potential matches with a single database hit
-    # This query uses proper indexing and LIMIT for pagination
-    potential_matches = db.query(User).filter(
-        User.id != current_user_id,
-        User.gender == current_user.gender,
-        ~User.id.in_(excluded_user_ids) if excluded_user_ids else True
-    ).limit(limit * 3).all()  # Get 3x the limit to account for compatibility filtering
-    
-    logger.info(f"Found {len(potential_matches)} potential matches after filtering")
-    
-    # Calculate compatibility scores and build results
-    results = []
-    for user in potential_matches:
-        if user:
-            try:
-                compatibility_score = compute_compatibility_score(current_user, user)
-                
-                results.append({
-                    "id": user.id,
-                    "fullname": user.fullname,
-                    "age": user.age,
-                    "gender": user.gender.value if user.gender else None,
-                    "university": user.university,
-                    "major": user.major,
-                    "year_of_study": user.year_of_study,
-                    "bio": user.bio,
-                    "profile_picture": user.profile_picture,
-                    "compatibility_score": compatibility_score,
-                    "budget_range": user.budget_range,
-                    "cleanliness_level": user.cleanliness_level,
-                    "social_preference": user.social_preference.value if user.social_preference else None,
-                    "smoking_preference": user.smoking_preference,
-                    "drinking_preference": user.drinking_preference,
-                    "pet_preference": user.pet_preference,
-                    "music_preference": user.music_preference,
-                    "guest_policy": user.guest_policy,
-                    "room_type_preference": user.room_type_preference,
-                    "religious_preference": user.religious_preference,
-                    "dietary_restrictions": user.dietary_restrictions,
-                    "sleep_time": user.sleep_time.strftime("%H:%M") if user.sleep_time else None,
-                    "wake_time": user.wake_time.strftime("%H:%M") if user.wake_time else None
-                })
-            except Exception as e:
-                logger.error(f"Error calculating compatibility for user {user.id}: {e}")
-                continue
-    
-    # Sort by compatibility score (highest first)
-    results.sort(key=lambda x: x["compatibility_score"], reverse=True)
-    
-    # Apply pagination
-    paginated_results = results[offset:offset + limit]
+    # Main query to get potential matches with a single database hit.
+    # Only the precomputed feature rows are loaded here, not full User objects.
+    candidate_rows = db.query(*FEATURE_COLUMNS).join(
+        User, User.id == UserFeatures.user_id
+    ).filter(*conditions).all()
+    
+    candidates = feature_batch_from_rows(candidate_rows)
+    candidates = candidates.take(~exclusion_set.excludes(candidates.ids))
+    logger.info(f"Found {len(candidates)} potential matches after filtering")
+    
+    # Score every candidate in one vectorized pass
+    scores = batch_compatibility_scores(
+        load_user_features(db, current_user), candidates, _personalization(current_user_id, candidates, db)
+    )
+    return candidates.ids, scores
+
+def _personalization(current_user_id: int, candidates, db: Session):
+    """The viewer's preference weights lined up with candidates, if personalization is on."""
+    if not FEED_PERSONALIZATION:
+        return None
+    return get_preference_weights(db, current_user_id).for_candidates(candidates)
+
+def _resolve_engine(engine: Optional[str]) -> str:
+    """Return the scoring engine to use, defaulting to FEED_SCORING_ENGINE."""
+    engine = engine or FEED_SCORING_ENGINE
+    if engine not in SCORING_ENGINES:
+        raise ValueError(f"Unknown scoring engine: {engine}")
+    return engine
+
+def _rank_feed_candidates(
+    current_user_id: int,
+    db: Session,
+    limit: int,
+    offset: int = 0,
+    after: Optional[Tuple[float, int]] = None,
+    engine: Optional[str] = None,
+    fresh_exclusions: bool = False
+) -> Optional[List[Tuple[int, float]]]:
+    """
+    Rank the user's eligible candidates live and return one page of
+    (candidate_id, score) in feed order, starting at offset or strictly
+    after the (score, user_id) in after.
+
+    With engine="sql" the score is computed, ordered and limited inside
+    Postgres and only the page crosses the wire; with engine="python"
+    every candidate's feature row is loaded and scored with numpy.
+    fresh_exclusions is passed on to _score_feed_candidates; the SQL
+    engine always reads exclusions from roommate_matches.
+
+    Returns:
+        The page, or None if the user does not exist
+    """
+    if _resolve_engine(engine) == "python":
+        scored = _score_feed_candidates(current_user_id, db, fresh_exclusions)
+        if scored is None:
+            return None
+        ids, scores = scored
+        
+        # Keep only the candidates that sort after the cursor
+        if after is not None:
+            after_score, after_id = after
+            remaining = (scores < after_score) | ((scores == after_score) & (ids > after_id))
+            ids, scores = ids[remaining], scores[remaining]
+        
+        # Only the first offset + limit candidates are ever put in order
+        page = top_k_order(ids, scores, offset + limit)[offset:]
+        return list(zip(ids[page].tolist(), scores[page].tolist()))
+    
+    eligible = _feed_candidate_filter(current_user_id, db)
+    if eligible is None:
+        return None
+    current_user, conditions = eligible
+    
+    score = sql_compatibility_score(
+        load_user_features(db, current_user),
+        get_preference_weights(db, current_user_id) if FEED_PERSONALIZATION else None
+    )
+    query = db.query(
+        UserFeatures.user_id, score.label("compatibility_score")
+    ).join(
+        User, User.id == UserFeatures.user_id
+    ).filter(*conditions)
+    
+    if after is not None:
+        after_score, after_id = after
+        query = query.filter(or_(
+            score < after_score,
+            and_(score == after_score, UserFeatures.user_id > after_id)
+        ))
+    
+    rows = query.order_by(
+        desc("compatibility_score"), UserFeatures.user_id
+    ).offset(offset).limit(limit).all()
+    return [(row.user_id, row.compatibility_score) for row in rows]
+
+def _build_feed_page(
+    page_ids: List[int],
+    page_scores: List[float],
+    db: Session,
+    fields: Tuple[str, ...] = CARD_FIELDS
+) -> List[Dict[str, Any]]:
+    """
+    Hydrate the users on a feed page into response dicts, in page order,
+    loading only the columns of the card fields.
+    """
+    # Hydrate only the users that made it onto the page
+    users = db.query(User).options(_card_load_only(fields)).filter(User.id.in_(page_ids)).all()
+    users_by_id = {user.id: user for user in users}
+    return _feed_page_dicts(users_by_id, page_ids, page_scores, fields)
+
+async def _build_feed_page_async(
+    page_ids: List[int],
+    page_scores: List[float],
+    db: AsyncSession,
+    fields: Tuple[str, ...] = CARD_FIELDS
+) -> List[Dict[str, Any]]:
+    """_build_feed_page on an async session."""
+    result = await db.execute(select(User).options(_card_load_only(fields)).where(User.id.in_(page_ids)))
+    users_by_id = {user.id: user for user in result.scalars()}
+    return _feed_page_dicts(users_by_id, page_ids, page_scores, fields)
+
+def _feed_page_dicts(
+    users_by_id: Dict[int, User],
+    page_ids: List[int],
+    page_scores: List[float],
+    fields: Tuple[str, ...]
+) -> List[Dict[str, Any]]:
+    """Response dicts for the hydrated users of a feed page, in page order."""
+    return [
+        roommate_card(users_by_id[user_id], compatibility_score, fields)
+        for user_id, compatibility_score in zip(page_ids, page_scores)
+        if user_id in users_by_id
+    ]
+
+def _card_load_only(fields: Tuple[str, ...]):
+    """Loader option for the User columns behind the given card fields."""
+    return load_only(*(getattr(User, field) for field in fields))
+
+def _feed_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Card fields for a feed request's fields= parameter. The score is
+    always returned, so it is not one of the card's User columns.
+
+    Raises:
+        ValueError: If a requested field is unknown
+    """
+    selected = select_fields(fields, FEED_FIELD_CHOICES, CARD_FIELDS)
+    return tuple(field for field in selected if field != "compatibility_score")
+
+def get_potential_roommates_optimized(
+    current_user_id: int,
+    offset: int = 0,
+    limit: int = 10,
+    db: Session = None,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Optimized version of get_potential_roommates that uses a single query
+    with proper joins to eliminate N+1 query problems.
+
+    Offset pages are cut from the full feed order; prefer
+    get_potential_roommates_page for infinite scrolling. engine picks the
+    scorer ("python" or "sql") for any live ranking the request needs.
+    fields is a comma-separated subset of the card fields to return (id
+    and compatibility_score are always included); only their columns are
+    loaded.
+
+    Raises:
+        ValueError: If the engine or a requested field is unknown
+    """
+    engine = _resolve_engine(engine)
+    card_fields = _feed_fields(fields)
+    state = _ensure_user_feed(current_user_id, db, engine)
+    if state is None:
+        return []
+    
+    # Serve from the stored feed while the requested range lies inside it
+    entries = read_feed(db, current_user_id, limit=limit, offset=offset)
+    if len(entries) < limit and state.cutoff_score is not None:
+        # Past the end of a truncated feed: rank the candidates live
+        entries = _rank_feed_candidates(current_user_id, db, limit, offset=offset, engine=engine)
+    
+    page_ids = [candidate_id for candidate_id, _ in entries]
+    page_scores = [score for _, score in entries]
+    paginated_results = _build_feed_page(page_ids, page_scores, db, card_fields)
+    
+    logger.info(f"Returning {len(paginated_results)} results for offset {offset}, limit {limit}")
+    return paginated_results
+
+def get_potential_roommates_page(
+    current_user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = 10,
+    db: Session = None,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Keyset-paginated feed of potential roommates.
+
+    Pages follow one global order (score descending, user ID ascending).
+    The cursor encodes the last (score, user_id) served, and the next page
+    starts strictly after it, so pages never overlap or skip candidates.
+    Pages inside the stored feed are an indexed range read; pages past
+    the end of a truncated feed are ranked live. fields selects the card
+    fields as in get_potential_roommates_optimized.
+
+    Raises:
+        ValueError: If the cursor is malformed, or the engine or a
+            requested field is unknown
+
+    Returns:
+        {"results": [...], "next_cursor": str or None}
+    """
+    after = decode_feed_cursor(cursor) if cursor else None
+    engine = _resolve_engine(engine)
+    card_fields = _feed_fields(fields)
+    
+    state = _ensure_user_feed(current_user_id, db, engine)
+    if state is None:
+        return {"results": [], "next_cursor": None}
+    
+    # One extra entry tells whether another page follows
+    entries = read_feed(db, current_user_id, limit=limit + 1, after=after)
+    if len(entries) <= limit and state.cutoff_score is not None:
+        entries = _rank_feed_candidates(current_user_id, db, limit + 1, after=after, engine=engine)
+    
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    page_ids = [candidate_id for candidate_id, _ in entries]
+    page_scores = [score for _, score in entries]
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_feed_cursor(page_scores[-1], page_ids[-1])
+    
+    results = _build_feed_page(page_ids, page_scores, db, card_fields)
+    logger.info(f"Returning {len(results)} results after cursor {cursor!r}, limit {limit}")
+    return {"results": results, "next_cursor": next_cursor}
+
+def _in_sync_session(fn: Callable[[Session], Any]) -> Any:
+    with SessionLocal() as session:
+        return fn(session)
+
+async def _run_sync_off_loop(fn: Callable[[Session], Any]) -> Any:
+    """
+    Run sync feed code (numpy ranking, feed rebuilds) on the threadpool
+    with its own sync session. AsyncSession.run_sync would run it on the
+    event loop thread and stall every other request of the worker.
+    """
+    return await run_in_threadpool(_in_sync_session, fn)
+
+async def get_potential_roommates_optimized_async(
+    current_user_id: int,
+    offset: int = 0,
+    limit: int = 10,
+    db: AsyncSession = None,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    get_potential_roommates_optimized on an async session. Stored feed
+    pages are read and hydrated with async queries; building the feed and
+    live ranking reuse the sync code on the threadpool (_run_sync_off_loop).
+
+    Raises:
+        ValueError: If the engine or a requested field is unknown
+    """
+    engine = _resolve_engine(engine)
+    card_fields = _feed_fields(fields)
+    state = await _ensure_user_feed_async(current_user_id, db, engine)
+    if state is None:
+        return []
+    
+    entries = await read_feed_async(db, current_user_id, limit=limit, offset=offset)
+    if len(entries) < limit and state.cutoff_score is not None:
+        entries = await _run_sync_off_loop(
+            lambda session: _rank_feed_candidates(current_user_id, session, limit, offset=offset, engine=engine)
+        )
+    
+    page_ids = [candidate_id for candidate_id, _ in entries]
+    page_scores = [score for _, score in entries]
+    paginated_results = await _build_feed_page_async(page_ids, page_scores, db, card_fields)
     
     logger.info(f"Returning {len(paginated_results)} results for offset {offset}, limit {limit}")
     return paginated_results
 
+async def get_potential_roommates_page_async(
+    current_user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = 10,
+    db: AsyncSession = None,
+    engine: Optional[str] = None,
+    fields: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    get_potential_roommates_page on an async session, with the same
+    split between async queries and threadpool work as
+    get_potential_roommates_optimized_async.
+
+    Raises:
+        ValueError: If the cursor is malformed, or the engine or a
+            requested field is unknown
+
+    Returns:
+        {"results": [...], "next_cursor": str or None}
+    """
+    after = decode_feed_cursor(cursor) if cursor else None
+    engine = _resolve_engine(engine)
+    card_fields = _feed_fields(fields)
+    
+    state = await _ensure_user_feed_async(current_user_id, db, engine)
+    if state is None:
+        return {"results": [], "next_cursor": None}
+    
+    entries = await read_feed_async(db, current_user_id, limit=limit + 1, after=after)
+    if len(entries) <= limit and state.cutoff_score is not None:
+        entries = await _run_sync_off_loop(
+            lambda session: _rank_feed_candidates(current_user_id, session, limit + 1, after=after, engine=engine)
+        )
+    
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    page_ids = [candidate_id for candidate_id, _ in entries]
+    page_scores = [score for _, score in entries]
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_feed_cursor(page_scores[-1], page_ids[-1])
+    
+    results = await _build_feed_page_async(page_ids, page_scores, db, card_fields)
+    logger.info(f"Returning {len(results)} results after cursor {cursor!r}, limit {limit}")
+    return {"results": results, "next_cursor": next_cursor}
+
+def _ensure_user_feed(
+    current_user_id: int,
+    db: Session,
+    engine: Optional[str] = None
+) -> Optional[UserFeedState]:
+    """
+    Build the user's stored feed if it is missing or older than FEED_MAX_AGE.
+    Returns the feed state, or None if the user does not exist.
+    """
+    state = get_feed_state(db, current_user_id, max_age=FEED_MAX_AGE)
+    if state is None and rebuild_user_feed(current_user_id, db, engine):
+        state = get_feed_state(db, current_user_id)
+    return state
+
+async def _ensure_user_feed_async(
+    current_user_id: int,
+    db: AsyncSession,
+    engine: Optional[str] = None
+) -> Optional[UserFeedState]:
+    """_ensure_user_feed on an async session."""
+    state = await get_feed_state_async(db, current_user_id, max_age=FEED_MAX_AGE)
+    if state is None and await _run_sync_off_loop(lambda session: rebuild_user_feed(current_user_id, session, engine)):
+        state = await get_feed_state_async(db, current_user_id)
+    return state
+
+def rebuild_user_feed(user_id: int, db: Session, engine: Optional[str] = None) -> bool:
+    """
+    Rank every eligible candidate for a user and store the top of the
+    ranking as their feed. Run after the user's own scoring columns,
+    preferences or exclusions change.
+
+    Returns:
+        False if the user does not exist
+    """
+    # One entry past the feed size tells replace_user_feed where to cut.
+    # The feed outlives the exclusion cache's TTL, so exclusions are read
+    # fresh: swipes another worker handled must not be stored back in it
+    entries = _rank_feed_candidates(user_id, db, FEED_SIZE + 1, engine=engine, fresh_exclusions=True)
+    if entries is None:
+        return False
+    ids = np.array([candidate_id for candidate_id, _ in entries], dtype=np.int64)
+    scores = np.array([score for _, score in entries], dtype=np.float64)
+    replace_user_feed(db, user_id, ids, scores)
+    db.commit()
+    return True
+
+def refresh_candidate_in_feeds(candidate_id: int, db: Session) -> int:
+    """
+    Re-place a candidate in every stored feed after their scoring columns
+    changed.
+
+    The candidate is scored against every viewer of the same gender that
+    has a stored feed in one vectorized pass (the compatibility factors are
+    symmetric; personalized weights are applied per viewer row), and
+    the candidate's entries are rewritten: a feed gets the candidate when
+    it is eligible for that viewer and scores above the feed's cutoff.
+
+    Returns:
+        Number of feeds that now contain the candidate
+    """
+    candidate = db.query(User).filter(User.id == candidate_id).first()
+    if not candidate:
+        replace_candidate_entries(db, candidate_id, {})
+        db.commit()
+        return 0
+    
+    viewer_rows = db.query(*FEATURE_COLUMNS, UserFeedState.cutoff_score).join(
+        User, User.id == UserFeatures.user_id
+    ).join(
+        UserFeedState, UserFeedState.user_id == UserFeatures.user_id
+    ).filter(
+        User.id != candidate_id,
+        User.gender == candidate.gender
+    ).all()
+    
+    viewers = feature_batch_from_rows([row[:-1] for row in viewer_rows])
+    candidate_features = load_user_features(db, candidate)
+    personalization = None
+    if FEED_PERSONALIZATION:
+        # Each viewer ranks with their own weights: row i is scored with
+        # viewer i's personalization
+        weights = get_preference_weights_many(db, viewers.ids.tolist())
+        personalization = viewers_personalization(
+            [weights[viewer_id] for viewer_id in viewers.ids.tolist()], candidate_features
+        )
+    scores = batch_compatibility_scores(candidate_features, viewers, personalization)
+    # A feed without a cutoff holds every eligible candidate
+    cutoffs = np.array(
+        [-np.inf if row[-1] is None else row[-1] for row in viewer_rows], dtype=np.float64
+    )
+    keep = scores > cutoffs
+    excluded = _viewers_excluding(candidate_id, db)
+    entries = {
+        viewer_id: score
+        for viewer_id, score in zip(viewers.ids[keep].tolist(), scores[keep].tolist())
+        if viewer_id not in excluded
+    }
+    
+    replace_candidate_entries(db, candidate_id, entries)
+    db.commit()
+    logger.info(f"Candidate {candidate_id} placed in {len(entries)} of {len(viewer_rows)} stored feeds")
+    return len(entries)
+
+def _viewers_excluding(candidate_id: int, db: Session) -> Set[int]:
+    """
+    Users whose feed must not show candidate_id, by the same rules as the
+    exclusion query in _feed_candidate_filter.
+    """
+    # The viewer's own cooldown applies, as in their live exclusion query
+    in_cooldown = RoommateMatch.rejected_at > func.now() - func.make_interval(
+        0, 0, 0, func.coalesce(UserPreferences.rejection_cooldown, 30)
+    )
+    match_rows = db.query(RoommateMatch, in_cooldown.label("in_cooldown")).outerjoin(
+        UserPreferences,
+        UserPreferences.user_id == case(
+            (RoommateMatch.user1_id == candidate_id, RoommateMatch.user2_id),
+            else_=RoommateMatch.user1_id
+        )
+    ).filter(
+        or_(RoommateMatch.user1_id == candidate_id, RoommateMatch.user2_id == candidate_id),
+        RoommateMatch.match_status.in_([MatchStatus.rejected, MatchStatus.matched, MatchStatus.pending])
+    ).all()
+    
+    excluded = set()
+    for match, in_cooldown in match_rows:
+        viewer_is_user1 = match.user2_id == candidate_id
+        viewer_id = match.user1_id if viewer_is_user1 else match.user2_id
+        viewer_liked = match.user1_liked if viewer_is_user1 else match.user2_liked
+        candidate_liked = match.user2_liked if viewer_is_user1 else match.user1_liked
+        
+        if match.match_status == MatchStatus.matched:
+            excluded.add(viewer_id)
+        elif match.match_status == MatchStatus.rejected:
+            if in_cooldown:
+                excluded.add(viewer_id)
+        elif viewer_liked and not candidate_liked:
+            excluded.add(viewer_id)
+    return excluded
+
 
 def get_matches_optimized(
     current_user_id: int,
     include_preferences: bool = False,
-    db: Session = None
+    db: Session = None,
+    fields: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
     Optimized version of get_matches that uses a single query with joins.
+
+    fields is a comma-separated subset of the match fields to return (id
+    is always included); only their columns are selected. Without it,
+    include_preferences adds the preference fields to the defaults.
+
+    Raises:
+        ValueError: If a requested field is unknown
     """
+    match_fields = _match_fields(fields, include_preferences)
     
     # Single query to get all matches with user data
-    matches_query = db.query(
-        RoommateMatch,
+    rows = db.execute(_matches_query(current_user_id, match_fields)).all()
+    return _match_dicts(rows, match_fields)
+
+
+async def get_matches_optimized_async(
+    current_user_id: int,
+    include_preferences: bool = False,
+    db: AsyncSession = None,
+    fields: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    get_matches_optimized on an async session.
+
+    Raises:
+        ValueError: If a requested field is unknown
+    """
+    match_fields = _match_fields(fields, include_preferences)
+    rows = (await db.execute(_matches_query(current_user_id, match_fields))).all()
+    return _match_dicts(rows, match_fields)
+
+
+# Match fields read from the match row rather than the other user
+_MATCH_ROW_FIELDS = ("compatibility_score", "created_at", "match_status")
+
+
+def _match_fields(fields: Optional[str], include_preferences: bool) -> Tuple[str, ...]:
+    default = MATCH_FIELDS + PREFERENCE_FIELDS if include_preferences else MATCH_FIELDS
+    return select_fields(fields, MATCH_FIELD_CHOICES, default)
+
+
+def _matches_query(current_user_id: int, fields: Tuple[str, ...], changed_after: Optional[datetime] = None):
+    """
+    The user's mutual matches, or with changed_after every pair that
+    entered, changed as or left a mutual match since then, flagged by an
+    is_matched column.
+    """
+    columns = [
+        getattr(RoommateMatch, field).label(field) if field in _MATCH_ROW_FIELDS else getattr(User, field)
+        for field in fields if field != "id"
+    ]
+    query = select(
         User.id.label('other_user_id'),
-        User.fullname,
-        User.age,
-        User.gender,
-        User.major,
-        User.year_of_study,
-        User.bio,
-        User.profile_picture,
-        User.university,
-        User.instagram,
-        User.budget_range,
-        User.cleanliness_level,
-        User.social_preference,
-        User.smoking_preference,
-        User.drinking_preference,
-        User.pet_preference,
-        User.music_preference,
-        User.guest_policy,
-        User.room_type_preference,
-        User.religious_preference,
-        User.dietary_restrictions,
-        User.sleep_time,
-        User.wake_time
+        *columns
     ).join(
-        User,
+        RoommateMatch,
         or_(
             and_(RoommateMatch.user1_id == current_user_id, RoommateMatch.user2_id == User.id),
             and_(RoommateMatch.user2_id == current_user_id, RoommateMatch.user1_id == User.id)
         )
-    ).filter(
-        RoommateMatch.match_status == MatchStatus.matched
-    ).all()
+    )
+    if changed_after is None:
+        return query.where(RoommateMatch.match_status == MatchStatus.matched)
+    return query.add_columns(
+        (RoommateMatch.match_status == MatchStatus.matched).label('is_matched')
+    ).where(
+        RoommateMatch.updated_at > changed_after
+    )
+
+
+def _match_dicts(rows, fields: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    return [match_card(row, fields) for row in rows]
+
+
+def get_match_changes(
+    current_user_id: int,
+    since: Optional[str] = None,
+    include_preferences: bool = False,
+    db: Session = None,
+    fields: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Delta sync of the user's match list.
+
+    Without since, every current match is returned. With the watermark of
+    a previous sync, only matches made or changed after it (including
+    matched users' profile edits) are returned, and the IDs of users
+    unmatched since then are listed in removed. Changes shortly before the
+    watermark may be sent again; apply them idempotently. Pass the returned
+    watermark as since on the next sync. fields and include_preferences
+    select the match fields as in get_matches_optimized.
+
+    Raises:
+        ValueError: If since is not a watermark or a requested field is unknown
+
+    Returns:
+        {"matches": [...], "removed": [user IDs], "watermark": str}
+    """
+    changed_after = _decode_match_watermark(since) if since else None
+    match_fields = _match_fields(fields, include_preferences)
     
-    response = []
-    for row in matches_query:
-        match = row.RoommateMatch
-        user_data = {
-            "id": row.other_user_id,
-            "fullname": row.fullname,
-            "age": row.age,
-            "gender": row.gender.value if row.gender else None,
-            "major": row.major,
-            "year_of_study": row.year_of_study,
-            "bio": row.bio,
-            "profile_picture": row.profile_picture,
-            "compatibility_score": match.compatibility_score,
-            "university": row.university,
-            "instagram": row.instagram,
-            "created_at": match.created_at.isoformat() if match.created_at else None,
-            "match_status": match.match_status.value
-        }
-        
-        if include_preferences:
-            preference_data = {
-                "budget_range": row.budget_range,
-                "cleanliness_level": row.cleanliness_level,
-                "social_preference": row.social_preference.value if row.social_preference else None,
-                "smoking_preference": row.smoking_preference,
-                "drinking_preference": row.drinking_preference,
-                "pet_preference": row.pet_preference,
-                "music_preference": row.music_preference,
-                "guest_policy": row.guest_policy,
-                "room_type_preference": row.room_type_preference,
-                "religious_preference": row.religious_preference,
-                "dietary_restrictions": row.dietary_restrictions,
-                "sleep_time": row.sleep_time.strftime("%H:%M") if row.sleep_time else None,
-                "wake_time": row.wake_time.strftime("%H:%M") if row.wake_time else None
-            }
-            user_data.update(preference_data)
-        
-        response.append(user_data)
+    # Taken before the read, so nothing committed after it is skipped next time
+    watermark = db.execute(select(func.localtimestamp())).scalar()
+    rows = db.execute(_matches_query(current_user_id, match_fields, changed_after)).all()
+    return _match_changes(rows, match_fields, changed_after, watermark)
+
+
+async def get_match_changes_async(
+    current_user_id: int,
+    since: Optional[str] = None,
+    include_preferences: bool = False,
+    db: AsyncSession = None,
+    fields: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    get_match_changes on an async session.
+
+    Raises:
+        ValueError: If since is not a watermark or a requested field is unknown
+    """
+    changed_after = _decode_match_watermark(since) if since else None
+    match_fields = _match_fields(fields, include_preferences)
     
-    return response
+    watermark = (await db.execute(select(func.localtimestamp()))).scalar()
+    rows = (await db.execute(_matches_query(current_user_id, match_fields, changed_after))).all()
+    return _match_changes(rows, match_fields, changed_after, watermark)
+
+
+def _decode_match_watermark(since: str) -> datetime:
+    """Parse a watermark returned by get_match_changes, minus the overlap."""
+    try:
+        return datetime.fromisoformat(since) - MATCHES_SYNC_OVERLAP
+    except (ValueError, OverflowError):
+        raise ValueError("Invalid watermark")
+
+
+def _match_changes(rows, fields: Tuple[str, ...], changed_after: Optional[datetime], watermark: datetime) -> Dict[str, Any]:
+    if changed_after is None:
+        matches, removed = _match_dicts(rows, fields), []
+    else:
+        matches = _match_dicts([row for row in rows if row.is_matched], fields)
+        removed = [row.other_user_id for row in rows if not row.is_matched]
+    return {"matches": matches, "removed": removed, "watermark": watermark.isoformat()}
 
 
 def get_user_profile_optimized(
     user_id: int,
     current_user_id: int = None,
     include_preferences: bool = False,
-    db: Session = None
+    db: Session = None,
+    fields: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Optimized version of get_user_profile that uses a single query.
+
+    fields is a comma-separated subset of the profile fields to return (id
+    is always included); only their columns are loaded. Without it,
+    include_preferences adds the preference fields and the viewer's
+    compatibility score to the defaults.
+
+    Raises:
+        ValueError: If a requested field is unknown
     """
+    default = PROFILE_FIELD_CHOICES if include_preferences else PROFILE_FIELDS
+    profile_fields = select_fields(fields, PROFILE_FIELD_CHOICES, default)
+    
+    # Calculate compatibility score if this is not the current user
+    with_score = "compatibility_score" in profile_fields and user_id != current_user_id and current_user_id
+    columns = {field for field in profile_fields if field != "compatibility_score"}
+    if with_score:
+        columns |= SCORING_COLUMNS
     
     # Single query to get user data
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User).options(
+        load_only(*(getattr(User, column) for column in columns))
+    ).filter(User.id == user_id).first()
     if not user:
         return None
     
-    user_data = {
-        "id": user.id,
-        "fullname": user.fullname,
-        "profile_picture": user.profile_picture,
-        "instagram": user.instagram,
-        "university": user.university,
-        "age": user.age,
-        "gender": user.gender.value if user.gender else None,
-        "major": user.major,
-        "year_of_study": user.year_of_study,
-        "bio": user.bio
-    }
-    
-    if include_preferences:
-        # Calculate compatibility score if this is not the current user
-        compatibility_score = None
-        if user_id != current_user_id and current_user_id:
-            current_user = db.query(User).filter(User.id == current_user_id).first()
-            if current_user:
-                compatibility_score = compute_compatibility_score(current_user, user)
-        
-        preference_data = {
-            "budget_range": user.budget_range,
-            "cleanliness_level": user.cleanliness_level,
-            "social_preference": user.social_preference.value if user.social_preference else None,
-            "smoking_preference": user.smoking_preference,
-            "drinking_preference": user.drinking_preference,
-            "pet_preference": user.pet_preference,
-            "music_preference": user.music_preference,
-            "guest_policy": user.guest_policy,
-            "room_type_preference": user.room_type_preference,
-            "religious_preference": user.religious_preference,
-            "dietary_restrictions": user.dietary_restrictions,
-            "sleep_time": user.sleep_time.strftime("%H:%M") if user.sleep_time else None,
-            "wake_time": user.wake_time.strftime("%H:%M") if user.wake_time else None
-        }
-        
-        if compatibility_score is not None:
-            preference_data["compatibility_score"] = compatibility_score
-            
-        user_data.update(preference_data)
+    compatibility_score = None
+    if with_score:
+        current_user = db.query(User).options(
+            load_only(*(getattr(User, column) for column in SCORING_COLUMNS))
+        ).filter(User.id == current_user_id).first()
+        if current_user:
+            compatibility_score = compute_compatibility_score(current_user, user)
     
-    return user_data
+    return user_profile(user, profile_fields, compatibility_score)
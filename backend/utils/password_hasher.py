@@ -0,0 +1,222 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import os
+import threading
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from .auth_utils import hash_password, verify_password, verify_and_update_password
+
+logger = logging.getLogger(__name__)
+
+# Hashing runs in worker processes so it never holds the GIL of the
+# request threads. Requests beyond workers + queue depth are turned away
+# instead of queueing behind a burst of logins.
+_password_hash_workers = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+_password_hash_queue_depth = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "32"))
+_password_hash_timeout = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+
+class PasswordHashingUnavailable(Exception):
+    """The hashing pool is saturated, broken or did not answer in time; retry later."""
+
+
+class PasswordHasher:
+    """
+    Bounded process pool for password hashing and verification.
+
+    At most workers + queue_depth operations are in flight; submitting more
+    raises PasswordHashingUnavailable right away. A caller that waits longer
+    than timeout also gets PasswordHashingUnavailable, while the operation
+    keeps its slot until the worker finishes it. If a worker dies, the
+    operations it broke fail with PasswordHashingUnavailable and the pool
+    is replaced.
+
+    The *_async methods wait on the event loop instead of a thread, so
+    async endpoints can wait for hashes without holding threadpool threads.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, timeout: float):
+        self._workers = workers
+        self._capacity = workers + queue_depth
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor = self._create_executor()
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Spawned workers do not inherit this process's threads or locks
+        return ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _release(self, future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _replace_executor(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not broken:
+                return  # Already replaced by another caller
+            logger.error("Password hashing pool broke, restarting it")
+            self._executor = self._create_executor()
+        broken.shutdown(wait=False)
+
+    def _submit(self, fn: Callable, *args) -> Tuple[ProcessPoolExecutor, Future]:
+        with self._lock:
+            if self._in_flight >= self._capacity:
+                self.rejected += 1
+                raise PasswordHashingUnavailable("Password hashing queue is full")
+            self._in_flight += 1
+
+        executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died; replace the pool and try once more
+            self._replace_executor(executor)
+            executor = self._executor
+            try:
+                future = executor.submit(fn, *args)
+            except Exception:
+                self._release(None)
+                raise
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return executor, future
+
+    def _timed_out(self) -> PasswordHashingUnavailable:
+        with self._lock:
+            self.timed_out += 1
+        return PasswordHashingUnavailable("Password hashing timed out")
+
+    def _broke(self, executor: ProcessPoolExecutor) -> PasswordHashingUnavailable:
+        self._replace_executor(executor)
+        return PasswordHashingUnavailable("Password hashing pool broke")
+
+    def _call(self, fn: Callable, *args) -> Any:
+        executor, future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            raise self._timed_out()
+        except BrokenProcessPool:
+            raise self._broke(executor)
+
+    async def _call_async(self, fn: Callable, *args) -> Any:
+        executor, future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self._timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out()
+        except BrokenProcessPool:
+            raise self._broke(executor)
+
+    def hash(self, password: str) -> str:
+        return self._call(hash_password, password)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self._call(verify_password, password, hashed_password)
+
+    def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return self._call(verify_and_update_password, password, hashed_password)
+
+    async def hash_async(self, password: str) -> str:
+        return await self._call_async(hash_password, password)
+
+    async def verify_and_update_async(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._call_async(verify_and_update_password, password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "capacity": self._capacity,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+_password_hasher: Optional[PasswordHasher] = None
+
+
+def start_password_hasher() -> PasswordHasher:
+    """Create this worker's password hashing pool."""
+    global _password_hasher
+    if _password_hasher is None:
+        _password_hasher = PasswordHasher(
+            workers=_password_hash_workers,
+            queue_depth=_password_hash_queue_depth,
+            timeout=_password_hash_timeout
+        )
+    return _password_hasher
+
+
+def stop_password_hasher() -> None:
+    global _password_hasher
+    if _password_hasher is not None:
+        _password_hasher.shutdown()
+        _password_hasher = None
+
+
+def hash_password_offloaded(password: str) -> str:
+    """
+    hash_password in the hashing pool, or inline if the pool is not running.
+
+    Raises:
+        PasswordHashingUnavailable: If the pool is saturated or times out
+    """
+    hasher = _password_hasher
+    return hasher.hash(password) if hasher is not None else hash_password(password)
+
+
+def verify_password_offloaded(password: str, hashed_password: str) -> bool:
+    """
+    verify_password in the hashing pool, or inline if the pool is not running.
+
+    Raises:
+        PasswordHashingUnavailable: If the pool is saturated or times out
+    """
+    hasher = _password_hasher
+    if hasher is None:
+        return verify_password(password, hashed_password)
+    return hasher.verify(password, hashed_password)
+
+
+def verify_and_update_password_offloaded(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    verify_and_update_password in the hashing pool, or inline if the pool
+    is not running.
+
+    Raises:
+        PasswordHashingUnavailable: If the pool is saturated or times out
+    """
+    hasher = _password_hasher
+    if hasher is None:
+        return verify_and_update_password(password, hashed_password)
+    return hasher.verify_and_update(password, hashed_password)
+
+
+async def hash_password_offloaded_async(password: str) -> str:
+    """hash_password_offloaded for async endpoints; the pool is awaited, not waited on in a thread."""
+    hasher = _password_hasher
+    if hasher is None:
+        return await run_in_threadpool(hash_password, password)
+    return await hasher.hash_async(password)
+
+
+async def verify_and_update_password_offloaded_async(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password_offloaded for async endpoints."""
+    hasher = _password_hasher
+    if hasher is None:
+        return await run_in_threadpool(verify_and_update_password, password, hashed_password)
+    return await hasher.verify_and_update_async(password, hashed_password)
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import UserPreferences
+from .batch_scoring import AFFINITY_FACTORS, IMPORTANCE_FACTORS, FeatureBatch, Personalization, category_code
+from .feature_store import ensure_category_codes
+
+logger = logging.getLogger(__name__)
+
+# Preferences change only through swipes (folded in by the aggregator) and
+# settings edits; commits in this worker invalidate immediately, the TTL
+# bounds staleness from other workers
+_preference_cache_ttl = float(os.getenv("PREFERENCE_CACHE_TTL", "300"))
+_preference_cache_max_entries = int(os.getenv("PREFERENCE_CACHE_SIZE", "10000"))
+
+_IMPORTANCE_NAMES = sorted(set(IMPORTANCE_FACTORS.values()))
+# Importance at its column default leaves a factor's weight unchanged
+_IMPORTANCE_DEFAULTS = {
+    name: UserPreferences.__table__.c[f"{name}_importance"].default.arg
+    for name in _IMPORTANCE_NAMES
+}
+_AFFINITY_NAMES = [name for name, _ in AFFINITY_FACTORS]
+
+_SESSION_INFO_KEY = "preferences_changed_user_ids"
+
+
+class PreferenceWeights:
+    """
+    One viewer's personalization, decoded from their user_preferences row.
+
+    multipliers holds importance / default importance per importance name,
+    so an untouched row scores exactly like unpersonalized scoring.
+    affinities holds the learned category weights keyed by category code.
+    """
+
+    __slots__ = ("multipliers", "affinities", "loaded_at")
+
+    def __init__(self, multipliers: Dict[str, float], affinities: Dict[str, Dict[int, float]], loaded_at: float = 0.0):
+        self.multipliers = multipliers
+        self.affinities = affinities
+        self.loaded_at = loaded_at
+
+    @classmethod
+    def from_preferences(cls, user_prefs: Optional[UserPreferences], loaded_at: float = 0.0) -> "PreferenceWeights":
+        if user_prefs is None:
+            return cls({}, {}, loaded_at)
+
+        multipliers = {}
+        for name in _IMPORTANCE_NAMES:
+            importance = getattr(user_prefs, f"{name}_importance")
+            default = _IMPORTANCE_DEFAULTS[name]
+            if importance is not None and importance != default:
+                multipliers[name] = importance / default
+
+        affinities = {}
+        for name in _AFFINITY_NAMES:
+            learned = {
+                category_code(value): float(weight)
+                for value, weight in (getattr(user_prefs, f"{name}_weights") or {}).items()
+                if value and weight is not None
+            }
+            if learned:
+                affinities[name] = learned
+        return cls(multipliers, affinities, loaded_at)
+
+    def for_candidates(self, candidates: FeatureBatch) -> Personalization:
+        """Line these weights up with a batch of candidates."""
+        affinities = {}
+        for name, learned in self.affinities.items():
+            codes = np.fromiter(learned.keys(), dtype=np.int64, count=len(learned))
+            weights = np.fromiter(learned.values(), dtype=np.float64, count=len(learned))
+            order = np.argsort(codes)
+            codes, weights = codes[order], weights[order]
+
+            theirs = getattr(candidates, name)
+            positions = np.minimum(np.searchsorted(codes, theirs), len(codes) - 1)
+            affinities[name] = np.where(codes[positions] == theirs, weights[positions], np.nan)
+        return Personalization(dict(self.multipliers), affinities)
+
+
+def viewers_personalization(weights: List[PreferenceWeights], candidate: dict) -> Personalization:
+    """
+    Personalization for scoring one candidate against a batch of viewers:
+    row i uses viewer i's weights. Scores match scoring each viewer against
+    the candidate with their own for_candidates personalization.
+    """
+    multipliers = {
+        name: np.array([viewer.multipliers.get(name, 1.0) for viewer in weights], dtype=np.float64)
+        for name in _IMPORTANCE_NAMES
+        if any(name in viewer.multipliers for viewer in weights)
+    }
+    affinities = {}
+    for name in _AFFINITY_NAMES:
+        if any(name in viewer.affinities for viewer in weights):
+            affinities[name] = np.array([
+                viewer.affinities.get(name, {}).get(candidate[name], np.nan) for viewer in weights
+            ], dtype=np.float64)
+    return Personalization(multipliers, affinities)
+
+
+class PreferenceWeightsCache:
+    """LRU of per-viewer PreferenceWeights with a TTL, safe to share between threads."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._weights: "OrderedDict[int, PreferenceWeights]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, db: Session, user_ids: Iterable[int]) -> Dict[int, PreferenceWeights]:
+        """Return weights for every user, loading the missing ones in one query."""
+        now = time.time()
+        found = {}
+        missing = []
+        with self._lock:
+            for user_id in user_ids:
+                weights = self._weights.get(user_id)
+                if weights is not None and now - weights.loaded_at < self.ttl:
+                    self._weights.move_to_end(user_id)
+                    found[user_id] = weights
+                else:
+                    missing.append(user_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            rows = {
+                user_prefs.user_id: user_prefs
+                for user_prefs in db.query(UserPreferences).filter(UserPreferences.user_id.in_(missing)).all()
+            }
+            ensure_category_codes(db, (
+                value
+                for user_prefs in rows.values()
+                for name in _AFFINITY_NAMES
+                for value in (getattr(user_prefs, f"{name}_weights") or {})
+            ))
+            loaded = {
+                user_id: PreferenceWeights.from_preferences(rows.get(user_id), now)
+                for user_id in missing
+            }
+            found.update(loaded)
+            with self._lock:
+                self._weights.update(loaded)
+                while len(self._weights) > self.max_entries:
+                    self._weights.popitem(last=False)
+        return found
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                self._weights.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._weights.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._weights), "hits": self.hits, "misses": self.misses}
+
+
+preference_weights_cache = PreferenceWeightsCache(
+    max_entries=_preference_cache_max_entries, ttl=_preference_cache_ttl
+)
+
+
+def get_preference_weights(db: Session, user_id: int) -> PreferenceWeights:
+    """Return a viewer's cached preference weights."""
+    return preference_weights_cache.get_many(db, [user_id])[user_id]
+
+
+def get_preference_weights_many(db: Session, user_ids: Iterable[int]) -> Dict[int, PreferenceWeights]:
+    """Return cached preference weights for many viewers."""
+    return preference_weights_cache.get_many(db, user_ids)
+
+
+def _collect_changed_preferences(session, flush_context) -> None:
+    changed: Set[int] = {
+        obj.user_id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, UserPreferences)
+    }
+    if changed:
+        session.info.setdefault(_SESSION_INFO_KEY, set()).update(changed)
+
+
+def _invalidate_after_commit(session) -> None:
+    user_ids = session.info.pop(_SESSION_INFO_KEY, None)
+    if user_ids:
+        preference_weights_cache.invalidate(user_ids)
+
+
+def _discard_after_rollback(session) -> None:
+    session.info.pop(_SESSION_INFO_KEY, None)
+
+
+def install_preference_invalidation(session_factory) -> None:
+    """
+    Drop cached preference weights when a session created by
+    session_factory commits a change to user_preferences rows.
+    """
+    if not event.contains(session_factory, "after_flush", _collect_changed_preferences):
+        event.listen(session_factory, "after_flush", _collect_changed_preferences)
+        event.listen(session_factory, "after_commit", _invalidate_after_commit)
+        event.listen(session_factory, "after_rollback", _discard_after_rollback)
@@ -0,0 +1,199 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+from collections import defaultdict
+import os
+import threading
+import time
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.dialects.postgresql import insert
+
+from models import User, UserPreferences, SwipeEvent
+from .match_utils import learn_from_swipe
+
+logger = logging.getLogger(__name__)
+
+# Pending swipes are folded into user_preferences every interval, or
+# sooner once this worker has recorded threshold of them
+_aggregation_interval = float(os.getenv("SWIPE_AGGREGATION_INTERVAL", "30"))
+_aggregation_threshold = int(os.getenv("SWIPE_AGGREGATION_THRESHOLD", "500"))
+# Events claimed per aggregation transaction
+_aggregation_batch_size = 5000
+# Advisory lock key, so only one aggregator applies events at a time and
+# every user's swipes are applied in order
+_AGGREGATION_LOCK_KEY = 0x5377_6970  # "Swip"
+
+
+def record_swipe_events(db: Session, user_id: int, swipes: Iterable[Tuple[int, bool]]) -> int:
+    """
+    Append (swiped_user_id, liked) swipes to the event log in one insert.
+    The caller is responsible for committing.
+
+    Returns:
+        The number of events recorded
+    """
+    rows = [
+        {"user_id": user_id, "swiped_user_id": swiped_user_id, "liked": liked}
+        for swiped_user_id, liked in swipes
+    ]
+    if rows:
+        db.execute(insert(SwipeEvent), rows)
+    return len(rows)
+
+
+def aggregate_swipe_events(db: Session, batch_size: int = _aggregation_batch_size) -> int:
+    """
+    Fold up to batch_size of the oldest swipe events into user_preferences
+    with learn_from_swipe, the preference learning rule, and delete them,
+    in one transaction. Each preferences row is written once per batch.
+
+    Returns:
+        The number of events applied (0 if another aggregator is running)
+    """
+    if not db.execute(select(func.pg_try_advisory_xact_lock(_AGGREGATION_LOCK_KEY))).scalar():
+        db.rollback()
+        return 0
+
+    claimed = select(SwipeEvent.id).order_by(SwipeEvent.id).limit(batch_size).scalar_subquery()
+    events = db.execute(
+        SwipeEvent.__table__.delete().where(SwipeEvent.id.in_(claimed)).returning(
+            SwipeEvent.id, SwipeEvent.user_id, SwipeEvent.swiped_user_id, SwipeEvent.liked
+        )
+    ).all()
+    if not events:
+        db.rollback()
+        return 0
+    events.sort(key=lambda event: event.id)
+
+    swipes_by_user = defaultdict(list)
+    for event in events:
+        swipes_by_user[event.user_id].append((event.swiped_user_id, event.liked))
+
+    # The swiped users' learned columns and every affected preferences row,
+    # one query each
+    swiped_users = {
+        user.id: user
+        for user in db.query(User).options(load_only(
+            User.cleanliness_level, User.guest_policy, User.room_type_preference,
+            User.religious_preference, User.dietary_restrictions
+        )).filter(User.id.in_({event.swiped_user_id for event in events})).all()
+    }
+    preferences = {
+        user_prefs.user_id: user_prefs
+        for user_prefs in db.query(UserPreferences).filter(
+            UserPreferences.user_id.in_(swipes_by_user)
+        ).with_for_update().all()
+    }
+
+    for user_id, swipes in swipes_by_user.items():
+        user_prefs = preferences.get(user_id)
+        if user_prefs is None:
+            user_prefs = UserPreferences(user_id=user_id)
+            db.add(user_prefs)
+            db.flush()
+        for swiped_user_id, liked in swipes:
+            swiped_user = swiped_users.get(swiped_user_id)
+            if swiped_user is not None:
+                learn_from_swipe(user_prefs, swiped_user, liked)
+
+    db.commit()
+    logger.info(f"Applied {len(events)} swipe events to {len(swipes_by_user)} users' preferences")
+    return len(events)
+
+
+class PreferenceAggregator:
+    """
+    Background thread that drains the swipe event log into user_preferences
+    every interval seconds, or as soon as threshold swipes were recorded
+    through this worker.
+    """
+
+    def __init__(self, session_factory, interval: float = _aggregation_interval, threshold: int = _aggregation_threshold):
+        self._session_factory = session_factory
+        self._interval = interval
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.applied = 0
+        self.last_run: Optional[float] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="preference-aggregator", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread after applying whatever is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def recorded(self, count: int) -> None:
+        """Note that count swipes were committed; wakes the thread past the threshold."""
+        with self._lock:
+            self._pending += count
+            if self._pending >= self._threshold:
+                self._wake.set()
+
+    def run_once(self) -> int:
+        """Drain the event log. Returns the number of events applied."""
+        with self._lock:
+            self._pending = 0
+        applied = 0
+        db = self._session_factory()
+        try:
+            while True:
+                count = aggregate_swipe_events(db)
+                applied += count
+                if count < _aggregation_batch_size:
+                    break
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Swipe aggregation failed: {e}")
+        finally:
+            db.close()
+        self.applied += applied
+        self.last_run = time.time()
+        return applied
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            self.run_once()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+        return {"pending": pending, "applied": self.applied, "last_run": self.last_run}
+
+
+_preference_aggregator: Optional[PreferenceAggregator] = None
+
+
+def start_preference_aggregator(session_factory) -> PreferenceAggregator:
+    """Create and start this worker's preference aggregator."""
+    global _preference_aggregator
+    if _preference_aggregator is None:
+        aggregator = PreferenceAggregator(session_factory)
+        aggregator.start()
+        _preference_aggregator = aggregator
+    return _preference_aggregator
+
+
+def stop_preference_aggregator() -> None:
+    global _preference_aggregator
+    if _preference_aggregator is not None:
+        _preference_aggregator.stop()
+        _preference_aggregator = None
+
+
+def swipes_recorded(count: int) -> None:
+    """Tell this worker's aggregator, if running, that count swipes were committed."""
+    aggregator = _preference_aggregator
+    if aggregator is not None:
+        aggregator.recorded(count)
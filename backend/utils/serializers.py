@@ -0,0 +1,124 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from datetime import datetime, time
+from enum import Enum
+
+from fastapi.responses import ORJSONResponse
+
+# Public profile fields shown to other users
+PROFILE_FIELDS = (
+    "id", "fullname", "profile_picture", "instagram", "university",
+    "age", "gender", "major", "year_of_study", "bio",
+)
+# Living-preference fields shown on cards and detailed profiles
+PREFERENCE_FIELDS = (
+    "budget_range", "cleanliness_level", "social_preference",
+    "smoking_preference", "drinking_preference", "pet_preference",
+    "music_preference", "guest_policy", "room_type_preference",
+    "religious_preference", "dietary_restrictions", "sleep_time", "wake_time",
+)
+# Fields only the user themselves sees; hashed_password is never serialized
+ACCOUNT_FIELDS = ("email", "snapchat", "phone_number", "onboarding_complete")
+
+# Field order of a feed card
+CARD_FIELDS = (
+    "id", "fullname", "age", "gender", "university", "major",
+    "year_of_study", "bio", "profile_picture",
+) + PREFERENCE_FIELDS
+# Field order of a matches entry; the last three are the match's own columns
+MATCH_FIELDS = (
+    "id", "fullname", "age", "gender", "major", "year_of_study", "bio",
+    "profile_picture", "university", "instagram",
+    "compatibility_score", "created_at", "match_status",
+)
+
+# Fields each endpoint accepts in fields=
+FEED_FIELD_CHOICES = CARD_FIELDS + ("compatibility_score",)
+MATCH_FIELD_CHOICES = MATCH_FIELDS + PREFERENCE_FIELDS
+PROFILE_FIELD_CHOICES = PROFILE_FIELDS + PREFERENCE_FIELDS + ("compatibility_score",)
+
+
+def _enum_value(value: Optional[Enum]) -> Optional[str]:
+    return value.value if value is not None else None
+
+
+def _clock_time(value: Optional[time]) -> Optional[str]:
+    return value.strftime("%H:%M") if value is not None else None
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+# Fields whose column values are not JSON-native, and how to render them
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "gender": _enum_value,
+    "social_preference": _enum_value,
+    "match_status": _enum_value,
+    "sleep_time": _clock_time,
+    "wake_time": _clock_time,
+    "created_at": _timestamp,
+}
+
+
+def select_fields(fields: Optional[str], choices: Tuple[str, ...], default: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Resolve a comma-separated fields= parameter against an endpoint's
+    choices, keeping their order. id is always included; no parameter
+    means the default fields.
+
+    Raises:
+        ValueError: If a requested field is not one of the choices
+    """
+    if not fields:
+        return default
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(choices)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in choices if field in requested or field == "id")
+
+
+def serialize_fields(obj: Any, fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Read fields from an ORM object or result row as JSON-native values."""
+    data = {}
+    for field in fields:
+        value = getattr(obj, field)
+        converter = _CONVERTERS.get(field)
+        data[field] = converter(value) if converter is not None else value
+    return data
+
+
+def roommate_card(user: Any, compatibility_score: float, fields: Tuple[str, ...] = CARD_FIELDS) -> Dict[str, Any]:
+    """A feed entry: a candidate's card with the viewer's compatibility score."""
+    card = serialize_fields(user, fields)
+    card["compatibility_score"] = compatibility_score
+    return card
+
+
+def match_card(row: Any, fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """A matches entry, from a row of the matches query selecting fields."""
+    card = {"id": row.other_user_id}
+    card.update(serialize_fields(row, fields[1:]))
+    return card
+
+
+def user_profile(user: Any, fields: Tuple[str, ...], compatibility_score: Optional[float] = None) -> Dict[str, Any]:
+    """Another user's profile as seen by the viewer."""
+    profile = serialize_fields(user, tuple(field for field in fields if field != "compatibility_score"))
+    if compatibility_score is not None:
+        profile["compatibility_score"] = compatibility_score
+    return profile
+
+
+def own_profile(user: Any) -> Dict[str, Any]:
+    """The signed-in user's own profile, without credentials."""
+    return serialize_fields(user, PROFILE_FIELDS + ACCOUNT_FIELDS + PREFERENCE_FIELDS)
+
+
+def json_response(content: Any) -> ORJSONResponse:
+    """
+    Render already-serialized content with orjson, skipping FastAPI's
+    jsonable_encoder and response-model validation. Declare the shape
+    with response_model on the route for the OpenAPI schema.
+    """
+    return ORJSONResponse(content)
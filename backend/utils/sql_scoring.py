@@ -0,0 +1,132 @@
+import math
+
+from sqlalchemy import case, cast, func, literal
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+
+from .batch_scoring import (
+    NULL_CODE, ANY_CODE, NONE_CODE,
+    GENDER_WEIGHT, CLEANLINESS_WEIGHT, SLEEP_WEIGHT, WAKE_WEIGHT, GUEST_POLICY_WEIGHT,
+    ROOM_TYPE_WEIGHT, ROOM_TYPE_ANY_WEIGHT, RELIGIOUS_WEIGHT, RELIGIOUS_NONE_WEIGHT,
+    DIETARY_WEIGHT, DIETARY_NONE_WEIGHT, AGE_WEIGHT, LIFESTYLE_WEIGHT, BUDGET_WEIGHT,
+    CLEANLINESS_MAX_DIFF, TIME_MAX_DIFF_MINUTES, AGE_MAX_DIFF, BUDGET_MAX_DIFF,
+    IMPORTANCE_FACTORS, AFFINITY_FACTORS,
+)
+from .feature_store import feature_present, feature_value
+
+
+def _float(value: float):
+    # psycopg2 inlines Python floats as untyped literals, which Postgres
+    # reads as NUMERIC; cast so all arithmetic stays in double precision
+    return cast(literal(float(value)), DOUBLE_PRECISION)
+
+
+def sql_compatibility_score(current: dict, preference_weights=None):
+    """
+    SQL expression scoring user_features rows against one user, for use
+    with ORDER BY / LIMIT inside Postgres.
+
+    Mirrors batch_compatibility_scores factor by factor and in the same
+    accumulation order, so Postgres' double precision arithmetic returns
+    exactly the same values as the Python scorers. Factors the current user
+    has no value for are left out of the expression entirely.
+
+    Args:
+        current: The viewer's features, as returned by FeatureBatch.row()
+        preference_weights: The viewer's PreferenceWeights for personalized
+            scoring (see utils/personalization.py), if any
+    """
+    score_terms = []
+    weight_terms = []
+
+    def scale(factor: str, weight: float) -> float:
+        if preference_weights is None:
+            return weight
+        importance = IMPORTANCE_FACTORS.get(factor)
+        if importance is None or importance not in preference_weights.multipliers:
+            return weight
+        return weight * preference_weights.multipliers[importance]
+
+    def add_code_factor(name: str, weight: float):
+        mine = current[name]
+        if mine == NULL_CODE:
+            return
+        present = feature_present(name)
+        weight = scale(name, weight)
+        score_terms.append(case((present & (feature_value(name) == mine), _float(weight)), else_=_float(0.0)))
+        weight_terms.append(case((present, _float(weight)), else_=_float(0.0)))
+
+    def add_numeric_factor(name: str, max_diff: float, weight: float):
+        mine = current[name]
+        if math.isnan(mine):
+            return
+        present = feature_present(name)
+        weight = scale(name, weight)
+        diff = func.abs(_float(mine) - feature_value(name))
+        factor_score = func.greatest(_float(0.0), _float(1.0) - diff / _float(max_diff))
+        score_terms.append(case((present, factor_score * _float(weight)), else_=_float(0.0)))
+        weight_terms.append(case((present, _float(weight)), else_=_float(0.0)))
+
+    def add_wildcard_factor(name: str, wildcard: int, weight: float, wildcard_weight: float):
+        mine = current[name]
+        if mine == NULL_CODE:
+            return
+        present = feature_present(name)
+        theirs = feature_value(name)
+        weight = scale(name, weight)
+        wildcard_weight = scale(name, wildcard_weight)
+        wild = present if mine == wildcard else present & (theirs == wildcard)
+        score_terms.append(case(
+            (wild, _float(wildcard_weight)),
+            (present & (theirs == mine), _float(weight)),
+            else_=_float(0.0)
+        ))
+        weight_terms.append(case(
+            (wild, _float(wildcard_weight)),
+            (present, _float(weight)),
+            else_=_float(0.0)
+        ))
+
+    add_code_factor("gender", GENDER_WEIGHT)
+    add_numeric_factor("cleanliness", CLEANLINESS_MAX_DIFF, CLEANLINESS_WEIGHT)
+    add_numeric_factor("sleep_minutes", TIME_MAX_DIFF_MINUTES, SLEEP_WEIGHT)
+    add_numeric_factor("wake_minutes", TIME_MAX_DIFF_MINUTES, WAKE_WEIGHT)
+    add_code_factor("guest_policy", GUEST_POLICY_WEIGHT)
+    add_wildcard_factor("room_type", ANY_CODE, ROOM_TYPE_WEIGHT, ROOM_TYPE_ANY_WEIGHT)
+    add_wildcard_factor("religious", NONE_CODE, RELIGIOUS_WEIGHT, RELIGIOUS_NONE_WEIGHT)
+    add_wildcard_factor("dietary", NONE_CODE, DIETARY_WEIGHT, DIETARY_NONE_WEIGHT)
+    add_numeric_factor("age", AGE_MAX_DIFF, AGE_WEIGHT)
+    add_code_factor("smoking", LIFESTYLE_WEIGHT)
+    add_code_factor("drinking", LIFESTYLE_WEIGHT)
+    add_code_factor("pet", LIFESTYLE_WEIGHT)
+    add_code_factor("music", LIFESTYLE_WEIGHT)
+    add_code_factor("social", LIFESTYLE_WEIGHT)
+    add_numeric_factor("budget", BUDGET_MAX_DIFF, BUDGET_WEIGHT)
+
+    if preference_weights is not None:
+        for name, base_weight in AFFINITY_FACTORS:
+            learned = preference_weights.affinities.get(name)
+            if not learned:
+                continue
+            weight = scale(name, base_weight)
+            present = feature_present(name)
+            theirs = feature_value(name)
+            score_terms.append(case(
+                *[(present & (theirs == code), _float(affinity * weight)) for code, affinity in learned.items()],
+                else_=_float(0.0)
+            ))
+            weight_terms.append(case((present & theirs.in_(list(learned)), _float(weight)), else_=_float(0.0)))
+
+    if not score_terms:
+        return _float(50.0)
+
+    # Left-associative sums, added in factor order like the Python scorers
+    score_sum = score_terms[0]
+    total_weight = weight_terms[0]
+    for score_term, weight_term in zip(score_terms[1:], weight_terms[1:]):
+        score_sum = score_sum + score_term
+        total_weight = total_weight + weight_term
+
+    return case(
+        (total_weight > 0, func.least(_float(1.0), score_sum / total_weight) * _float(100.0)),
+        else_=_float(50.0)
+    )